@@ -1,33 +1,120 @@
+import atexit
+import json
 import os
-import requests
 import random
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 
 from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.block_store import BlockStore
+from backend.blockchain.mining_service import MiningService, DONE
 from backend.wallet.wallet import Wallet
 from backend.wallet.transaction import Transaction
 from backend.wallet.transaction_pool import TransactionPool
-from backend.pubsub import PubSub
+from backend.pubsub import PubSub, TcpTransport
+from backend.sync import HttpPeer, synchronize
+from backend.util.async_server import AsyncServer
+from backend.util.merkle import merkle_proof
+from backend.config import HISTORY_PAGE_SIZE
 
 
+ROOT_PORT = 5000
+ROOT_URL = f'http://localhost:{ROOT_PORT}'
+
 app = Flask(__name__)
 CORS(app, resources={r'/*': {'origins': 'http://localhost:3000'}})
-blockchain = Blockchain()
+# BLOCK_STORE_DIR keeps the chain on disk, so a restart does not have to
+# download it from a peer again, nor replay it from the genesis block: the
+# state is restored from the latest snapshot kept next to the blocks.
+if os.environ.get('BLOCK_STORE_DIR'):
+    blockchain = Blockchain(BlockStore(os.environ['BLOCK_STORE_DIR']))
+    # The state as of the tip is snapshotted on shutdown.
+    atexit.register(blockchain.close)
+else:
+    blockchain = Blockchain()
 wallet = Wallet(blockchain)
 transaction_pool = TransactionPool()
-pubsub = PubSub(blockchain, transaction_pool)
+# TRANSPORT=tcp connects the nodes directly over a TCP mesh instead of the
+# PubNub service: the node listens on PUBSUB_PORT and publishes to PEERS, a
+# comma separated list of host:port addresses of the other nodes.
+if os.environ.get('TRANSPORT') == 'tcp':
+    transport = TcpTransport(
+        port=int(os.environ.get('PUBSUB_PORT', 0)),
+        peers=[peer for peer in os.environ.get('PEERS', '').split(',') if peer])
+    print(f'\n -- Listening for peers on port {transport.port}')
+else:
+    transport = None
+# A PEER node fetches the missing ancestors of a peer block from the root
+# node, headers first.
+if os.environ.get('PEER') == 'True':
+    sync_peer = HttpPeer(ROOT_URL)
+else:
+    sync_peer = None
+pubsub = PubSub(blockchain, transaction_pool, transport, sync_peer)
+miner = MiningService(blockchain, transaction_pool, wallet, pubsub)
+# A peer block makes the template being mined stale.
+pubsub.add_block_listener(miner.restart)
 
 @app.route('/')
 def index():
     ''' index/home endpoint for blockchain '''
     return 'Horray! Welcome to the blockchain!'
 
+def blockchain_etag():
+    ''' ETag of the chain views, which only change when the tip changes. '''
+    return blockchain.chain[-1].hash
+
+def json_response(value):
+    '''
+        Build a json response that keeps the key order of blocks and
+        transactions, which their hashes cover. jsonify sorts the keys.
+    '''
+    return Response(json.dumps(value), mimetype='application/json')
+
+def not_modified(etag):
+    '''
+        Return a 304 response when the client already holds the etag, so the
+        body is not built at all, or None.
+    '''
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def conditional_response(body, etag):
+    ''' Build a json response that answers If-None-Match with a 304. '''
+    response = Response(body, mimetype='application/json')
+    # Without this, computing the Content-Length would read a streamed body
+    # into memory before the response is sent.
+    response.implicit_sequence_conversion = False
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
 @app.route('/blockchain')
 def route_blockchain():
     ''' Endpoint for viewing the blockchain '''
-    return jsonify(blockchain.to_json())
+    with blockchain.lock:
+        length = len(blockchain.chain)
+        tip_hash = blockchain_etag()
+
+    def generate():
+        # Stream the chain one block at a time instead of building the
+        # whole json document in memory. The blocks up to the tip are
+        # unchanged as long as the tip is on the chain: a reorganization
+        # away from it aborts the stream rather than mixing two chains.
+        yield '['
+        for i in range(length):
+            with blockchain.lock:
+                if blockchain.heights.get(tip_hash) != length - 1:
+                    raise Exception('The chain was reorganized while streaming.')
+                block = blockchain.chain[i]
+            separator = ',' if i else ''
+            yield separator + json.dumps(block.to_json())
+        yield ']'
+
+    return conditional_response(generate(), tip_hash)
 
 @app.route('/blockchain/range')
 def route_blockchain_range():
@@ -35,9 +122,58 @@ def route_blockchain_range():
     # http://localhost:5000/blockchain/range?start=2&end=5
     start = int(request.args.get('start'))
     end = int(request.args.get('end'))
-    # blockchain.to_json()[::-1] reverses the list. [start:end] gets the
-    # blockchain from start to end on the reversed list.
-    return jsonify(blockchain.to_json()[::-1][start:end])
+    with blockchain.lock:
+        etag = blockchain_etag()
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        # Blocks from start to end of the reversed chain (newest first).
+        blocks = blockchain.reversed_range(start, end)
+    body = json.dumps([block.to_json() for block in blocks])
+    return conditional_response(body, etag)
+
+@app.route('/blockchain/headers')
+def route_blockchain_headers():
+    ''' Endpoint for the headers of the blocks from start to end '''
+    # http://localhost:5000/blockchain/headers?start=0&end=2000
+    start = int(request.args.get('start', 0))
+    end = int(request.args.get('end', len(blockchain.chain)))
+    headers = [block.header() for block in blockchain.chain[start:end]]
+    return jsonify(headers)
+
+@app.route('/blockchain/blocks')
+def route_blockchain_blocks():
+    ''' Endpoint for the blocks from start to end, oldest first '''
+    # http://localhost:5000/blockchain/blocks?start=0&end=100
+    start = int(request.args.get('start', 0))
+    end = int(request.args.get('end', len(blockchain.chain)))
+    return json_response([block.to_json() for block in blockchain.chain[start:end]])
+
+@app.route('/blockchain/proof/<tx_id>')
+def route_blockchain_proof(tx_id):
+    '''
+        Endpoint for the merkle inclusion proof of a transaction, which can be
+        checked against the merkle root of the block header.
+    '''
+    # The lookup and the block read must see the same chain.
+    with blockchain.lock:
+        location = blockchain.find_transaction(tx_id)
+        if location is not None:
+            height, position = location
+            block = blockchain.chain[height]
+    if location is None:
+        return jsonify({'error': f'Unknown transaction {tx_id}'}), 404
+    if block.merkle_root is None:
+        return jsonify({
+            'error': f'Block {block.hash} does not commit to a merkle root'
+        }), 409
+    return json_response({
+        'block_hash': block.hash,
+        'height': height,
+        'merkle_root': block.merkle_root,
+        'transaction': block.data[position],
+        'proof': merkle_proof(block.data, position)
+    })
 
 @app.route('/blockchain/length')
 def route_blockchain_length():
@@ -49,14 +185,41 @@ def route_blockchain_length():
 
 @app.route('/blockchain/mine')
 def route_blockchain_mine():
-    ''' Endpoint for mining a block '''
-    trans_data = transaction_pool.transaction_data()
-    trans_data.append(Transaction.reward_transaction(wallet).to_json())
-    blockchain.add_block(trans_data)
-    block = blockchain.chain[-1]
-    pubsub.broadcast_block(block)
-    transaction_pool.clear_bc_transactions(blockchain)
-    return jsonify(block.to_json())
+    ''' Endpoint for mining a block, waiting until it is mined '''
+    # Keep the job itself: its id may be evicted from the job history while
+    # the request waits.
+    job = miner.submit()
+    job.finished.wait()
+    if job.status != DONE:
+        return jsonify(job.to_json()), 500
+    return jsonify(job.block.to_json())
+
+@app.route('/blockchain/mine/jobs', methods=['POST'])
+def route_blockchain_mine_jobs():
+    ''' Endpoint for queueing a block to be mined in the background '''
+    return jsonify(miner.submit().to_json()), 202
+
+@app.route('/blockchain/mine/jobs/<job_id>', methods=['GET', 'DELETE'])
+def route_blockchain_mine_job(job_id):
+    ''' Endpoint for checking (GET) or cancelling (DELETE) a mining job '''
+    if request.method == 'DELETE':
+        job = miner.cancel(job_id)
+    else:
+        job = miner.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown mining job {job_id}'}), 404
+    return jsonify(job.to_json())
+
+@app.route('/blockchain/mine/jobs/<job_id>/wait')
+def route_blockchain_mine_job_wait(job_id):
+    ''' Endpoint for awaiting a mining job, at most timeout seconds '''
+    # http://localhost:5000/blockchain/mine/jobs/<job_id>/wait?timeout=10
+    timeout = request.args.get('timeout')
+    timeout = None if timeout is None else float(timeout)
+    job = miner.wait(job_id, timeout)
+    if job is None:
+        return jsonify({'error': f'Unknown mining job {job_id}'}), 404
+    return jsonify(job.to_json())
 
 @app.route('/wallet/transact', methods=['POST'])
 def route_wallet_transact():
@@ -67,38 +230,93 @@ def route_wallet_transact():
         trans.update(wallet, trans_data['recipient'], trans_data['amount'])
     else:
         trans = Transaction(wallet, trans_data['recipient'], trans_data['amount'])
+    # The optional fee only sets the priority in the local transaction pool.
+    transaction_pool.set_transaction(trans, trans_data.get('fee', 0))
     pubsub.broadcast_transaction(trans)
     return jsonify(trans.to_json())
 
+@app.route('/transaction/<tx_id>')
+def route_transaction(tx_id):
+    '''
+        Endpoint for a transaction by id: where it is in the chain, or that
+        it is pending in the transaction pool.
+    '''
+    # The lookup and the block read must see the same chain.
+    with blockchain.lock:
+        location = blockchain.find_transaction(tx_id)
+        if location is not None:
+            height, position = location
+            block = blockchain.chain[height]
+    if location is not None:
+        return json_response({
+            'status': 'confirmed',
+            'block_hash': block.hash,
+            'height': height,
+            'position': position,
+            'transaction': block.data[position]
+        })
+    trans = transaction_pool.transaction_map.get(tx_id)
+    if trans is not None:
+        return json_response({'status': 'pending', 'transaction': trans.to_json()})
+    return jsonify({'error': f'Unknown transaction {tx_id}'}), 404
+
 @app.route('/wallet/info')
 def route_wallet_info():
     return jsonify({'address': wallet.address, 'balance': wallet.balance })
 
+@app.route('/wallet/history/<address>')
+def route_wallet_history(address):
+    '''
+        Endpoint for the transactions of an address, newest first, with the
+        change of balance of each. Pass the returned next_cursor to get the
+        following page.
+    '''
+    # http://localhost:5000/wallet/history/<address>?limit=50&cursor=120
+    cursor = request.args.get('cursor')
+    cursor = None if cursor is None else int(cursor)
+    limit = int(request.args.get('limit', HISTORY_PAGE_SIZE))
+    if limit <= 0:
+        return jsonify({'error': 'The page limit must be positive'}), 400
+    entries, next_cursor, balance = blockchain.history_page(
+        address, cursor, limit)
+    return jsonify({
+        'address': address,
+        'balance': balance,
+        'history': [
+            {'height': height, 'id': trans_id, 'delta': delta}
+            for height, trans_id, delta in entries
+        ],
+        'next_cursor': next_cursor
+    })
+
 @app.route('/known-addresses')
 def route_known_addresss():
-    known_addrs = set()
-    for block in blockchain.chain:
-        for trans in block.data:
-            known_addrs.update(trans['output'].keys())
-    return jsonify(list(known_addrs))
+    ''' Endpoint for the known addresses, optionally paginated and filtered '''
+    # http://localhost:5000/known-addresses?prefix=ab&offset=0&limit=10
+    prefix = request.args.get('prefix', '')
+    offset = int(request.args.get('offset', 0))
+    limit = request.args.get('limit')
+    limit = None if limit is None else int(limit)
+    return jsonify(blockchain.known_address_page(prefix, offset, limit))
+
+@app.route('/pubsub/metrics')
+def route_pubsub_metrics():
+    ''' Endpoint for the depth and latency of the outbound broadcast queue '''
+    return jsonify(pubsub.broadcasts.metrics())
 
 @app.route('/transactions')
 def route_transactions():
     return jsonify(transaction_pool.transaction_data())
 
 
-ROOT_PORT = 5000
 PORT = ROOT_PORT
-BLOCKCHAIN_URL = f'http://localhost:{ROOT_PORT}/blockchain'
 
 if os.environ.get('PEER') == 'True':
     PORT = random.randint(5001, 6000)
-    result = requests.get(BLOCKCHAIN_URL)
-    result_blockchain = Blockchain.from_json(result.json())
-    # This handles synchronizing the local chain to the true blockchain through
-    # chain replacement.
+    # This handles synchronizing the local chain to the true blockchain:
+    # headers first, then the missing blocks in parallel ranges.
     try:
-        blockchain.replace_chain(result_blockchain.chain)
+        synchronize(blockchain, HttpPeer(ROOT_URL))
         print('\n -- Successfully synchronized the local chain.')
     except Exception as e:
         print(f'\n -- Error synchronizing: {e}')
@@ -114,4 +332,11 @@ if os.environ.get('SEED_DATA') == 'True':
         transaction_pool.set_transaction(
             Transaction(Wallet(), Wallet().address, random.randint(2, 50)))
 
-app.run(port=PORT)
+if os.environ.get('ASYNC_SERVER') == 'True':
+    # Waiting for mining jobs and broadcasting run on their own threads, off
+    # the event loop, so reads stay fast while a block is being mined.
+    AsyncServer(
+        app, port=PORT, slow_paths=('/blockchain/mine', '/wallet/transact')
+    ).serve_forever()
+else:
+    app.run(port=PORT)
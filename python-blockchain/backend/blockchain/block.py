@@ -1,10 +1,11 @@
 # block.py
 
-import time
-
+from backend.blockchain.miner import mine_parallel, search_nonces
+from backend.util import binary_codec
 from backend.util.crypto_hash import crypto_hash
-from backend.util.hex_to_binary import hex_to_binary
-from backend.config import MINE_RATE
+from backend.util.merkle import merkle_root
+from backend.util.proof_of_work import hash_meets_difficulty
+from backend.config import MERKLE_BLOCKS, MINE_RATE, MINING_WORKERS
 
 GEN_DATA = {
     'timestamp': 1,
@@ -20,7 +21,11 @@ class Block:
         Block: a unit of storage.
         Store transactions in a blockchain that supports a cryptocurrency.
     '''
-    def __init__(self, timestamp, last_hash, hash, data, nonce, difficulty):
+    # Only set on blocks that commit to the merkle root of their data.
+    merkle_root = None
+
+    def __init__(self, timestamp, last_hash, hash, data, nonce, difficulty,
+                 merkle_root=None):
         '''
             Block object constructor.
             Args:
@@ -31,6 +36,9 @@ class Block:
                 nonce - int: number of mined attempts for the proof of work
                              computation based on leading zero requirement.
                 difficulty - int: difficulty based on leading zero requirement.
+                merkle_root - hash value: optional merkle root of the data.
+                              The hash of such a block covers the root instead
+                              of the data itself.
         '''
         self.timestamp = timestamp
         self.last_hash = last_hash
@@ -38,6 +46,8 @@ class Block:
         self.data = data
         self.nonce = nonce
         self.difficulty = difficulty
+        if merkle_root is not None:
+            self.merkle_root = merkle_root
 
     def __repr__(self):
         block_repr = (
@@ -59,25 +69,31 @@ class Block:
         return self.__dict__
 
     @staticmethod
-    def mine_block(last_block, data):
+    def mine_block(last_block, data, workers=MINING_WORKERS, cancel=None,
+                   merkle=MERKLE_BLOCKS):
         ''' 
             Mines a Block based on the given last_block and data arguments,
             until a block hash is found that meets the leading zero's
             Proof of Work requirements.
-        '''
-        timestamp = time.time_ns()
-        last_hash = last_block.hash
-        nonce = 0
-        difficulty = Block.adjust_difficulty(last_block, timestamp)
-        hash = crypto_hash(timestamp, last_hash, data, nonce, difficulty)
 
-        while hex_to_binary(hash)[0:difficulty] != '0' * difficulty:
-            nonce += 1
-            timestamp = time.time_ns()
-            difficulty = Block.adjust_difficulty(last_block, timestamp)
-            hash = crypto_hash(timestamp, last_hash, data, nonce, difficulty)
-
-        return Block(timestamp, last_hash, hash, data, nonce, difficulty)
+            workers - int: number of processes searching the nonce space.
+                           A single worker mines on the calling process.
+            cancel - Event: stops the search when set. Returns None then.
+            merkle - bool: commit to the merkle root of list data, so each
+                           attempt hashes the constant-size root.
+        '''
+        root = merkle_root(data) if merkle and isinstance(data, list) else None
+        hashed_data = data if root is None else root
+        if workers > 1:
+            result = mine_parallel(last_block, hashed_data, workers, cancel)
+        else:
+            result = search_nonces(last_block, hashed_data, stop=cancel)
+        if result is None:
+            return None
+        timestamp, hash, nonce, difficulty = result
+
+        return Block(
+            timestamp, last_block.hash, hash, data, nonce, difficulty, root)
 
     """
     @staticmethod
@@ -96,6 +112,36 @@ class Block:
         """
         return Block(**block_json)
 
+    def header(self):
+        '''
+            Return the compact header of the block: its fields without the
+            data, which is replaced by its digest.
+        '''
+        header = {
+            'timestamp': self.timestamp,
+            'last_hash': self.last_hash,
+            'hash': self.hash,
+            'data_digest': crypto_hash(self.data),
+            'nonce': self.nonce,
+            'difficulty': self.difficulty
+        }
+        if self.merkle_root is not None:
+            header['merkle_root'] = self.merkle_root
+        return header
+
+    def hashed_data(self):
+        ''' The data covered by the block hash: the merkle root, if any. '''
+        return self.data if self.merkle_root is None else self.merkle_root
+
+    def to_bytes(self):
+        ''' Serialize a Block instance into the compact binary format. '''
+        return binary_codec.encode(list(self.to_json().values()))
+
+    @staticmethod
+    def from_bytes(block_bytes):
+        ''' De-serialize a block from the compact binary format. '''
+        return Block(*binary_codec.decode(block_bytes))
+
     @staticmethod
     def genesis():
         ''' 
@@ -126,6 +172,37 @@ class Block:
 
         return 1
 
+    @staticmethod
+    def is_valid_header(last_header, header):
+        '''
+            Validate a block header against the header of the preceding
+            block, by enforcing the rules that do not need the block data:
+                - The header must have the proper last_hash reference.
+                - The hash must meet the Proof-of-Work requirement.
+                - The difficulty must only adjust by (+/-) 1.
+                - The hash must be a valid combination of the header fields,
+                  for a header with a merkle root.
+        '''
+        if header['last_hash'] != last_header['hash']:
+            raise Exception('The block must have a proper last_hash reference.')
+
+        if not hash_meets_difficulty(header['hash'], header['difficulty']):
+            raise Exception('The block did not meet the Proof of Work Requirement.')
+
+        if abs(last_header['difficulty'] - header['difficulty']) > 1:
+            raise Exception('The block difficulty must only adjust by 1.')
+
+        if 'merkle_root' in header:
+            reconstructed_hash = crypto_hash(
+                header['timestamp'],
+                header['last_hash'],
+                header['merkle_root'],
+                header['nonce'],
+                header['difficulty']
+            )
+            if header['hash'] != reconstructed_hash:
+                raise Exception('The block must have a proper hash reference.')
+
     def is_valid(last_block, block):
         '''
             Validate a block by enforcing the following rules:
@@ -133,20 +210,25 @@ class Block:
                 - The block must meet the Proof-of-Work requirement.
                 - The difficulty must only adjust by (+/-) 1.
                 - The block hash must be a valid combination of the block fields.
+                - A merkle root must be the root of the block data.
         '''
         if block.last_hash != last_block.hash:
             raise Exception('The block must have a proper last_hash reference.')
 
-        if hex_to_binary(block.hash)[0:block.difficulty] != ('0' * block.difficulty):
+        if not hash_meets_difficulty(block.hash, block.difficulty):
             raise Exception('The block did not meet the Proof of Work Requirement.')
 
         if abs(last_block.difficulty - block.difficulty) > 1:
             raise Exception('The block difficulty must only adjust by 1.')
 
+        if (block.merkle_root is not None and
+                block.merkle_root != merkle_root(block.data)):
+            raise Exception('The block must have a proper merkle root.')
+
         reconstructed_hash = crypto_hash(
             block.timestamp,
             block.last_hash,
-            block.data,
+            block.hashed_data(),
             block.nonce,
             block.difficulty
         )
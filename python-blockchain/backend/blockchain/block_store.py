@@ -0,0 +1,233 @@
+# block_store.py
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+
+from backend.blockchain.block import Block
+from backend.util.crypto_hash import utf8
+from backend.util.lru_cache import LRUCache
+from backend.config import BLOCK_CACHE_SIZE
+
+# Index entry of a block: offset and length of its serialized form in the
+# segment file, and the sha-256 digest of its hash to compare blocks by hash
+# without reading them.
+INDEX_ENTRY = struct.Struct('>QI32s')
+
+# Number of index entries the index file is first sized for. The file then
+# doubles in size whenever it is full, so appends rarely remap it.
+INDEX_INITIAL_CAPACITY = 1024
+
+# Number of appends between flushes of the memory-mapped index to disk.
+INDEX_FLUSH_INTERVAL = 100
+
+
+def hash_key(block_hash):
+    ''' Fixed-width key of a block hash, as stored in the index. '''
+    return hashlib.sha256(utf8(block_hash)).digest()
+
+
+class BlockStore:
+    '''
+        Append-only on-disk storage of a chain of blocks.
+            blocks.dat - segment file of the serialized blocks, back to back.
+            blocks.idx - fixed-width INDEX_ENTRY per block height. The index
+                         is memory-mapped, so opening the store only maps it
+                         and reading a block is a lookup plus one read. The
+                         file is preallocated: zeroed entries past the last
+                         block are free capacity.
+    '''
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment = open(os.path.join(directory, 'blocks.dat'), 'a+b')
+        self.index = open(os.path.join(directory, 'blocks.idx'), 'a+b')
+        self.index_map = None
+        self.lock = threading.RLock()
+        self.unflushed = 0
+
+        # Drop a partially written index entry left by an interrupted append.
+        index_size = os.fstat(self.index.fileno()).st_size
+        capacity = max(index_size // INDEX_ENTRY.size, INDEX_INITIAL_CAPACITY)
+        self._map_index(capacity)
+        self.length = self._find_length()
+
+    def __repr__(self):
+        return f'BlockStore({self.directory}, {len(self)} blocks)'
+
+    def __len__(self):
+        return self.length
+
+    def _map_index(self, capacity):
+        ''' Resize the index file to capacity entries and memory-map it. '''
+        if self.index_map is not None:
+            self.index_map.flush()
+            self.index_map.close()
+        self.index.truncate(capacity * INDEX_ENTRY.size)
+        self.capacity = capacity
+        self.index_map = mmap.mmap(self.index.fileno(), capacity * INDEX_ENTRY.size)
+
+    def _find_length(self):
+        '''
+            Return the number of blocks in the index: entries are written in
+            order, so the used entries, which have a non-zero payload length,
+            are followed by the free ones. Found by binary search.
+        '''
+        low, high = 0, self.capacity
+        while low < high:
+            middle = (low + high) // 2
+            if INDEX_ENTRY.unpack_from(
+                    self.index_map, middle * INDEX_ENTRY.size)[1]:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entry(self, height):
+        ''' Return the (offset, length, hash key) index entry of a height. '''
+        if not 0 <= height < self.length:
+            raise IndexError(f'No block at height {height}')
+        return INDEX_ENTRY.unpack_from(self.index_map, height * INDEX_ENTRY.size)
+
+    def hash_key(self, height):
+        return self.entry(height)[2]
+
+    def get(self, height):
+        ''' Read and deserialize the block at the given height. '''
+        offset, length, _ = self.entry(height)
+        payload = os.pread(self.segment.fileno(), length, offset)
+        return Block.from_json(json.loads(payload))
+
+    def append(self, block):
+        ''' Append a block to the segment file and its entry to the index. '''
+        payload = utf8(json.dumps(block.to_json()))
+        with self.lock:
+            self.segment.seek(0, os.SEEK_END)
+            offset = self.segment.tell()
+            self.segment.write(payload)
+            # The segment is flushed before the index references it.
+            self.segment.flush()
+            if self.length == self.capacity:
+                self._map_index(2 * self.capacity)
+            INDEX_ENTRY.pack_into(
+                self.index_map, self.length * INDEX_ENTRY.size,
+                offset, len(payload), hash_key(block.hash))
+            self.length += 1
+            self.unflushed += 1
+            if self.unflushed >= INDEX_FLUSH_INTERVAL:
+                self.flush()
+
+    def flush(self):
+        ''' Write the index entries appended since the last flush to disk. '''
+        with self.lock:
+            self.index_map.flush()
+            self.unflushed = 0
+
+    def truncate(self, height):
+        ''' Drop the blocks at the given height and above. '''
+        with self.lock:
+            if height >= self.length:
+                return
+            offset = self.entry(height)[0]
+            start = height * INDEX_ENTRY.size
+            end = self.length * INDEX_ENTRY.size
+            self.index_map[start:end] = bytes(end - start)
+            self.index_map.flush()
+            self.length = height
+            self.segment.truncate(offset)
+
+    def replace(self, blocks):
+        '''
+            Make the store hold the given list of blocks. Only the blocks
+            after the longest common prefix are rewritten.
+        '''
+        with self.lock:
+            height = 0
+            while (height < min(len(blocks), self.length) and
+                   self.hash_key(height) == hash_key(blocks[height].hash)):
+                height += 1
+            self.truncate(height)
+            for block in blocks[height:]:
+                self.append(block)
+
+    def close(self):
+        with self.lock:
+            if self.index_map is not None:
+                self.index_map.flush()
+                self.index_map.close()
+                self.index_map = None
+            self.segment.close()
+            self.index.close()
+
+
+class StoredChain:
+    '''
+        List-like view of the blocks in a BlockStore, used as Blockchain.chain
+        for a persistent blockchain. Blocks are read on demand and the most
+        recently used ones are kept in an LRUCache, so memory stays flat as
+        the chain grows.
+    '''
+    def __init__(self, store, cache_size=BLOCK_CACHE_SIZE):
+        self.store = store
+        self.cache = LRUCache(cache_size)
+
+    def __repr__(self):
+        return f'StoredChain({self.store})'
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        block = self.cache.get(index)
+        if block is None:
+            block = self.store.get(index)
+            self.cache.put(index, block)
+        return block
+
+    def __iter__(self):
+        # Reads past the cache so a full scan does not evict the hot blocks.
+        for height in range(len(self)):
+            block = self.cache.get(height)
+            yield block if block is not None else self.store.get(height)
+
+    def __eq__(self, other):
+        return len(self) == len(other) and all(
+            a == b for a, b in zip(self, other))
+
+    def append(self, block):
+        self.store.append(block)
+        self.cache.put(len(self.store) - 1, block)
+
+    def truncate(self, height):
+        ''' Drop the blocks at the given height and above. '''
+        length = len(self.store)
+        self.store.truncate(height)
+        for index in range(height, length):
+            self.cache.pop(index)
+
+    def reset(self):
+        ''' Forget cached blocks after the store was rewritten. '''
+        self.cache.clear()
+
+
+def main():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = BlockStore(directory)
+        store.append(Block.genesis())
+        store.append(Block.mine_block(store.get(0), 'foo'))
+        print(f'store: {store}')
+        print(f'store.get(1): {store.get(1)}')
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,46 @@
 # blockchain.py
 
+import collections
+import itertools
+import os
+import threading
+
 from backend.blockchain.block import Block
+from backend.blockchain.block_store import StoredChain
+from backend.blockchain.snapshot_store import SnapshotStore
+from backend.util import binary_codec
+from backend.util.proof_of_work import block_work
 from backend.wallet.transaction import Transaction
-from backend.wallet.wallet import Wallet
-from backend.config import MINING_REWARD_INPUT
+from backend.wallet.ledger import Ledger, block_transactions
+from backend.config import (
+    HISTORY_PAGE_SIZE,
+    MAX_REORG_DEPTH,
+    MINING_REWARD_INPUT,
+    SNAPSHOT_INTERVAL,
+    VERIFY_BATCH_SIZE
+)
+
+
+class ForkedChain:
+    '''
+        List-like view of the blocks of a chain up to fork_height followed by
+        the blocks of a branch, read on demand, so a stored chain is not
+        copied into memory to validate a reorganization.
+    '''
+    def __init__(self, chain, fork_height, branch):
+        self.chain = chain
+        self.fork_height = fork_height
+        self.branch = branch
+
+    def __len__(self):
+        return self.fork_height + 1 + len(self.branch)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index <= self.fork_height:
+            return self.chain[index]
+        return self.branch[index - self.fork_height - 1]
 
 
 class Blockchain:
@@ -11,13 +48,433 @@ class Blockchain:
         Blockchain: a public ledger of transactions.
         Implemented as a list of Blocks, which are datasets of transactions.
     '''
-    def __init__(self):
-        ''' Blockchain constructor '''
-        self.chain = [Block.genesis()]
+    def __init__(self, store=None, snapshots=None,
+                 snapshot_interval=SNAPSHOT_INTERVAL):
+        '''
+            Blockchain constructor.
+            store - BlockStore: optional on-disk storage of the chain. The
+                    chain is then loaded from the store, or starts at the
+                    genesis block when the store is empty, and every change
+                    to the chain is written to it.
+            snapshots - SnapshotStore: optional on-disk snapshots of the
+                        cached state, taken every snapshot_interval blocks
+                        and on close. Restarts and deep reorganizations
+                        resume from the nearest snapshot instead of the
+                        genesis block. Defaults to a snapshots directory
+                        next to the blocks of the store, if any.
+        '''
+        # Guards the chain and its cached state when blocks arrive from peers
+        # while the background miner appends its own.
+        self.lock = threading.RLock()
+        self.store = store
+        if snapshots is None and store is not None:
+            snapshots = SnapshotStore(os.path.join(store.directory, 'snapshots'))
+        self.snapshots = snapshots
+        self.snapshot_interval = snapshot_interval
+        # Encoded snapshots of a branch being validated, written only once
+        # the branch becomes the chain.
+        self.pending_snapshots = None
+        if store is None:
+            self.chain = [Block.genesis()]
+        else:
+            if not len(store):
+                store.append(Block.genesis())
+            self._chain = StoredChain(store)
+            self._rebuild(self._chain)
+
+    def close(self):
+        '''
+            Snapshot the state as of the tip, so the next start does not
+            replay any block, and close the store.
+        '''
+        with self.lock:
+            if self.snapshots is not None:
+                self._save_snapshot(len(self.chain) - 1, self.chain[-1].hash)
+            if self.store is not None:
+                self.store.close()
+
+    @property
+    def chain(self):
+        return self._chain
+
+    @chain.setter
+    def chain(self, chain):
+        ''' Set the list of blocks and rebuild the state cached from it. '''
+        with self.lock:
+            self._store_chain(chain)
+            self._rebuild(chain)
+
+    def _store_chain(self, chain):
+        if self.store is None:
+            self._chain = chain
+        else:
+            self.store.replace(chain)
+            self._chain.reset()
+
+    def _rebuild(self, blocks, validate_from=None):
+        '''
+            Rebuild the state cached from the chain:
+                ledger - Ledger: the balances as of the last block.
+                trans_ids - dict: id -> (height, position in the block data)
+                            of the non-reward transactions. The duplicate
+                            transaction check uses it.
+                reward_ids - dict: id -> (height, position) of the mining
+                             rewards, which are not subject to that check.
+                known_addresses - dict: address -> number of transaction
+                                  outputs to it, in order of first appearance.
+                history - dict: address -> list of (height, transaction id,
+                          change of balance), oldest first.
+                heights - dict: hash -> height of the blocks of the chain.
+                work - list: cumulative work of the chain at each height.
+                undo - deque: the balances each of the last MAX_REORG_DEPTH
+                       blocks changed, to disconnect them in a reorganization.
+                side_blocks - dict: hash -> (block, height, work) of the known
+                              blocks that are not on the chain (forks).
+
+            The state is restored from the nearest snapshot of a block of the
+            chain, if any, and only the blocks after it are replayed. The
+            transactions of the blocks above validate_from are validated
+            before they are connected.
+        '''
+        self.ledger = Ledger()
+        self.trans_ids = {}
+        self.reward_ids = {}
+        self.known_addresses = {}
+        self.history = {}
+        self.heights = {}
+        self.work = []
+        self.undo = collections.deque(maxlen=MAX_REORG_DEPTH)
+        self.side_blocks = {}
+
+        start = 0
+        if self.snapshots is not None:
+            max_height = len(blocks) - 1 if validate_from is None else validate_from
+            key = self.snapshots.nearest(blocks, max_height)
+            if key is not None:
+                self._restore_snapshot(self.snapshots.load(*key))
+                start = key[0] + 1
+
+        for height in range(start, len(blocks)):
+            block = blocks[height]
+            if validate_from is not None and height > validate_from:
+                Blockchain.is_valid_block_trans(block, self.ledger, self.trans_ids)
+            self._connect_block(block, height)
+
+    def _snapshot(self):
+        ''' Return the cached state as a json-serializable snapshot. '''
+        hashes = [None] * len(self.heights)
+        for block_hash, height in self.heights.items():
+            hashes[height] = block_hash
+        return {
+            'balances': self.ledger.balances,
+            'trans_ids': self.trans_ids,
+            'reward_ids': self.reward_ids,
+            'known_addresses': self.known_addresses,
+            'history': self.history,
+            'hashes': hashes,
+            'work': self.work
+        }
+
+    def _restore_snapshot(self, snapshot):
+        ''' Restore the cached state from a snapshot. '''
+        self.ledger = Ledger(snapshot['balances'])
+        self.trans_ids = {
+            trans_id: tuple(location)
+            for trans_id, location in snapshot['trans_ids'].items()
+        }
+        self.reward_ids = {
+            trans_id: tuple(location)
+            for trans_id, location in snapshot['reward_ids'].items()
+        }
+        self.known_addresses = snapshot['known_addresses']
+        self.history = {
+            address: [tuple(entry) for entry in entries]
+            for address, entries in snapshot['history'].items()
+        }
+        self.heights = {
+            block_hash: height
+            for height, block_hash in enumerate(snapshot['hashes'])
+        }
+        self.work = snapshot['work']
+
+    def _connect_block(self, block, height):
+        ''' Update the cached state with a block appended to the chain. '''
+        undo = {}
+        data = block.data if isinstance(block.data, list) else []
+        for position, trans in enumerate(data):
+            if not isinstance(trans, dict):
+                continue
+            deltas = self.ledger.apply_transaction(trans, undo)
+            for address, delta in deltas.items():
+                self.history.setdefault(address, []).append(
+                    (height, trans['id'], delta))
+            if trans['input'] == MINING_REWARD_INPUT:
+                self.reward_ids[trans['id']] = (height, position)
+            else:
+                self.trans_ids[trans['id']] = (height, position)
+            for address in trans['output']:
+                self.known_addresses[address] = (
+                    self.known_addresses.get(address, 0) + 1)
+        self.undo.append(undo)
+        self.heights[block.hash] = height
+        self.work.append(
+            (self.work[-1] if self.work else 0) + block_work(block.difficulty))
+
+        if (self.snapshots is not None and height and
+                height % self.snapshot_interval == 0):
+            self._save_snapshot(height, block.hash)
+
+    def _save_snapshot(self, height, block_hash):
+        ''' Snapshot the state as of the block at the given height. '''
+        if (height, block_hash) in self.snapshots:
+            return
+        payload = self.snapshots.encode(self._snapshot())
+        if self.pending_snapshots is None:
+            self.snapshots.write(height, block_hash, payload)
+        else:
+            self.pending_snapshots.append((height, block_hash, payload))
+
+    def _append_block(self, block):
+        ''' Append a validated block to the chain. '''
+        self.chain.append(block)
+        self._connect_block(block, len(self.chain) - 1)
+
+    def _disconnect_block(self):
+        '''
+            Remove the last block from the chain, undoing its changes to the
+            cached state, and keep it as a side block. Returns the block.
+        '''
+        block = self.chain[-1]
+        height = len(self.chain) - 1
+        self.ledger.revert(self.undo.pop())
+        for trans in block_transactions(block):
+            if trans['input'] == MINING_REWARD_INPUT:
+                self.reward_ids.pop(trans['id'], None)
+            else:
+                self.trans_ids.pop(trans['id'], None)
+            for address in trans['output']:
+                self.known_addresses[address] -= 1
+                if not self.known_addresses[address]:
+                    del self.known_addresses[address]
+                entries = self.history.get(address)
+                while entries and entries[-1][0] == height:
+                    entries.pop()
+                if not entries:
+                    self.history.pop(address, None)
+        del self.heights[block.hash]
+        self.side_blocks[block.hash] = (block, height, self.work.pop())
+        if self.store is None:
+            del self._chain[height:]
+        else:
+            self._chain.truncate(height)
+        return block
+
+    def known_address_page(self, prefix='', offset=0, limit=None):
+        '''
+            Return known addresses starting with prefix, in order of first
+            appearance, skipping offset of them and returning at most limit.
+        '''
+        addresses = (a for a in self.known_addresses if a.startswith(prefix))
+        stop = None if limit is None else offset + limit
+        return list(itertools.islice(addresses, offset, stop))
+
+    def history_page(self, address, cursor=None, limit=HISTORY_PAGE_SIZE):
+        '''
+            Return a page of the history of an address, newest first, as a
+            list of (height, transaction id, change of balance), the cursor
+            of the next page, or None after the oldest entry, and the balance
+            of the address as of the same chain.
+
+            A cursor is a position in the history of the address, so pages
+            stay stable while new blocks are appended.
+        '''
+        if limit <= 0:
+            raise Exception('The page limit must be positive.')
+        with self.lock:
+            entries = self.history.get(address, [])
+            end = len(entries) if cursor is None else min(cursor, len(entries))
+            start = max(end - limit, 0)
+            return (entries[start:end][::-1], (start if start else None),
+                    self.ledger.balance(address))
 
     def add_block(self, data):
-        ''' Appends a block to the chain '''
-        self.chain.append(Block.mine_block(self.chain[-1], data))
+        '''
+            Appends a block to the chain. The proof of work is done outside
+            the lock, and done again if another block became the tip meanwhile.
+        '''
+        while True:
+            block = Block.mine_block(self.chain[-1], data)
+            with self.lock:
+                if block.last_hash == self.chain[-1].hash:
+                    self._append_block(block)
+                    return
+
+    def tree_block(self, block_hash):
+        '''
+            Return the (block, height, work) of a known block, on the chain or
+            on a side branch, or None if the block is unknown.
+        '''
+        height = self.heights.get(block_hash)
+        if height is not None:
+            return self.chain[height], height, self.work[height]
+        return self.side_blocks.get(block_hash)
+
+    def try_append(self, block):
+        '''
+            Add a block received from a peer to the block tree.
+
+            A block extending the tip is validated on its own, against the
+            tip and the cached ledger and transaction ids, so the cost does
+            not grow with the height of the chain. A block extending another
+            known block is kept on a side branch, and when that branch has
+            more cumulative work than the chain, the chain is reorganized.
+
+            Returns False when the parent of the block is unknown, in which
+            case the caller has to fall back to replace_chain.
+            Raises an exception when the block is invalid.
+        '''
+        with self.lock:
+            if block.hash in self.heights or block.hash in self.side_blocks:
+                return True
+
+            last_block = self.chain[-1]
+            if block.last_hash == last_block.hash:
+                Block.is_valid(last_block, block)
+                Blockchain.is_valid_block_trans(block, self.ledger, self.trans_ids)
+                self._append_block(block)
+                self._prune_side_blocks()
+                return True
+
+            parent = self.tree_block(block.last_hash)
+            if parent is None:
+                return False
+            parent_block, parent_height, parent_work = parent
+            Block.is_valid(parent_block, block)
+            work = parent_work + block_work(block.difficulty)
+            self.side_blocks[block.hash] = (block, parent_height + 1, work)
+            if work > self.work[-1]:
+                self._reorganize(block.hash)
+            return True
+
+    def _reorganize(self, tip_hash):
+        '''
+            Make the side branch ending at tip_hash the chain. Only the blocks
+            after the common ancestor are disconnected and connected, and the
+            transactions of the connected blocks are validated against the
+            state at the common ancestor.
+
+            For a branch deeper than the undo history, the state is rebuilt
+            from the nearest snapshot below the common ancestor instead, and
+            only the transactions of the branch are validated. Its snapshots
+            are written once it is the chain. An invalid branch leaves the
+            chain and the other side branches as they were.
+        '''
+        branch = []
+        block_hash = tip_hash
+        while block_hash not in self.heights:
+            block = self.side_blocks[block_hash][0]
+            branch.append(block)
+            block_hash = block.last_hash
+        branch.reverse()
+        fork_height = self.heights[block_hash]
+        depth = len(self.chain) - 1 - fork_height
+
+        if depth > len(self.undo):
+            chain = ForkedChain(self.chain, fork_height, branch)
+            disconnected = [
+                (block, height, work)
+                for height, (block, work) in enumerate(
+                    zip(self.chain[fork_height + 1:], self.work[fork_height + 1:]),
+                    fork_height + 1)
+            ]
+            side_blocks = self.side_blocks
+            self.pending_snapshots = []
+            try:
+                self._rebuild(chain, validate_from=fork_height)
+            except Exception:
+                self.pending_snapshots = None
+                self._rebuild(self.chain)
+                self.side_blocks = side_blocks
+                self._drop_side_blocks(branch)
+                raise
+            pending, self.pending_snapshots = self.pending_snapshots, None
+            if self.store is None:
+                self._chain = self._chain[:fork_height + 1] + branch
+            else:
+                self._chain.truncate(fork_height + 1)
+                for block in branch:
+                    self._chain.append(block)
+            for snapshot in pending:
+                self.snapshots.write(*snapshot)
+            self.side_blocks = side_blocks
+            self._drop_side_blocks(branch)
+            for block, height, work in disconnected:
+                self.side_blocks[block.hash] = (block, height, work)
+            self._prune_side_blocks()
+            return
+
+        disconnected = [self._disconnect_block() for _ in range(depth)]
+        for i, block in enumerate(branch):
+            try:
+                Blockchain.is_valid_block_trans(block, self.ledger, self.trans_ids)
+            except Exception:
+                self._drop_side_blocks(branch[i:])
+                while len(self.chain) - 1 > fork_height:
+                    self._disconnect_block()
+                for old_block in reversed(disconnected):
+                    del self.side_blocks[old_block.hash]
+                    self._append_block(old_block)
+                raise
+            del self.side_blocks[block.hash]
+            self._append_block(block)
+        self._prune_side_blocks()
+
+    def _drop_side_blocks(self, blocks):
+        for block in blocks:
+            self.side_blocks.pop(block.hash, None)
+
+    def _prune_side_blocks(self):
+        ''' Forget side blocks too far below the tip to be reorganized to. '''
+        min_height = len(self.chain) - 1 - MAX_REORG_DEPTH
+        stale = [
+            block_hash
+            for block_hash, (_, height, _) in self.side_blocks.items()
+            if height <= min_height
+        ]
+        for block_hash in stale:
+            del self.side_blocks[block_hash]
+
+    def blocks_after_fork(self, block_hash):
+        '''
+            Return the blocks of the chain after the point where the branch
+            of a known block forks from it, e.g. the blocks connected since
+            block_hash was the tip.
+        '''
+        with self.lock:
+            while block_hash not in self.heights:
+                block_hash = self.side_blocks[block_hash][0].last_hash
+            return self.chain[self.heights[block_hash] + 1:]
+
+    def find_transaction(self, trans_id):
+        '''
+            Return the (height, position) of a transaction in the chain, or
+            None if no block contains it.
+        '''
+        location = self.trans_ids.get(trans_id)
+        if location is None:
+            location = self.reward_ids.get(trans_id)
+        return location
+
+    def reversed_range(self, start, end):
+        '''
+            Return the blocks of chain[::-1][start:end], newest first, without
+            copying or reversing the whole chain.
+        '''
+        length = len(self.chain)
+        return [
+            self.chain[length - 1 - i]
+            for i in range(*slice(start, end).indices(length))
+        ]
 
     def __repr__(self):
         return f'Blockchain: {self.chain}'
@@ -25,17 +482,36 @@ class Blockchain:
     def replace_chain(self, chain):
         '''
             Replace the local chain with incoming chain if ALL below applies:
-                - The incoming chain is longer than the local chain.
+                - The incoming chain has more cumulative work than the local
+                  chain.
                 - The incoming chain is formatted properly.
+            Only the blocks after the common prefix of the two chains are
+            validated and connected, by reorganizing to the incoming tip.
         '''
-        if len(chain) <= len(self.chain):
-            raise Exception('Cannot replace. Incoming chain must be longer than local.')
+        with self.lock:
+            fork_height = 0
+            while (fork_height + 1 < min(len(chain), len(self.chain)) and
+                   chain[fork_height + 1].hash == self.chain[fork_height + 1].hash):
+                fork_height += 1
+            work = self.work[fork_height] + sum(
+                block_work(block.difficulty) for block in chain[fork_height + 1:])
+            if work <= self.work[-1]:
+                raise Exception('Cannot replace. Incoming chain must be longer '
+                                'than local (have more cumulative work).')
 
-        try:
-            Blockchain.is_valid(chain)
-        except Exception as e:
-            raise Exception(f'Cannot replace. The incoming chain is invalid: {e}')
-        self.chain = chain
+            try:
+                if chain[0] != Block.genesis():
+                    raise Exception('The genesis block must be valid.')
+                for height in range(fork_height + 1, len(chain)):
+                    Block.is_valid(chain[height - 1], chain[height])
+                work = self.work[fork_height]
+                for height in range(fork_height + 1, len(chain)):
+                    block = chain[height]
+                    work += block_work(block.difficulty)
+                    self.side_blocks.setdefault(block.hash, (block, height, work))
+                self._reorganize(chain[-1].hash)
+            except Exception as e:
+                raise Exception(f'Cannot replace. The incoming chain is invalid: {e}')
 
     def to_json(self):
         ''' Serialize the blockchain into a list of blocks. '''
@@ -50,6 +526,19 @@ class Blockchain:
         blockchain.chain = list(map(lambda b: Block.from_json(b), chain_json))
         return blockchain
 
+    def to_bytes(self):
+        ''' Serialize the blockchain into the compact binary format. '''
+        return binary_codec.encode(
+            [list(block.to_json().values()) for block in self.chain])
+
+    @staticmethod
+    def from_bytes(chain_bytes):
+        ''' De-serialize a blockchain from the compact binary format. '''
+        blockchain = Blockchain()
+        blockchain.chain = [
+            Block(*fields) for fields in binary_codec.decode(chain_bytes)]
+        return blockchain
+
     @staticmethod
     def is_valid(chain):
         '''
@@ -66,41 +555,84 @@ class Blockchain:
             Block.is_valid(last_block, block)
         Blockchain.is_valid_trans_chain(chain)
 
+    @staticmethod
     def is_valid_trans_chain(chain):
         '''
             Enforce the rules of a chain composed of blocks of transaction.
                 - Each transaction must only appear ONCE in the chain.
                 - There can only be ONE mining reward per block.
                 - Each transaction MUST be valid.
+
+            Runs in a single pass: the balances of the preceding blocks are
+            carried forward in a Ledger instead of being recalculated from
+            the start of the chain for every transaction.
         '''
         trans_ids = set()
-        for i in range(len(chain)):
-            block = chain[i]
-            has_mining_reward = False
-
-            for trans_json in block.data:
-                trans = Transaction.from_json(trans_json)
-
-                if trans.input == MINING_REWARD_INPUT:
-                    if has_mining_reward:
-                        raise Exception('There can only be one mining reward '
-                                        'per block. Check block with hash: '
-                                        f'{block.hash}')
-                    has_mining_reward = True
-                else:
-                    if trans.id in trans_ids:
-                        raise Exception(f'Transaction {trans.id} is not unique.')
-
-                    trans_ids.add(trans.id)
-                    historic_blockchain = Blockchain()
-                    historic_blockchain.chain = chain[0:i]
-                    historic_balance = Wallet.calculate_balance(
-                        historic_blockchain, trans.input['address'])
-                    if historic_balance != trans.input['amount']:
-                        raise Exception(
-                            f'Transaction {trans.id} has an invalid input amount.')
-                    Transaction.is_valid(trans)
+        ledger = Ledger()
+        signed = []
+        try:
+            for block in chain:
+                block_trans_ids = Blockchain.is_valid_block_trans(
+                    block, ledger, trans_ids, signed)
+                trans_ids.update(block_trans_ids)
+                ledger.apply_block(block)
+                if len(signed) >= VERIFY_BATCH_SIZE:
+                    Transaction.verify_signatures(signed)
+                    signed = []
+        except Exception:
+            # A bad signature earlier in the chain is reported first.
+            Transaction.verify_signatures(signed)
+            raise
+        Transaction.verify_signatures(signed)
+
+    @staticmethod
+    def is_valid_block_trans(block, ledger, trans_ids, signed=None):
+        '''
+            Validate the transactions of a single block.
+                - ledger holds the balances as of the preceding block.
+                - trans_ids holds the transaction ids seen in the preceding
+                  blocks.
+                - signed collects the transactions whose signatures the
+                  caller verifies as a batch. When it is not given, the
+                  signatures of the block are verified as a batch here.
+            Returns the set of non-reward transaction ids of the block.
+        '''
+        if signed is None:
+            signed = []
+            try:
+                block_trans_ids = Blockchain.is_valid_block_trans(
+                    block, ledger, trans_ids, signed)
+            except Exception:
+                Transaction.verify_signatures(signed)
+                raise
+            Transaction.verify_signatures(signed)
+            return block_trans_ids
+
+        has_mining_reward = False
+        block_trans_ids = set()
+
+        for trans_json in block.data:
+            trans = Transaction.from_json(trans_json)
+
+            if trans.input == MINING_REWARD_INPUT:
+                if has_mining_reward:
+                    raise Exception('There can only be one mining reward '
+                                    'per block. Check block with hash: '
+                                    f'{block.hash}')
+                has_mining_reward = True
+            else:
+                if trans.id in trans_ids or trans.id in block_trans_ids:
+                    raise Exception(f'Transaction {trans.id} is not unique.')
+
+                block_trans_ids.add(trans.id)
+                historic_balance = ledger.balance(trans.input['address'])
+                if historic_balance != trans.input['amount']:
+                    raise Exception(
+                        f'Transaction {trans.id} has an invalid input amount.')
+                Transaction.is_valid(trans, verify_signature=False)
+                signed.append(trans)
 
+        return block_trans_ids
 
 def main():
     blockchain = Blockchain()
@@ -0,0 +1,119 @@
+# miner.py
+
+import multiprocessing
+import os
+import queue
+import time
+
+from backend.util.prefix_hash import PrefixHash
+from backend.util.proof_of_work import difficulty_target
+
+# Number of attempts a worker makes between checks of the shared stop flag.
+STOP_CHECK_INTERVAL = 1000
+
+# Seconds between checks of the cancel event while waiting for the workers.
+CANCEL_POLL_INTERVAL = 0.05
+
+
+def search_nonces(last_block, data, start=0, stride=1, stop=None):
+    '''
+        Search the nonce space start, start + stride, start + 2 * stride, ...
+        until a hash is found that meets the leading zero's Proof of Work
+        requirement.
+
+        Returns a (timestamp, hash, nonce, difficulty) tuple, or None when the
+        stop event is set before a winning hash is found.
+    '''
+    # Imported here since block.py delegates its nonce search to this module.
+    from backend.blockchain.block import Block
+
+    # last_hash and data are serialized once for the whole search.
+    prefix_hash = PrefixHash(last_block.hash, data)
+    nonce = start
+    attempts = 0
+    target_difficulty = None
+
+    while True:
+        timestamp = time.time_ns()
+        difficulty = Block.adjust_difficulty(last_block, timestamp)
+        if difficulty != target_difficulty:
+            target_difficulty = difficulty
+            target = difficulty_target(difficulty)
+        digest = prefix_hash.digest(timestamp, nonce, difficulty)
+
+        if int.from_bytes(digest, 'big') < target:
+            return (timestamp, digest.hex(), nonce, difficulty)
+
+        nonce += stride
+        attempts += 1
+        if (stop is not None and attempts % STOP_CHECK_INTERVAL == 0
+                and stop.is_set()):
+            return None
+
+
+def _search_worker(last_block, data, start, stride, stop, results):
+    ''' Process entry point: publish a winning result unless beaten to it. '''
+    result = search_nonces(last_block, data, start, stride, stop)
+    if result is not None and not stop.is_set():
+        stop.set()
+        results.put(result)
+
+
+def mine_parallel(last_block, data, workers=None, cancel=None):
+    '''
+        Split the nonce space across worker processes.
+        Worker i tries the nonces i, i + workers, i + 2 * workers, ... so the
+        winning nonce still approximates the total number of attempts made.
+        Once a worker finds a winning hash, the remaining workers are stopped.
+
+        Returns a (timestamp, hash, nonce, difficulty) tuple, or None when the
+        cancel event is set before a winning hash is found. Raises when a
+        worker dies before a winning hash is found, e.g. killed by a signal,
+        rather than waiting for its slice of the nonce space forever.
+    '''
+    workers = workers or os.cpu_count() or 1
+    ctx = multiprocessing.get_context()
+    stop = ctx.Event()
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(
+            target=_search_worker,
+            args=(last_block, data, i, workers, stop, results),
+            daemon=True)
+        for i in range(workers)
+    ]
+
+    for process in processes:
+        process.start()
+
+    result = None
+    try:
+        while result is None:
+            try:
+                result = results.get(timeout=CANCEL_POLL_INTERVAL)
+            except queue.Empty:
+                if cancel is not None and cancel.is_set():
+                    break
+                for process in processes:
+                    if process.exitcode not in (None, 0):
+                        raise Exception(
+                            'A mining worker exited unexpectedly with code '
+                            f'{process.exitcode}.')
+    finally:
+        stop.set()
+        for process in processes:
+            process.join()
+
+    return result
+
+
+def main():
+    from backend.blockchain.block import Block
+
+    genesis = Block.genesis()
+    print(f'search_nonces: {search_nonces(genesis, "foo")}')
+    print(f'mine_parallel: {mine_parallel(genesis, "foo", 2)}')
+
+
+if __name__ == '__main__':
+    main()
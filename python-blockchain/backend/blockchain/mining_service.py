@@ -0,0 +1,246 @@
+# mining_service.py
+
+import json
+import queue
+import threading
+import uuid
+
+from backend.blockchain.block import Block
+from backend.wallet.transaction import Transaction
+from backend.util.lru_cache import LRUCache
+from backend.config import (
+    BLOCK_MAX_BYTES,
+    BLOCK_MAX_TRANSACTIONS,
+    MINING_JOB_HISTORY,
+    MINING_WORKERS
+)
+
+QUEUED = 'queued'
+MINING = 'mining'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class MiningJob:
+    '''
+        A request to mine one block, handled by the MiningService.
+            status - one of queued, mining, done, failed or cancelled.
+            block - Block: the mined block, once the job is done.
+            error - str: the reason the job failed.
+            finished - Event: set once the job is done, failed or cancelled.
+    '''
+    def __init__(self):
+        self.id = str(uuid.uuid4())[0:8]
+        self.status = QUEUED
+        self.block = None
+        self.error = None
+        self.finished = threading.Event()
+
+    def __repr__(self):
+        return f'MiningJob({self.id}, {self.status})'
+
+    def finish(self, status, block=None, error=None):
+        self.status = status
+        self.block = block
+        self.error = error
+        self.finished.set()
+
+    def to_json(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'block': None if self.block is None else self.block.to_json(),
+            'error': self.error
+        }
+
+
+class MiningService:
+    '''
+        Background miner of the node. Jobs are queued and mined one at a time
+        by a dedicated thread, so a request never waits for a proof of work.
+
+        Each attempt mines a block template built from the highest priority
+        transactions of the pool plus the mining reward, on top of the current
+        tip. When a peer block arrives, restart() abandons the stale template
+        and the job is retried on the new tip with the remaining transactions.
+    '''
+    def __init__(self, blockchain, transaction_pool, wallet, pubsub=None,
+                 workers=MINING_WORKERS):
+        self.blockchain = blockchain
+        self.transaction_pool = transaction_pool
+        self.wallet = wallet
+        self.pubsub = pubsub
+        self.workers = workers
+        self.jobs = LRUCache(MINING_JOB_HISTORY)
+        self.pending = queue.Queue()
+        self.current = None
+        # Set to abandon the template being mined.
+        self.interrupt = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __repr__(self):
+        return f'MiningService({self.pending.qsize()} queued, {self.current})'
+
+    def submit(self):
+        ''' Queue a new mining job and return it. '''
+        job = MiningJob()
+        self.jobs.put(job.id, job)
+        self.pending.put(job)
+        return job
+
+    def get(self, job_id):
+        ''' Return the job with the given id, or None if it is unknown. '''
+        return self.jobs.get(job_id)
+
+    def wait(self, job_id, timeout=None):
+        '''
+            Wait up to timeout seconds for a job to finish and return it.
+            Returns None if the job is unknown.
+        '''
+        job = self.get(job_id)
+        if job is not None:
+            job.finished.wait(timeout)
+        return job
+
+    def cancel(self, job_id):
+        '''
+            Cancel a queued job, or stop mining a running one.
+            Returns the job, or None if it is unknown.
+        '''
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with self.lock:
+            if job.status == QUEUED:
+                job.finish(CANCELLED)
+            elif job.status == MINING:
+                job.status = CANCELLED
+                self.interrupt.set()
+        return job
+
+    def restart(self, block=None):
+        '''
+            Abandon the template being mined because the tip changed, e.g. a
+            block from a peer was appended. The job continues on the new tip.
+        '''
+        self.interrupt.set()
+
+    def close(self):
+        ''' Stop the worker thread once the running job is interrupted. '''
+        self.pending.put(None)
+        self.interrupt.set()
+        self.thread.join()
+
+    def block_template(self):
+        '''
+            Return the data of the next block: the highest priority pooled
+            transactions that are valid on the current tip, and the mining
+            reward.
+
+            Pooled transactions already on the chain, or whose input amount
+            no longer matches the sender's balance, e.g. after a peer block,
+            can never be mined: they are evicted from the pool.
+
+            Like the block validation, every input amount is checked against
+            the ledger before the block, so at most one transaction per sender
+            fits in a block. Further ones stay pooled for a later block.
+        '''
+        reward = Transaction.reward_transaction(self.wallet).to_json()
+        with self.blockchain.lock:
+            # Leave room for the mining reward in the block template.
+            candidates = self.transaction_pool.transaction_data(
+                limit=BLOCK_MAX_TRANSACTIONS - 1,
+                max_bytes=BLOCK_MAX_BYTES - len(json.dumps(reward)))
+            ledger = self.blockchain.ledger
+            senders = set()
+            trans_data = []
+            for trans_json in candidates:
+                address = trans_json['input']['address']
+                if trans_json['id'] in self.blockchain.trans_ids:
+                    error = 'already on the chain'
+                elif ledger.balance(address) != trans_json['input']['amount']:
+                    error = 'invalid input amount'
+                elif address in senders:
+                    continue
+                else:
+                    senders.add(address)
+                    trans_data.append(trans_json)
+                    continue
+                print(f"\n -- Evicted transaction {trans_json['id']}: {error}")
+                self.transaction_pool.remove_transaction(trans_json['id'])
+        trans_data.append(reward)
+        return trans_data
+
+    def _run(self):
+        while True:
+            job = self.pending.get()
+            if job is None:
+                return
+            with self.lock:
+                if job.status != QUEUED:
+                    continue
+                job.status = MINING
+                self.current = job
+            try:
+                self._mine(job)
+            except Exception as e:
+                job.finish(FAILED, error=str(e))
+            finally:
+                self.current = None
+
+    def _mine(self, job):
+        while True:
+            with self.lock:
+                if job.status == CANCELLED:
+                    job.finish(CANCELLED)
+                    return
+                self.interrupt.clear()
+
+            # The template is checked against the ledger as of the tip it is
+            # mined on.
+            with self.blockchain.lock:
+                last_block = self.blockchain.chain[-1]
+                data = self.block_template()
+            block = Block.mine_block(
+                last_block, data, self.workers, self.interrupt)
+            if block is None:
+                continue
+            # Hold the job lock until the job is done, so a cancel arriving
+            # after the proof of work either drops the block or is too late.
+            with self.lock:
+                if job.status == CANCELLED:
+                    job.finish(CANCELLED)
+                    return
+                # A block that lost the race to a peer only lands on a side
+                # branch: its transactions are still pending, so mine them
+                # again on the new tip.
+                with self.blockchain.lock:
+                    self.blockchain.try_append(block)
+                    if self.blockchain.chain[-1].hash != block.hash:
+                        continue
+                self.transaction_pool.clear_block_transactions([block])
+                job.finish(DONE, block)
+            break
+
+        if self.pubsub is not None:
+            self.pubsub.broadcast_block(block)
+
+
+def main():
+    from backend.blockchain.blockchain import Blockchain
+    from backend.wallet.transaction_pool import TransactionPool
+    from backend.wallet.wallet import Wallet
+
+    blockchain = Blockchain()
+    service = MiningService(blockchain, TransactionPool(), Wallet(blockchain))
+    job = service.submit()
+    print(f'submitted: {job}')
+    print(f'finished: {service.wait(job.id).to_json()}')
+    service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# snapshot_store.py
+
+import os
+import re
+import threading
+import zlib
+
+from backend.util import binary_codec
+from backend.config import SNAPSHOTS_KEPT
+
+SNAPSHOT_FILE = re.compile(r'(\d+)-([0-9a-zA-Z_]+)\.snap')
+
+
+class SnapshotStore:
+    '''
+        On-disk snapshots of the state cached from a chain, e.g. the balances
+        and transaction ids as of a block. Each snapshot is keyed by the
+        height and hash of its block, so it applies to any chain that holds
+        that block at that height. Snapshots are written in the compact
+        binary format, compressed with zlib, one file per snapshot:
+            <height>-<hash>.snap
+        Only the SNAPSHOTS_KEPT most recent snapshots are kept.
+    '''
+    def __init__(self, directory, kept=SNAPSHOTS_KEPT):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.kept = kept
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f'SnapshotStore({self.directory}, {len(self.keys())} snapshots)'
+
+    def path(self, height, block_hash):
+        return os.path.join(self.directory, f'{height}-{block_hash}.snap')
+
+    def keys(self):
+        ''' Return the (height, block hash) of the snapshots, lowest first. '''
+        keys = []
+        for name in os.listdir(self.directory):
+            match = SNAPSHOT_FILE.fullmatch(name)
+            if match:
+                keys.append((int(match.group(1)), match.group(2)))
+        return sorted(keys)
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(*key))
+
+    @staticmethod
+    def encode(state):
+        ''' Return the compressed binary form of a json-serializable state. '''
+        return zlib.compress(binary_codec.encode(state))
+
+    def save(self, height, block_hash, state):
+        ''' Write the snapshot of a json-serializable state as of a block. '''
+        self.write(height, block_hash, SnapshotStore.encode(state))
+
+    def write(self, height, block_hash, payload):
+        '''
+            Write an encoded snapshot as of a block. The file is written
+            aside and renamed, so a crash never leaves a partial snapshot
+            behind.
+        '''
+        path = self.path(height, block_hash)
+        with self.lock:
+            with open(path + '.tmp', 'wb') as snapshot_file:
+                snapshot_file.write(payload)
+            os.replace(path + '.tmp', path)
+            for key in self.keys()[:-self.kept]:
+                os.remove(self.path(*key))
+
+    def load(self, height, block_hash):
+        ''' Read the state of the snapshot of a block. '''
+        with open(self.path(height, block_hash), 'rb') as snapshot_file:
+            return binary_codec.decode(zlib.decompress(snapshot_file.read()))
+
+    def nearest(self, blocks, max_height):
+        '''
+            Return the (height, block hash) of the highest snapshot at or
+            below max_height whose block is in the given list of blocks, or
+            None when there is no such snapshot.
+        '''
+        for height, block_hash in reversed(self.keys()):
+            if height <= max_height and blocks[height].hash == block_hash:
+                return height, block_hash
+        return None
+
+
+def main():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        snapshots = SnapshotStore(directory)
+        snapshots.save(0, 'genesis_hash', {'balances': {'foo': 1000}})
+        print(f'snapshots: {snapshots}')
+        print(f"snapshots.load(0, 'genesis_hash'): "
+              f"{snapshots.load(0, 'genesis_hash')}")
+
+
+if __name__ == '__main__':
+    main()
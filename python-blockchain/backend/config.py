@@ -7,6 +7,67 @@ SECONDS = 1000 * MILLI_SECONDS
 
 MINE_RATE = 4 * SECONDS
 
+# Number of processes used to search for a block's nonce.
+MINING_WORKERS = 1
+
+# Mine blocks whose hash covers the merkle root of their transactions
+# instead of the transactions, so proofs of inclusion can be served.
+MERKLE_BLOCKS = False
+
+# Number of finished mining jobs whose status can still be looked up.
+MINING_JOB_HISTORY = 1000
+
+# Number of threads used to verify batches of transaction signatures, and the
+# number of signatures collected before a batch is verified.
+VERIFY_WORKERS = 4
+VERIFY_BATCH_SIZE = 1000
+
+# Number of deserialized public keys kept by Wallet.verify.
+PUBLIC_KEY_CACHE_SIZE = 4096
+
+# Number of transactions whose verified signature is remembered.
+VERIFIED_SIGNATURE_CACHE_SIZE = 100000
+
+# Capacity of the transaction pool, and the size bounds of a mined block's
+# transactions (including the mining reward).
+MEMPOOL_MAX_TRANSACTIONS = 10000
+BLOCK_MAX_TRANSACTIONS = 1000
+BLOCK_MAX_BYTES = 1000000
+
+# Number of blocks of an on-disk chain kept in memory.
+BLOCK_CACHE_SIZE = 1024
+
+# Capacity of the outbound broadcast queue, the most messages published as
+# one batch, and the seconds a broadcast waits for room in a full queue.
+BROADCAST_QUEUE_SIZE = 10000
+BROADCAST_BATCH_SIZE = 100
+BROADCAST_QUEUE_TIMEOUT = 5
+
+# Seconds to connect to a TCP peer and to send it a batch, and the delay
+# before a failed peer is retried, doubled on each failure up to the maximum.
+PEER_CONNECT_TIMEOUT = 2
+PEER_SEND_TIMEOUT = 5
+PEER_RETRY_DELAY = 1
+PEER_MAX_RETRY_DELAY = 60
+
+# Number of most recent blocks that can be disconnected in a reorganization
+# without rebuilding the cached state from the genesis block.
+MAX_REORG_DEPTH = 100
+
+# Number of blocks between snapshots of the state cached from an on-disk
+# chain, and the number of most recent snapshots kept.
+SNAPSHOT_INTERVAL = 1000
+SNAPSHOTS_KEPT = 3
+
+# Number of entries per page of an address history.
+HISTORY_PAGE_SIZE = 50
+
+# Chain synchronization with a peer: headers and blocks fetched per request,
+# and the number of requests in flight.
+SYNC_HEADERS_PER_REQUEST = 2000
+SYNC_BLOCKS_PER_REQUEST = 100
+SYNC_WORKERS = 4
+
 STARTING_BALANCE = 1000
 
 MINING_REWARD = 50
@@ -1,15 +1,26 @@
+import json
+import queue
+import socket
+import threading
 import time
 
-from pubnub.pubnub import PubNub
-from pubnub.pnconfiguration import PNConfiguration
-from pubnub.callbacks import SubscribeCallback
-
 from backend.blockchain.block import Block
+from backend.sync import synchronize
 from backend.wallet.transaction import Transaction
+from backend.config import (
+    BROADCAST_BATCH_SIZE,
+    BROADCAST_QUEUE_SIZE,
+    BROADCAST_QUEUE_TIMEOUT,
+    PEER_CONNECT_TIMEOUT,
+    PEER_MAX_RETRY_DELAY,
+    PEER_RETRY_DELAY,
+    PEER_SEND_TIMEOUT
+)
 
-pnconfig = PNConfiguration()
-pnconfig.subscribe_key = 'sub-c-6a1ef7a8-d763-11ea-b3f2-c27cb65b13f4'
-pnconfig.publish_key = 'pub-c-3f6cf192-f4d6-460a-90d0-8665abc15464'
+PUBNUB_SUBSCRIBE_KEY = 'sub-c-6a1ef7a8-d763-11ea-b3f2-c27cb65b13f4'
+PUBNUB_PUBLISH_KEY = 'pub-c-3f6cf192-f4d6-460a-90d0-8665abc15464'
+# PubNub rejects messages above 32KiB, batches are split below that.
+PUBNUB_MAX_MESSAGE_BYTES = 30000
 
 CHANNELS = {
     'TEST': 'TEST_CHANNEL',
@@ -17,46 +28,501 @@ CHANNELS = {
     'TRANSACTION': 'TRANSACTION_CHANNEL'
 }
 
-class Listener(SubscribeCallback):
-    ''' Listener class for pubnub subscribing '''
-
-    def __init__(self, blockchain, transaction_pool):
+class Listener:
+    '''
+        Handles the messages a node receives from its transport.
+            sync_peer - HttpPeer: optional node to fetch the missing ancestors
+                        of a block from, when its parent is unknown.
+    '''
+    def __init__(self, blockchain, transaction_pool, sync_peer=None):
         self.blockchain = blockchain
         self.transaction_pool = transaction_pool
+        self.sync_peer = sync_peer
+        # Called with each peer block that changed the local chain.
+        self.block_callbacks = []
 
     def message(self, pubnub, msg_obj):
-        print(f'\n-- Channel: {msg_obj.channel}\n-- Message: {msg_obj.message}')
+        ''' Handle a message in the form of a pubnub subscribe callback. '''
+        self.handle(msg_obj.channel, msg_obj.message)
+
+    def handle(self, channel, message):
+        if isinstance(message, list):
+            # A batch of messages published together.
+            for item in message:
+                self.handle(channel, item)
+            return
+
+        print(f'\n-- Channel: {channel}\n-- Message: {message}')
 
-        if msg_obj.channel == CHANNELS['BLOCK']:
-            block = Block.from_json(msg_obj.message)
-            potential_chain = self.blockchain.chain[:]
-            potential_chain.append(block)
+        if channel == CHANNELS['BLOCK']:
+            block = Block.from_json(message)
+            tip = self.blockchain.chain[-1]
             try:
-                self.blockchain.replace_chain(potential_chain)
-                self.transaction_pool.clear_bc_transactions(self.blockchain)
-                print(f'\n -- Successfully replaced the local chain.')
+                if self.blockchain.try_append(block):
+                    print(f'\n -- Successfully appended the block to the local chain.')
+                elif self.sync_peer is not None:
+                    # The parent of the block is unknown: fetch the missing
+                    # ancestors from the sync peer.
+                    synchronize(self.blockchain, self.sync_peer)
+                    print(f'\n -- Successfully synchronized the local chain.')
+                else:
+                    print(f'\n -- Ignored a block whose parent is unknown.')
+                    return
+                if self.blockchain.chain[-1].hash == tip.hash:
+                    print(f'\n -- Kept the block on a side branch.')
+                    return
+                if self.blockchain.tree_block(tip.hash) is None:
+                    self.transaction_pool.clear_bc_transactions(self.blockchain)
+                else:
+                    # The blocks connected to the chain, the new block alone
+                    # unless its branch replaced the previous tip.
+                    connected = self.blockchain.blocks_after_fork(tip.hash)
+                    self.transaction_pool.clear_block_transactions(connected)
             except Exception as e:
                 print(f'\n -- Could not replace the chain: {e}.')
-        elif msg_obj.channel == CHANNELS['TRANSACTION']:
-            trans = Transaction.from_json(msg_obj.message)
-            self.transaction_pool.set_transaction(trans)
-            print(f'\n -- Set the new transaction in the transaction pool')
+                return
+            for callback in self.block_callbacks:
+                callback(block)
+        elif channel == CHANNELS['TRANSACTION']:
+            trans = Transaction.from_json(message)
+            if self.transaction_pool.admit_transactions(
+                    [trans], self.blockchain.ledger):
+                print(f'\n -- Set the new transaction in the transaction pool')
+
+
+class Transport:
+    '''
+        Interface of the message transport under PubSub.
+            subscribe - deliver the messages published on the channels to
+                        handler(channel, message).
+            publish - send a json-serializable message on a channel.
+            publish_batch - send several messages on a channel, in order.
+            close - release the connections of the transport.
+    '''
+    def subscribe(self, channels, handler):
+        raise NotImplementedError
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def publish_batch(self, channel, messages):
+        for message in messages:
+            self.publish(channel, message)
+
+    def close(self):
+        pass
+
+
+class PubNubTransport(Transport):
+    '''
+        Transport through the PubNub service. The pubnub package is only
+        imported when this transport is used.
+    '''
+    def __init__(self, subscribe_key=PUBNUB_SUBSCRIBE_KEY,
+                 publish_key=PUBNUB_PUBLISH_KEY):
+        from pubnub.pubnub import PubNub
+        from pubnub.pnconfiguration import PNConfiguration
+
+        pnconfig = PNConfiguration()
+        pnconfig.subscribe_key = subscribe_key
+        pnconfig.publish_key = publish_key
+        self.pubnub = PubNub(pnconfig)
+
+    def subscribe(self, channels, handler):
+        from pubnub.callbacks import SubscribeCallback
+
+        class Callback(SubscribeCallback):
+            def message(self, pubnub, msg_obj):
+                handler(msg_obj.channel, msg_obj.message)
+
+        self.pubnub.subscribe().channels(list(channels)).execute()
+        self.pubnub.add_listener(Callback())
+
+    def publish(self, channel, message):
+        ''' Publishes a message on the given channel using sync '''
+        self.pubnub.publish().channel(channel).message(message).sync()
+
+    def publish_batch(self, channel, messages):
+        '''
+            Publish the messages as lists of messages, each within the PubNub
+            message size limit, so a batch costs one round trip per list.
+        '''
+        batch = []
+        batch_bytes = 0
+        for message in messages:
+            size = len(json.dumps(message))
+            if batch and batch_bytes + size > PUBNUB_MAX_MESSAGE_BYTES:
+                self.publish(channel, batch)
+                batch = []
+                batch_bytes = 0
+            batch.append(message)
+            batch_bytes += size
+        if batch:
+            self.publish(channel, batch if len(batch) > 1 else batch[0])
+
+    def close(self):
+        self.pubnub.stop()
+
+
+class LocalBus:
+    '''
+        In-process message bus connecting LocalTransports, e.g. the nodes of
+        a test or of a cluster run on one machine.
+    '''
+    def __init__(self):
+        self.transports = []
+        self.lock = threading.Lock()
+
+    def connect(self):
+        ''' Return a new transport attached to the bus. '''
+        transport = LocalTransport(self)
+        with self.lock:
+            self.transports.append(transport)
+        return transport
+
+    def deliver(self, sender, channel, message):
+        with self.lock:
+            transports = list(self.transports)
+        for transport in transports:
+            if transport is not sender:
+                transport.receive(channel, message)
+
+    def drain(self):
+        ''' Wait until every delivered message has been handled. '''
+        for transport in list(self.transports):
+            transport.inbox.join()
+
+
+class LocalTransport(Transport):
+    '''
+        Transport on a LocalBus. Messages go to every other transport on the
+        bus and are handled on the receiver's own thread, as with a network
+        transport, so a publisher never runs the handlers of its peers.
+        Messages are copied through json, so peers never share objects.
+    '''
+    def __init__(self, bus):
+        self.bus = bus
+        self.channels = set()
+        self.handler = None
+        self.inbox = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def subscribe(self, channels, handler):
+        self.channels.update(channels)
+        self.handler = handler
+
+    def publish(self, channel, message):
+        self.bus.deliver(self, channel, json.dumps(message))
+
+    def receive(self, channel, payload):
+        if channel in self.channels:
+            self.inbox.put((channel, payload))
+
+    def close(self):
+        with self.bus.lock:
+            self.bus.transports.remove(self)
+        self.inbox.put(None)
+
+    def _run(self):
+        while True:
+            item = self.inbox.get()
+            try:
+                if item is None:
+                    return
+                channel, payload = item
+                self.handler(channel, json.loads(payload))
+            except Exception as e:
+                print(f'\n -- Could not handle the message: {e}')
+            finally:
+                self.inbox.task_done()
+
+
+class TcpPeer:
+    '''
+        A peer of a TcpTransport. The connection is opened on the first send.
+        After a failed connect or send the peer misses every message until
+        its retry delay has passed, so an unreachable peer costs at most one
+        timeout per delay.
+    '''
+    def __init__(self, address):
+        self.address = address
+        self.connection = None
+        self.retry_at = 0
+        self.retry_delay = PEER_RETRY_DELAY
+        # Serializes the writes of concurrent publishes to this peer.
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f'TcpPeer({self.address[0]}:{self.address[1]})'
+
+    def send(self, data):
+        ''' Send data to the peer, unless it is waiting to be retried. '''
+        with self.lock:
+            if time.monotonic() < self.retry_at:
+                return
+            try:
+                if self.connection is None:
+                    self.connection = socket.create_connection(
+                        self.address, timeout=PEER_CONNECT_TIMEOUT)
+                    self.connection.settimeout(PEER_SEND_TIMEOUT)
+                    self.connection.setsockopt(
+                        socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.connection.sendall(data)
+                self.retry_delay = PEER_RETRY_DELAY
+            except OSError as e:
+                print(f'\n -- Could not publish to {self.address}, retrying in'
+                      f' {self.retry_delay}s: {e}')
+                # A timed out send may have written part of a message.
+                self._disconnect()
+                self.retry_at = time.monotonic() + self.retry_delay
+                self.retry_delay = min(
+                    2 * self.retry_delay, PEER_MAX_RETRY_DELAY)
+
+    def close(self):
+        with self.lock:
+            self._disconnect()
+
+    def _disconnect(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class TcpTransport(Transport):
+    '''
+        Transport over a mesh of TCP connections between peers.
+
+        Each node listens on its own port and publishes a message by sending
+        it to every peer, one newline-delimited json object per message.
+        Messages are not relayed, so every node lists all other nodes in its
+        peers. A peer that cannot be reached misses the message, and is
+        retried after a delay that grows while it stays unreachable.
+    '''
+    def __init__(self, host='localhost', port=0, peers=()):
+        self.host = host
+        self.peers = {}
+        self.channels = set()
+        self.handler = None
+        self.lock = threading.Lock()
+        self.server = socket.create_server((host, port))
+        self.port = self.server.getsockname()[1]
+        self.closed = False
+        for peer in peers:
+            self.add_peer(peer)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def __repr__(self):
+        return f'TcpTransport({self.host}:{self.port}, {len(self.peers)} peers)'
+
+    def add_peer(self, address):
+        ''' Add a 'host:port' peer to publish to. '''
+        host, port = address.rsplit(':', 1)
+        address = (host, int(port))
+        with self.lock:
+            if address not in self.peers:
+                self.peers[address] = TcpPeer(address)
+
+    def subscribe(self, channels, handler):
+        self.channels.update(channels)
+        self.handler = handler
+
+    def publish(self, channel, message):
+        self.publish_batch(channel, [message])
+
+    def publish_batch(self, channel, messages):
+        ''' Send the messages to each peer with a single write. '''
+        data = b''.join(
+            (json.dumps({'channel': channel, 'message': message}) + '\n').encode('utf-8')
+            for message in messages)
+        # The sends happen outside the transport lock, so a slow peer does not
+        # hold up add_peer or close.
+        with self.lock:
+            peers = list(self.peers.values())
+        for peer in peers:
+            peer.send(data)
+
+    def close(self):
+        self.closed = True
+        self.server.close()
+        with self.lock:
+            peers = list(self.peers.values())
+        for peer in peers:
+            peer.close()
+
+    def _accept(self):
+        while not self.closed:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(
+                target=self._read, args=(connection,), daemon=True).start()
+
+    def _read(self, connection):
+        with connection, connection.makefile('rb') as lines:
+            for line in lines:
+                try:
+                    envelope = json.loads(line)
+                    if envelope['channel'] in self.channels:
+                        self.handler(envelope['channel'], envelope['message'])
+                except Exception as e:
+                    print(f'\n -- Could not handle the message: {e}')
+
+
+class BroadcastQueue:
+    '''
+        Outbound queue of the messages a node publishes. Callers only enqueue
+        a message, and a background sender publishes them, coalescing the
+        queued messages of each channel into batches of up to batch_size.
+
+        The queue holds at most max_size messages. When it is full, put waits
+        up to timeout seconds for room and then raises, which pushes back on
+        the callers instead of buffering without bound.
+    '''
+    def __init__(self, transport, max_size=BROADCAST_QUEUE_SIZE,
+                 batch_size=BROADCAST_BATCH_SIZE, timeout=BROADCAST_QUEUE_TIMEOUT):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.pending = queue.Queue(max_size)
+        # Messages enqueued and not yet published, including the batch being
+        # published.
+        self.unfinished = 0
+        self.idle = threading.Condition()
+        self.published = 0
+        self.batches = 0
+        self.failures = 0
+        self.publish_seconds = 0
+        self.max_publish_seconds = 0
+        self.wait_seconds = 0
+        self.max_wait_seconds = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __repr__(self):
+        return f'BroadcastQueue({self.pending.qsize()} pending)'
+
+    def put(self, channel, message):
+        ''' Queue a message to be published on a channel. '''
+        with self.idle:
+            self.unfinished += 1
+        try:
+            self.pending.put(
+                (channel, message, time.perf_counter()), timeout=self.timeout)
+        except queue.Full:
+            self._done(1)
+            raise Exception('Cannot broadcast. The broadcast queue is full.')
+
+    def flush(self, timeout=None):
+        '''
+            Wait until every queued message has been published.
+            Returns False if the timeout expired first.
+        '''
+        with self.idle:
+            return self.idle.wait_for(lambda: not self.unfinished, timeout)
+
+    def close(self, timeout=None):
+        ''' Publish the queued messages and stop the sender. '''
+        self.flush(timeout)
+        self.pending.put(None)
+        self.thread.join(timeout)
+
+    def metrics(self):
+        '''
+            Return the queue depth, the number of published messages, batches
+            and failed batches, and the mean and max seconds spent publishing
+            a batch and waiting in the queue.
+        '''
+        return {
+            'depth': self.pending.qsize(),
+            'published': self.published,
+            'batches': self.batches,
+            'failures': self.failures,
+            'publish_seconds_mean': self.publish_seconds / max(self.batches, 1),
+            'publish_seconds_max': self.max_publish_seconds,
+            'wait_seconds_mean': self.wait_seconds / max(self.published, 1),
+            'wait_seconds_max': self.max_wait_seconds
+        }
+
+    def _done(self, count):
+        with self.idle:
+            self.unfinished -= count
+            if not self.unfinished:
+                self.idle.notify_all()
+
+    def _run(self):
+        while True:
+            items = [self.pending.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in items
+            items = [item for item in items if item is not None]
+            batches = {}
+            for channel, message, enqueued in items:
+                batches.setdefault(channel, []).append(message)
+
+            start = time.perf_counter()
+            for channel, messages in batches.items():
+                self._publish(channel, messages)
+            for _, _, enqueued in items:
+                wait = start - enqueued
+                self.wait_seconds += wait
+                self.max_wait_seconds = max(self.max_wait_seconds, wait)
+            self.published += len(items)
+            self._done(len(items))
+            if stop:
+                return
+
+    def _publish(self, channel, messages):
+        start = time.perf_counter()
+        try:
+            self.transport.publish_batch(channel, messages)
+        except Exception as e:
+            self.failures += 1
+            print(f'\n -- Could not publish {len(messages)} messages: {e}')
+        elapsed = time.perf_counter() - start
+        self.batches += 1
+        self.publish_seconds += elapsed
+        self.max_publish_seconds = max(self.max_publish_seconds, elapsed)
 
 
 class PubSub():
     '''
         Publish-Subscribe layer of the application.
         Provides communication between the nodes of the blockchain network.
+
+        transport - Transport: carries the messages between nodes. Defaults
+                    to the PubNub service.
+        sync_peer - HttpPeer: optional node to synchronize from when a block
+                    arrives whose parent is unknown.
     '''
 
-    def __init__(self, blockchain, transaction_pool):
-        self.pubnub = PubNub(pnconfig)
-        self.pubnub.subscribe().channels(CHANNELS.values()).execute()
-        self.pubnub.add_listener(Listener(blockchain, transaction_pool))
+    def __init__(self, blockchain, transaction_pool, transport=None,
+                 sync_peer=None):
+        self.transport = transport if transport is not None else PubNubTransport()
+        self.listener = Listener(blockchain, transaction_pool, sync_peer)
+        self.transport.subscribe(CHANNELS.values(), self.listener.handle)
+        self.broadcasts = BroadcastQueue(self.transport)
+
+    def add_block_listener(self, callback):
+        ''' Call callback(block) after a peer block changed the local chain. '''
+        self.listener.block_callbacks.append(callback)
 
     def publish(self, ch, msg):
-        ''' Publishes a message on the given channel using sync '''
-        self.pubnub.publish().channel(ch).message(msg).sync()
+        '''
+            Queue a message to be published on the given channel. The call
+            returns without waiting for the transport.
+        '''
+        self.broadcasts.put(ch, msg)
+
+    def flush(self, timeout=None):
+        ''' Wait until the queued messages have been published. '''
+        return self.broadcasts.flush(timeout)
 
     def broadcast_block(self, block):
         ''' Broadcast (publish) a block object to all nodes. '''
@@ -66,11 +532,22 @@ class PubSub():
         ''' Broadcast (publish) a transaction objet to all nodes. '''
         self.publish(CHANNELS['TRANSACTION'], trans.to_json())
 
+    def close(self):
+        self.broadcasts.close()
+        self.transport.close()
+
 
 def main():
-    pubsub = PubSub()
+    from backend.blockchain.blockchain import Blockchain
+    from backend.wallet.transaction_pool import TransactionPool
+
+    bus = LocalBus()
+    pubsubs = [
+        PubSub(Blockchain(), TransactionPool(), bus.connect()) for _ in range(2)]
     time.sleep(1)
-    pubsub.publish(CHANNELS['TEST'], {'foo': 'bar'})
+    pubsubs[0].publish(CHANNELS['TEST'], {'foo': 'bar'})
+    pubsubs[0].flush()
+    bus.drain()
 
 
 if __name__ == '__main__':
@@ -1,25 +1,62 @@
 # average_block_rate.py
 
+import os
+import sys
 import time
 
+from backend.blockchain.block import Block
 from backend.blockchain.blockchain import Blockchain
 from backend.config import SECONDS
 
 
-blockchain = Blockchain()
-times = []
+def average_block_rate(workers, blocks):
+    '''
+        Mine the given number of blocks with the given number of mining
+        workers and report the block time and hash rate.
 
-# Check how long it takes to mine a block
-for i in range(1, 1000):
-    start_time = time.time_ns()
-    blockchain.add_block(i)
-    end_time = time.time_ns()
+        The winning nonce approximates the number of attempts made for a
+        block, since the workers interleave the nonce space.
+    '''
+    blockchain = Blockchain()
+    times = []
+    attempts = 0
 
-    time_to_mine = (end_time - start_time) / SECONDS
-    times.append(time_to_mine)
+    # Check how long it takes to mine a block
+    for i in range(1, blocks + 1):
+        start_time = time.time_ns()
+        block = Block.mine_block(blockchain.chain[-1], i, workers)
+        blockchain.chain.append(block)
+        end_time = time.time_ns()
 
-    avg_time = sum(times) / len(times)
+        time_to_mine = (end_time - start_time) / SECONDS
+        times.append(time_to_mine)
+        attempts += block.nonce + 1
 
-    print(f'New block difficulty: {blockchain.chain[-1].difficulty}')
-    print(f'Time to mine new block: {time_to_mine}s')
-    print(f'Average time to mine new blocks: {avg_time}s\n')
+        avg_time = sum(times) / len(times)
+
+        print(f'New block difficulty: {block.difficulty}')
+        print(f'Time to mine new block: {time_to_mine}s')
+        print(f'Average time to mine new blocks: {avg_time}s\n')
+
+    hash_rate = attempts / sum(times)
+    print(f'{workers} worker(s): {hash_rate:.0f} hashes/sec\n')
+    return hash_rate
+
+
+def main():
+    '''
+        Compare the hash rate of a single mining worker against N workers.
+        Usage: python -m backend.scripts.average_block_rate [N] [BLOCKS]
+    '''
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    blocks = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    single_rate = average_block_rate(1, blocks)
+    parallel_rate = average_block_rate(workers, blocks)
+    print(f'1 worker: {single_rate:.0f} hashes/sec')
+    print(f'{workers} workers: {parallel_rate:.0f} hashes/sec '
+          f'({parallel_rate / single_rate:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
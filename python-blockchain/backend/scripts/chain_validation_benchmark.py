@@ -0,0 +1,48 @@
+# chain_validation_benchmark.py
+
+import sys
+import time
+
+from backend.blockchain.block import Block
+from backend.blockchain.blockchain import Blockchain
+from backend.util.crypto_hash import crypto_hash
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+from backend.config import SECONDS
+
+
+def synthetic_chain(length):
+    '''
+        Build a chain of the given length where every block holds a transfer
+        from a new wallet and a mining reward. The blocks skip the Proof of
+        Work, since only the transaction rules are validated here.
+    '''
+    chain = [Block.genesis()]
+    miner_wallet = Wallet()
+    for i in range(1, length):
+        data = [
+            Transaction(Wallet(), miner_wallet.address, 1).to_json(),
+            Transaction.reward_transaction(miner_wallet).to_json()
+        ]
+        last_hash = chain[-1].hash
+        chain.append(Block(i, last_hash, crypto_hash(last_hash, i), data, 0, 1))
+    return chain
+
+
+def main():
+    '''
+        Time Blockchain.is_valid_trans_chain on synthetic chains.
+        Usage: python -m backend.scripts.chain_validation_benchmark [LENGTH ...]
+    '''
+    lengths = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    for length in lengths:
+        chain = synthetic_chain(length)
+        start_time = time.time_ns()
+        Blockchain.is_valid_trans_chain(chain)
+        elapsed = (time.time_ns() - start_time) / SECONDS
+        print(f'{length} blocks: validated in {elapsed:.2f}s '
+              f'({length / elapsed:.0f} blocks/sec)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# codec_benchmark.py
+
+import json
+import sys
+import time
+
+from backend.blockchain.blockchain import Blockchain
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+from backend.config import MILLI_SECONDS
+
+
+def timed(func, *args):
+    ''' Return the result of func and its duration in milliseconds. '''
+    start_time = time.time_ns()
+    result = func(*args)
+    return result, (time.time_ns() - start_time) / MILLI_SECONDS
+
+
+def main():
+    '''
+        Compare the binary format against json on a blockchain.
+        Usage: python -m backend.scripts.codec_benchmark [BLOCKS] [TRANSACTIONS]
+    '''
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    transactions = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    blockchain = Blockchain()
+    wallets = [Wallet(blockchain) for _ in range(transactions)]
+    for _ in range(blocks):
+        data = [Transaction(w, 'recipient', 1).to_json() for w in wallets]
+        data.append(Transaction.reward_transaction(wallets[0]).to_json())
+        blockchain.add_block(data)
+
+    json_data, json_encode = timed(lambda: json.dumps(blockchain.to_json()))
+    _, json_decode = timed(lambda: Blockchain.from_json(json.loads(json_data)))
+    # Encode twice: the first run fills the public key caches.
+    blockchain.to_bytes()
+    binary_data, binary_encode = timed(blockchain.to_bytes)
+    _, binary_decode = timed(Blockchain.from_bytes, binary_data)
+
+    print(f'{blocks} blocks of {transactions + 1} transactions')
+    print(f'json:   {len(json_data.encode("utf-8"))} bytes, '
+          f'encode {json_encode:.1f}ms, decode {json_decode:.1f}ms')
+    print(f'binary: {len(binary_data)} bytes, '
+          f'encode {binary_encode:.1f}ms, decode {binary_decode:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# merkle_benchmark.py
+
+import json
+import sys
+import time
+
+from backend.blockchain.block import Block
+from backend.util.merkle import merkle_proof, merkle_root, verify_proof
+from backend.util.prefix_hash import PrefixHash
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+from backend.config import MICRO_SECONDS, MILLI_SECONDS
+
+
+def timed(func, *args):
+    ''' Return the result of func and its duration in milliseconds. '''
+    start_time = time.time_ns()
+    result = func(*args)
+    return result, (time.time_ns() - start_time) / MILLI_SECONDS
+
+
+def attempt_time(last_hash, hashed_data, attempts):
+    ''' Return the mean duration in microseconds of a mining attempt. '''
+    prefix_hash = PrefixHash(last_hash, hashed_data)
+    start_time = time.time_ns()
+    for nonce in range(attempts):
+        prefix_hash.digest(time.time_ns(), nonce, 10)
+    return (time.time_ns() - start_time) / MICRO_SECONDS / attempts
+
+
+def main():
+    '''
+        Compare plain and merkle blocks of many transactions: the cost of a
+        mining attempt, and the size of a proof of inclusion against the
+        size of the block.
+        Usage: python -m backend.scripts.merkle_benchmark [TRANSACTIONS] [ATTEMPTS]
+    '''
+    transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    attempts = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    wallets = [Wallet() for _ in range(100)]
+    data = [
+        Transaction(wallets[i % len(wallets)], 'recipient', 1).to_json()
+        for i in range(transactions)
+    ]
+    last_hash = Block.genesis().hash
+
+    root, root_time = timed(merkle_root, data)
+    plain_attempt = attempt_time(last_hash, data, attempts)
+    merkle_attempt = attempt_time(last_hash, root, attempts)
+    index = transactions // 2
+    proof, proof_time = timed(merkle_proof, data, index)
+    valid, verify_time = timed(verify_proof, data[index], proof, root)
+
+    print(f'{transactions} transactions, {len(json.dumps(data))} bytes of data')
+    print(f'merkle root: {root_time:.1f}ms')
+    print(f'mining attempt: plain {plain_attempt:.1f}us, '
+          f'merkle {merkle_attempt:.1f}us '
+          f'({plain_attempt / merkle_attempt:.0f}x)')
+    print(f'proof: {len(proof)} hashes, {len(json.dumps(proof))} bytes, '
+          f'built in {proof_time:.1f}ms, verified ({valid}) in {verify_time:.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# proof_of_work_benchmark.py
+
+import sys
+import time
+
+from backend.util.crypto_hash import crypto_hash
+from backend.util.hex_to_binary import hex_to_binary
+from backend.util.prefix_hash import PrefixHash
+from backend.util.proof_of_work import difficulty_target
+from backend.config import SECONDS
+
+DIFFICULTY = 64  # High enough that no attempt succeeds during the benchmark.
+
+
+def string_attempts(last_hash, data, attempts):
+    ''' The original attempt: crypto_hash plus a hex_to_binary string check. '''
+    for nonce in range(attempts):
+        hash = crypto_hash(time.time_ns(), last_hash, data, nonce, DIFFICULTY)
+        hex_to_binary(hash)[0:DIFFICULTY] == '0' * DIFFICULTY
+
+def integer_attempts(last_hash, data, attempts):
+    ''' The current attempt: a prefix hash digest plus an integer target. '''
+    prefix_hash = PrefixHash(last_hash, data)
+    target = difficulty_target(DIFFICULTY)
+    for nonce in range(attempts):
+        digest = prefix_hash.digest(time.time_ns(), nonce, DIFFICULTY)
+        int.from_bytes(digest, 'big') < target
+
+def string_checks(hashes):
+    for hash in hashes:
+        hex_to_binary(hash)[0:DIFFICULTY] == '0' * DIFFICULTY
+
+def integer_checks(digests):
+    target = difficulty_target(DIFFICULTY)
+    for digest in digests:
+        int.from_bytes(digest, 'big') < target
+
+def rate(func, *args, count):
+    start_time = time.time_ns()
+    func(*args)
+    return count / ((time.time_ns() - start_time) / SECONDS)
+
+
+def main():
+    '''
+        Compare Proof of Work attempts/sec before and after the integer check.
+        Usage: python -m backend.scripts.proof_of_work_benchmark [TRANSACTIONS]
+    '''
+    count = 100000
+    transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    data = [
+        {'id': f'{i:08d}', 'output': {'recipient': i, 'sender': 1000 - i}}
+        for i in range(transactions)
+    ]
+
+    digests = [bytes.fromhex(crypto_hash(i)) for i in range(count)]
+    hashes = [digest.hex() for digest in digests]
+    print(f'PoW check, hex_to_binary: {rate(string_checks, hashes, count=count):.0f}/sec')
+    print(f'PoW check, integer: {rate(integer_checks, digests, count=count):.0f}/sec')
+
+    attempts = 20000
+    print(f'Attempts ({transactions} transactions), before: '
+          f'{rate(string_attempts, "last_hash", data, attempts, count=attempts):.0f}/sec')
+    print(f'Attempts ({transactions} transactions), after: '
+          f'{rate(integer_attempts, "last_hash", data, attempts, count=attempts):.0f}/sec')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# propagation_latency.py
+
+import contextlib
+import os
+import statistics
+import sys
+import threading
+import time
+
+from backend.blockchain.blockchain import Blockchain
+from backend.pubsub import PubSub, LocalBus, TcpTransport
+from backend.wallet.transaction_pool import TransactionPool
+
+
+def cluster(nodes, transport):
+    '''
+        Start the given number of nodes in this process, connected through a
+        LocalBus or a full mesh of TcpTransports on localhost.
+    '''
+    if transport == 'local':
+        bus = LocalBus()
+        transports = [bus.connect() for _ in range(nodes)]
+    else:
+        transports = [TcpTransport() for _ in range(nodes)]
+        for transport in transports:
+            for peer in transports:
+                if peer is not transport:
+                    transport.add_peer(f'localhost:{peer.port}')
+    return [
+        PubSub(Blockchain(), TransactionPool(), transport)
+        for transport in transports
+    ]
+
+
+def propagation_latency(nodes, blocks, transport):
+    '''
+        Mine blocks on the first node of a cluster, broadcast each one and
+        report the time until every other node appended it.
+    '''
+    pubsubs = cluster(nodes, transport)
+    miner = pubsubs[0]
+    latencies = []
+    arrived = threading.Condition()
+    arrivals = []
+
+    def on_block(block):
+        with arrived:
+            arrivals.append(time.perf_counter())
+            arrived.notify()
+
+    for pubsub in pubsubs[1:]:
+        pubsub.add_block_listener(on_block)
+
+    # The Listener prints every message it handles.
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(blocks):
+            miner.listener.blockchain.add_block([])
+            block = miner.listener.blockchain.chain[-1]
+            arrivals.clear()
+            start = time.perf_counter()
+            miner.broadcast_block(block)
+            with arrived:
+                arrived.wait_for(lambda: len(arrivals) == nodes - 1, timeout=30)
+            latencies.extend(arrival - start for arrival in arrivals)
+
+    for pubsub in pubsubs:
+        pubsub.close()
+
+    latencies.sort()
+    print(f'{nodes} nodes over {transport}, {blocks} blocks, '
+          f'{len(latencies)} deliveries')
+    print(f'median: {statistics.median(latencies) * 1000:.2f}ms')
+    print(f'p99: {latencies[int(0.99 * (len(latencies) - 1))] * 1000:.2f}ms')
+    print(f'max: {latencies[-1] * 1000:.2f}ms')
+
+
+def main():
+    '''
+        Measure block propagation latency across a cluster on one machine.
+        Usage: python -m backend.scripts.propagation_latency [NODES] [BLOCKS] [tcp|local]
+    '''
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    blocks = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    transport = sys.argv[3] if len(sys.argv) > 3 else 'tcp'
+    propagation_latency(nodes, blocks, transport)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# transaction_pool_benchmark.py
+
+import sys
+import time
+
+from backend.blockchain.block import Block
+from backend.wallet.transaction import Transaction
+from backend.wallet.transaction_pool import TransactionPool
+from backend.config import MICRO_SECONDS
+
+
+def pending_transactions(count):
+    '''
+        Build unsigned transactions with distinct senders. The pool does not
+        check signatures when setting a transaction, so signing is skipped.
+    '''
+    return [
+        Transaction(
+            id=f'{i:08x}',
+            output={'recipient': 1, f'sender-{i}': 999},
+            input={'address': f'sender-{i}', 'amount': 1000}
+        )
+        for i in range(count)
+    ]
+
+def latency(func, items):
+    ''' Return the average latency of func over items in microseconds. '''
+    start_time = time.time_ns()
+    for item in items:
+        func(item)
+    return (time.time_ns() - start_time) / len(items) / MICRO_SECONDS
+
+
+def main():
+    '''
+        Measure insert, lookup and eviction latency of the transaction pool.
+        Usage: python -m backend.scripts.transaction_pool_benchmark [COUNT]
+    '''
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    transactions = pending_transactions(count)
+    pool = TransactionPool(max_transactions=count)
+
+    insert = latency(pool.set_transaction, transactions)
+    lookup = latency(
+        pool.existing_transaction, [t.input['address'] for t in transactions])
+    miss = latency(pool.existing_transaction, ['unknown'] * 1000)
+
+    block_size = 100
+    blocks = [
+        Block(i, 'last_hash', 'hash',
+              [t.to_json() for t in transactions[i:i + block_size]], 0, 1)
+        for i in range(0, count, block_size)
+    ]
+    evict = latency(lambda block: pool.clear_block_transactions([block]), blocks)
+
+    print(f'{count} pending transactions')
+    print(f'insert: {insert:.2f}us per transaction')
+    print(f'lookup by address: {lookup:.2f}us (miss: {miss:.2f}us)')
+    print(f'evict a {block_size} transaction block: {evict:.2f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from backend.blockchain.block import Block
+from backend.util.crypto_hash import crypto_hash
+from backend.util.proof_of_work import block_work
+from backend.config import (
+    SYNC_BLOCKS_PER_REQUEST,
+    SYNC_HEADERS_PER_REQUEST,
+    SYNC_WORKERS
+)
+
+
+class HttpPeer:
+    ''' A node to synchronize with, reached through its http api. '''
+
+    def __init__(self, url):
+        self.url = url
+
+    def __repr__(self):
+        return f'HttpPeer({self.url})'
+
+    def length(self):
+        return requests.get(f'{self.url}/blockchain/length').json()
+
+    def headers(self, start, end):
+        ''' Return the headers of the blocks from start to end. '''
+        return requests.get(
+            f'{self.url}/blockchain/headers',
+            params={'start': start, 'end': end}).json()
+
+    def blocks(self, start, end):
+        ''' Return the blocks from start to end. '''
+        blocks_json = requests.get(
+            f'{self.url}/blockchain/blocks',
+            params={'start': start, 'end': end}).json()
+        return [Block.from_json(block_json) for block_json in blocks_json]
+
+
+class LocalPeer:
+    ''' A blockchain of this process served as a peer, e.g. in tests. '''
+
+    def __init__(self, blockchain):
+        self.blockchain = blockchain
+
+    def length(self):
+        return len(self.blockchain.chain)
+
+    def headers(self, start, end):
+        return [block.header() for block in self.blockchain.chain[start:end]]
+
+    def blocks(self, start, end):
+        return self.blockchain.chain[start:end]
+
+
+def ranges(start, end, size):
+    ''' Split the heights from start to end into (start, end) ranges. '''
+    return [(i, min(i + size, end)) for i in range(start, end, size)]
+
+
+def fetch_headers(peer, executor):
+    '''
+        Download the headers of the peer's chain, in parallel ranges, and
+        validate their linkage, Proof of Work and difficulty in order.
+    '''
+    length = peer.length()
+    headers = []
+    for batch in executor.map(
+            lambda r: peer.headers(*r),
+            ranges(0, length, SYNC_HEADERS_PER_REQUEST)):
+        for header in batch:
+            if headers:
+                Block.is_valid_header(headers[-1], header)
+            headers.append(header)
+    return headers
+
+
+def fetch_blocks(peer, headers, start, executor):
+    '''
+        Download the blocks from height start onwards, in parallel ranges,
+        and yield them in order as they arrive. Each block must match the
+        header that was validated for its height.
+    '''
+    for batch in executor.map(
+            lambda r: peer.blocks(*r),
+            ranges(start, len(headers), SYNC_BLOCKS_PER_REQUEST)):
+        for block in batch:
+            header = headers[start]
+            if (block.hash != header['hash'] or
+                    crypto_hash(block.data) != header['data_digest']):
+                raise Exception(f'Block {start} does not match its header.')
+            start += 1
+            yield block
+
+
+def synchronize(blockchain, peer, workers=SYNC_WORKERS):
+    '''
+        Synchronize the local chain with a peer's longer chain, headers first.
+
+        The headers are downloaded and validated before any block. Only the
+        blocks after the common prefix of the two chains are then downloaded,
+        in parallel ranges, and validated as they arrive: when the peer's
+        chain extends the local one, each block is appended with try_append.
+        Otherwise the chain is reorganized onto the common prefix and the
+        downloaded blocks.
+
+        Returns the number of blocks received.
+    '''
+    with ThreadPoolExecutor(workers) as executor:
+        headers = fetch_headers(peer, executor)
+        work = sum(block_work(header['difficulty']) for header in headers)
+        if work <= blockchain.work[-1]:
+            raise Exception('Cannot synchronize. The peer chain must be longer '
+                            'than local (have more cumulative work).')
+        if headers[0]['hash'] != blockchain.chain[0].hash:
+            raise Exception('The genesis block must be valid.')
+
+        common = 1
+        while (common < min(len(blockchain.chain), len(headers)) and
+               blockchain.chain[common].hash == headers[common]['hash']):
+            common += 1
+
+        blocks = fetch_blocks(peer, headers, common, executor)
+        if common == len(blockchain.chain):
+            for block in blocks:
+                if not blockchain.try_append(block):
+                    raise Exception('The local chain changed while synchronizing.')
+        else:
+            blockchain.replace_chain(blockchain.chain[:common] + list(blocks))
+
+    return len(headers) - common
+
+
+def main():
+    from backend.blockchain.blockchain import Blockchain
+
+    remote = Blockchain()
+    for i in range(5):
+        remote.add_block([])
+    blockchain = Blockchain()
+    print(f'synchronize: {synchronize(blockchain, LocalPeer(remote))} blocks')
+    print(f'blockchain.chain == remote.chain: {blockchain.chain == remote.chain}')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ import time
 from backend.blockchain.block import Block, GEN_DATA
 from backend.config import MINE_RATE, SECONDS
 from backend.util.hex_to_binary import hex_to_binary
+from backend.util.merkle import merkle_root
 
 
 def test_mine_block():
@@ -138,3 +139,59 @@ def test_valid_block_invalid_hash(last_block, block):
     block.hash = '0000000000000000bbbabc'
     with pytest.raises(Exception, match='must have a proper hash reference.'):
         Block.is_valid(last_block, block)
+
+def test_block_bytes_round_trip(block):
+    '''
+        Purpose:
+            Test that a block round-trips through the binary format.
+    '''
+    restored = Block.from_bytes(block.to_bytes())
+    assert(restored == block)
+    Block.is_valid(Block.genesis(), restored)
+    assert(Block.from_bytes(Block.genesis().to_bytes()) == Block.genesis())
+
+def test_valid_header(last_block, block):
+    '''
+        Purpose:
+            Test that the header of a valid block is valid, and that a header
+            that does not meet the Proof-of-Work requirement is not.
+    '''
+    header = block.header()
+    assert('data' not in header)
+    Block.is_valid_header(last_block.header(), header)
+
+    header['hash'] = 'fff'
+    with pytest.raises(Exception, match='did not meet the Proof of Work Requirement.'):
+        Block.is_valid_header(last_block.header(), header)
+
+def test_merkle_block():
+    '''
+        Purpose:
+            Test that a merkle block commits to the root of its data: it is
+            valid, its header alone is validated, and it round-trips.
+    '''
+    last_block = Block.genesis()
+    block = Block.mine_block(last_block, [{'id': 'a'}, {'id': 'b'}], merkle=True)
+    assert(block.merkle_root == merkle_root(block.data))
+    Block.is_valid(last_block, block)
+    Block.is_valid_header(last_block.header(), block.header())
+    assert(Block.from_json(block.to_json()) == block)
+    assert(Block.from_bytes(block.to_bytes()) == block)
+    assert('merkle_root' not in Block.mine_block(last_block, []).to_json())
+
+def test_merkle_block_bad_root():
+    '''
+        Purpose:
+            Test that a merkle block whose data does not match its root, or
+            whose header hash does not cover its root, is not valid.
+    '''
+    last_block = Block.genesis()
+    block = Block.mine_block(last_block, [{'id': 'a'}], merkle=True)
+    block.data = [{'id': 'b'}]
+    with pytest.raises(Exception, match='proper merkle root'):
+        Block.is_valid(last_block, block)
+
+    header = block.header()
+    header['merkle_root'] = merkle_root(block.data)
+    with pytest.raises(Exception, match='proper hash reference'):
+        Block.is_valid_header(last_block.header(), header)
@@ -0,0 +1,174 @@
+# test_block_store.py
+
+import collections
+
+import pytest
+
+from backend.blockchain import block_store
+from backend.blockchain.block import Block
+from backend.blockchain.block_store import BlockStore
+from backend.blockchain.blockchain import Blockchain
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+
+
+@pytest.fixture
+def store(tmp_path):
+    ''' Pytest Fixture for an empty block store '''
+    store = BlockStore(str(tmp_path))
+    yield store
+    store.close()
+
+def test_block_store_append_get(store):
+    '''
+        Purpose:
+            Assert that appended blocks are read back unchanged.
+    '''
+    genesis = Block.genesis()
+    block = Block.mine_block(genesis, ['test-data'])
+    store.append(genesis)
+    store.append(block)
+    assert(len(store) == 2)
+    assert(store.get(0) == genesis)
+    assert(store.get(1) == block)
+    with pytest.raises(IndexError):
+        store.get(2)
+
+def test_block_store_index_growth(tmp_path, monkeypatch):
+    '''
+        Purpose:
+            Assert that the index grows past its initial capacity, and that
+            reopening the store finds the blocks before the free entries.
+    '''
+    monkeypatch.setattr(block_store, 'INDEX_INITIAL_CAPACITY', 2)
+    store = BlockStore(str(tmp_path))
+    blocks = [Block.genesis()]
+    for i in range(4):
+        blocks.append(Block.mine_block(blocks[-1], [i]))
+    for block in blocks:
+        store.append(block)
+    assert(store.capacity == 8)
+    store.truncate(3)
+    store.close()
+
+    store = BlockStore(str(tmp_path))
+    assert(len(store) == 3)
+    assert([store.get(i) for i in range(3)] == blocks[:3])
+    store.close()
+
+def test_block_store_replace(store):
+    '''
+        Purpose:
+            Assert that replacing the blocks keeps the common prefix and
+            rewrites the rest.
+    '''
+    blockchain = Blockchain()
+    for i in range(3):
+        blockchain.add_block([i])
+    store.replace(blockchain.chain)
+    fork = blockchain.chain[:2] + [Block.mine_block(blockchain.chain[1], ['fork'])]
+    store.replace(fork)
+    assert(len(store) == 3)
+    assert([store.get(i) for i in range(3)] == fork)
+
+def test_blockchain_store_restart(tmp_path):
+    '''
+        Purpose:
+            Assert that a blockchain backed by a store is restored with its
+            chain and balances after a restart.
+    '''
+    store = BlockStore(str(tmp_path))
+    blockchain = Blockchain(store)
+    wallet = Wallet(blockchain)
+    blockchain.add_block([Transaction(wallet, 'recipient', 50).to_json()])
+    blockchain.add_block([Transaction(wallet, 'recipient', 25).to_json()])
+    store.close()
+
+    store = BlockStore(str(tmp_path))
+    restored = Blockchain(store)
+    assert(len(restored.chain) == 3)
+    assert([b.hash for b in restored.chain] == [b.hash for b in blockchain.chain])
+    assert(Wallet.calculate_balance(restored, wallet.address) == wallet.balance)
+    Blockchain.is_valid(restored.chain)
+    store.close()
+
+def test_blockchain_store_replace_chain(tmp_path, store):
+    '''
+        Purpose:
+            Assert that chain replacement is written to the store.
+    '''
+    incoming = Blockchain()
+    incoming.add_block([Transaction(Wallet(), 'recipient', 1).to_json()])
+    blockchain = Blockchain(store)
+    blockchain.replace_chain(incoming.chain)
+    assert(len(store) == 2)
+    assert(store.get(1).hash == incoming.chain[1].hash)
+    assert(blockchain.chain[-1].hash == incoming.chain[-1].hash)
+
+def test_blockchain_store_reorganize(tmp_path):
+    '''
+        Purpose:
+            Assert that a reorganization rewrites the stored blocks after the
+            fork, and the chain is restored from them after a restart.
+    '''
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    for i in range(2):
+        blockchain.add_block([])
+    side = Block.mine_block(blockchain.chain[-2], [])
+    side_child = Block.mine_block(side, [])
+    blockchain.try_append(side)
+    blockchain.try_append(side_child)
+    assert(blockchain.chain[-1] == side_child)
+    chain = list(blockchain.chain)
+    blockchain.store.close()
+
+    restarted = Blockchain(BlockStore(str(tmp_path)))
+    assert([block.hash for block in restarted.chain] ==
+           [block.hash for block in chain])
+    restarted.store.close()
+
+def test_blockchain_store_close_snapshots_tip(tmp_path, monkeypatch):
+    '''
+        Purpose:
+            Assert that a blockchain closed cleanly restarts from the
+            snapshot of its tip, without replaying any block.
+    '''
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    wallet = Wallet(blockchain)
+    blockchain.add_block([Transaction(wallet, 'recipient', 50).to_json()])
+    blockchain.close()
+
+    connected = []
+    monkeypatch.setattr(
+        Blockchain, '_connect_block',
+        lambda self, block, height: connected.append(height))
+    restarted = Blockchain(BlockStore(str(tmp_path)))
+    assert(connected == [])
+    assert(restarted.ledger.balances == blockchain.ledger.balances)
+    assert(restarted.heights == blockchain.heights)
+    restarted.store.close()
+
+def test_blockchain_store_deep_reorganize(tmp_path):
+    '''
+        Purpose:
+            Assert that a reorganization deeper than the undo history
+            rewrites only the stored blocks after the fork.
+    '''
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    for i in range(3):
+        blockchain.add_block([])
+    blockchain.undo = collections.deque(maxlen=0)
+    side = Block.mine_block(blockchain.chain[1], [])
+    side_child = Block.mine_block(side, [])
+    side_grandchild = Block.mine_block(side_child, [])
+    for block in (side, side_child, side_grandchild):
+        blockchain.try_append(block)
+    assert(blockchain.chain[-3:] == [side, side_child, side_grandchild])
+    chain = list(blockchain.chain)
+    blockchain.close()
+
+    restarted = Blockchain(BlockStore(str(tmp_path)))
+    assert([block.hash for block in restarted.chain] ==
+           [block.hash for block in chain])
+    assert(restarted.work == blockchain.work)
+    restarted.store.close()
@@ -1,9 +1,12 @@
 # test_blockchain.py
 
+import collections
+import json
+
 import pytest
 
 from backend.blockchain.blockchain import Blockchain
-from backend.blockchain.block import GEN_DATA
+from backend.blockchain.block import Block, GEN_DATA
 from backend.wallet.wallet import Wallet
 from backend.wallet.transaction import Transaction
 
@@ -28,6 +31,31 @@ def test_add_block():
     blockchain.add_block(data)
     assert(blockchain.chain[-1].data == data)
 
+def test_add_block_tip_changed(monkeypatch):
+    '''
+        Purpose:
+            Assert that a block whose tip changed while it was mined is mined
+            again on the new tip instead of being appended onto a stale
+            parent.
+    '''
+    blockchain = Blockchain()
+    mine_block = Block.mine_block
+    peer_blocks = []
+
+    def racing_mine_block(last_block, data):
+        block = mine_block(last_block, data)
+        if not peer_blocks:
+            # A peer block on the same tip arrives while the block is mined.
+            peer_blocks.append(mine_block(last_block, []))
+            blockchain.try_append(peer_blocks[0])
+        return block
+
+    monkeypatch.setattr(Block, 'mine_block', staticmethod(racing_mine_block))
+    blockchain.add_block([])
+    assert(len(blockchain.chain) == 3)
+    assert(blockchain.chain[1] == peer_blocks[0])
+    assert(blockchain.chain[2].last_hash == peer_blocks[0].hash)
+
 @pytest.fixture
 def blockchain_3b():
     ''' Pytest Fixture for a blockchain containing 3 blocks '''
@@ -121,3 +149,262 @@ def test_is_valid_transaction_chain_bad_histroric_balance(blockchain_3b):
     blockchain_3b.add_block([bad_trans.to_json()])
     with pytest.raises(Exception, match='has an invalid input amount.'):
         Blockchain.is_valid_trans_chain(blockchain_3b.chain)
+
+def test_try_append(blockchain_3b):
+    '''
+        Purpose:
+            Assert that a block extending the tip is appended and the cached
+            ledger and transaction ids are updated.
+    '''
+    wallet = Wallet(blockchain_3b)
+    trans = Transaction(wallet, 'recipient', 10)
+    block = Block.mine_block(blockchain_3b.chain[-1], [trans.to_json()])
+    assert(blockchain_3b.try_append(block))
+    assert(blockchain_3b.chain[-1] == block)
+    assert(trans.id in blockchain_3b.trans_ids)
+    assert(blockchain_3b.ledger.balance(wallet.address) == trans.output[wallet.address])
+
+def test_try_append_fork(blockchain_3b):
+    '''
+        Purpose:
+            Assert that a block that does not extend the tip, and whose branch
+            does not have more work, is kept on a side branch.
+    '''
+    tip = blockchain_3b.chain[-1]
+    block = Block.mine_block(blockchain_3b.chain[-2], [])
+    assert(block.difficulty == tip.difficulty)
+    assert(blockchain_3b.try_append(block))
+    assert(blockchain_3b.chain[-1] == tip)
+    assert(block.hash in blockchain_3b.side_blocks)
+
+def test_try_append_unknown_parent(blockchain_3b):
+    '''
+        Purpose:
+            Assert that a block whose parent is unknown is not added.
+    '''
+    orphan = Block.mine_block(Block.mine_block(blockchain_3b.chain[-2], []), [])
+    assert(not blockchain_3b.try_append(orphan))
+    assert(orphan.hash not in blockchain_3b.side_blocks)
+
+def assert_state_rebuilt(blockchain):
+    ''' Assert that the cached state matches a rebuild from the chain. '''
+    rebuilt = Blockchain()
+    rebuilt.chain = list(blockchain.chain)
+    assert(blockchain.ledger.balances == rebuilt.ledger.balances)
+    assert(blockchain.trans_ids == rebuilt.trans_ids)
+    assert(blockchain.known_addresses == rebuilt.known_addresses)
+    assert(blockchain.history == rebuilt.history)
+    assert(blockchain.heights == rebuilt.heights)
+    assert(blockchain.work == rebuilt.work)
+
+def test_try_append_reorganize(blockchain_3b):
+    '''
+        Purpose:
+            Assert that a side branch with more cumulative work becomes the
+            chain, and only the blocks after the fork are replaced.
+    '''
+    old_tip = blockchain_3b.chain[-1]
+    fork = blockchain_3b.chain[-2]
+    wallet = Wallet(blockchain_3b)
+    trans = Transaction(wallet, 'recipient', 10)
+    side = Block.mine_block(fork, [trans.to_json()])
+    side_child = Block.mine_block(side, [])
+
+    assert(blockchain_3b.try_append(side))
+    assert(blockchain_3b.try_append(side_child))
+    assert(blockchain_3b.chain[-2:] == [side, side_child])
+    assert(blockchain_3b.chain[-3] == fork)
+    assert(old_tip.hash in blockchain_3b.side_blocks)
+    assert(trans.id in blockchain_3b.trans_ids)
+    assert(old_tip.data[0]['id'] not in blockchain_3b.trans_ids)
+    assert(blockchain_3b.blocks_after_fork(old_tip.hash) == [side, side_child])
+    assert_state_rebuilt(blockchain_3b)
+
+def test_try_append_reorganize_beyond_undo(blockchain_3b):
+    '''
+        Purpose:
+            Assert that a reorganization deeper than the undo history falls
+            back to rebuilding the state and validating the branch.
+    '''
+    blockchain_3b.undo = collections.deque(maxlen=0)
+    side = Block.mine_block(blockchain_3b.chain[-2], [])
+    side_child = Block.mine_block(side, [])
+    blockchain_3b.try_append(side)
+    blockchain_3b.try_append(side_child)
+    assert(blockchain_3b.chain[-2:] == [side, side_child])
+    assert_state_rebuilt(blockchain_3b)
+
+def test_try_append_reorganize_invalid_branch(blockchain_3b):
+    '''
+        Purpose:
+            Assert that a heavier branch with an invalid transaction leaves
+            the chain and its state as they were.
+    '''
+    chain = list(blockchain_3b.chain)
+    fork = blockchain_3b.chain[-2]
+    side = Block.mine_block(fork, [blockchain_3b.chain[1].data[0]])
+    side_child = Block.mine_block(side, [])
+
+    assert(blockchain_3b.try_append(side))
+    with pytest.raises(Exception, match='is not unique.'):
+        blockchain_3b.try_append(side_child)
+    assert(blockchain_3b.chain == chain)
+    assert(side.hash not in blockchain_3b.side_blocks)
+    assert_state_rebuilt(blockchain_3b)
+
+def test_replace_chain_fork(blockchain_3b):
+    '''
+        Purpose:
+            Assert that chain replacement onto a fork with more work only
+            connects the blocks after the fork.
+    '''
+    blockchain = Blockchain()
+    blockchain.chain = blockchain_3b.chain[:2]
+    blockchain.add_block([])
+    blockchain.replace_chain(blockchain_3b.chain)
+    assert(blockchain.chain == blockchain_3b.chain)
+    assert_state_rebuilt(blockchain)
+
+def test_try_append_invalid_block(blockchain_3b):
+    '''
+        Purpose:
+            Assert that an invalid block extending the tip raises and is not
+            appended.
+    '''
+    block = Block.mine_block(blockchain_3b.chain[-1], [])
+    block.hash = 'test-bad-hash'
+    with pytest.raises(Exception, match='Proof of Work'):
+        blockchain_3b.try_append(block)
+    assert(len(blockchain_3b.chain) == 4)
+
+def test_try_append_duplicate_transaction(blockchain_3b):
+    '''
+        Purpose:
+            Assert that a block repeating a transaction of the chain is
+            rejected.
+    '''
+    trans_json = blockchain_3b.chain[-1].data[0]
+    block = Block.mine_block(blockchain_3b.chain[-1], [trans_json])
+    with pytest.raises(Exception, match='is not unique.'):
+        blockchain_3b.try_append(block)
+
+def test_is_valid_transaction_chain_bad_signature_reported_first(blockchain_3b):
+    '''
+        Purpose:
+            Assert that a bad signature is reported before a later fault,
+            even though signatures are verified in batches.
+    '''
+    bad_signature = Transaction(Wallet(), 'recipient', 1)
+    bad_signature.input['signature'] = Wallet().sign(bad_signature.output)
+    duplicate = Transaction(Wallet(), 'recipient', 1).to_json()
+    blockchain_3b.add_block([bad_signature.to_json()])
+    blockchain_3b.add_block([duplicate, duplicate])
+    with pytest.raises(Exception, match='Invalid Signature'):
+        Blockchain.is_valid_trans_chain(blockchain_3b.chain)
+
+def test_blockchain_bytes_round_trip(blockchain_3b):
+    '''
+        Purpose:
+            Assert that a blockchain round-trips through the binary format
+            to the same json form, and is still valid.
+    '''
+    restored = Blockchain.from_bytes(blockchain_3b.to_bytes())
+    assert(restored.to_json() ==
+           Blockchain.from_json(json.loads(json.dumps(blockchain_3b.to_json()))).to_json())
+    Blockchain.is_valid(restored.chain)
+
+def test_reversed_range(blockchain_3b):
+    '''
+        Purpose:
+            Assert that reversed_range matches slicing the reversed chain.
+    '''
+    chain = blockchain_3b.chain
+    for start, end in [(0, 2), (1, 3), (0, 10), (2, 2), (3, 1), (-2, -1), (5, 9)]:
+        assert(blockchain_3b.reversed_range(start, end) == chain[::-1][start:end])
+
+def test_known_addresses(blockchain_3b):
+    '''
+        Purpose:
+            Assert that the known addresses follow the outputs of the chain,
+            and can be paginated and searched by prefix.
+    '''
+    expected = []
+    for block in blockchain_3b.chain:
+        for trans in block.data:
+            for address in trans['output']:
+                if address not in expected:
+                    expected.append(address)
+    assert(list(blockchain_3b.known_addresses) == expected)
+    assert(blockchain_3b.known_addresses['recipient'] == 3)
+
+    assert(blockchain_3b.known_address_page() == expected)
+    assert(blockchain_3b.known_address_page(offset=1, limit=2) == expected[1:3])
+    assert(blockchain_3b.known_address_page(prefix='rec') == ['recipient'])
+
+    blockchain = Blockchain()
+    blockchain.replace_chain(blockchain_3b.chain)
+    assert(blockchain.known_addresses == blockchain_3b.known_addresses)
+
+def test_merkle_chain(blockchain_3b):
+    '''
+        Purpose:
+            Assert that merkle blocks are validated like any other block, and
+            that their transactions can be found.
+    '''
+    trans = Transaction(Wallet(blockchain_3b), 'recipient', 1).to_json()
+    block = Block.mine_block(blockchain_3b.chain[-1], [trans], merkle=True)
+    assert(blockchain_3b.try_append(block))
+    Blockchain.is_valid(blockchain_3b.chain)
+    assert(blockchain_3b.find_transaction(trans['id']) == (4, 0))
+    assert(blockchain_3b.find_transaction('unknown') is None)
+
+def test_transaction_index(blockchain_3b):
+    '''
+        Purpose:
+            Assert that transactions and mining rewards are found by id, and
+            that transactions of disconnected blocks no longer are.
+    '''
+    trans = Transaction(Wallet(blockchain_3b), 'recipient', 1).to_json()
+    reward = Transaction.reward_transaction(Wallet()).to_json()
+    blockchain_3b.add_block([trans, reward])
+    assert(blockchain_3b.find_transaction(trans['id']) == (4, 0))
+    assert(blockchain_3b.find_transaction(reward['id']) == (4, 1))
+    assert(reward['id'] not in blockchain_3b.trans_ids)
+    assert(blockchain_3b.find_transaction(
+        blockchain_3b.chain[1].data[0]['id']) == (1, 0))
+
+    side = Block.mine_block(blockchain_3b.chain[-2], [])
+    blockchain_3b.try_append(side)
+    blockchain_3b.try_append(Block.mine_block(side, []))
+    assert(blockchain_3b.find_transaction(trans['id']) is None)
+    assert(blockchain_3b.find_transaction(reward['id']) is None)
+
+def test_history(blockchain_3b):
+    '''
+        Purpose:
+            Assert that the history of an address lists the change of balance
+            of each of its transactions, a page at a time, and loses the
+            entries of disconnected blocks.
+    '''
+    wallet = Wallet(blockchain_3b)
+    blockchain_3b.add_block([Transaction(wallet, 'recipient', 10).to_json()])
+    blockchain_3b.add_block([Transaction(Wallet(), wallet.address, 5).to_json()])
+    entries, cursor, balance = blockchain_3b.history_page(wallet.address)
+    assert([(height, delta) for height, _, delta in entries] == [(5, 5), (4, -10)])
+    assert(cursor is None)
+    assert(balance == wallet.balance)
+
+    page, cursor, _ = blockchain_3b.history_page('recipient', limit=2)
+    assert([height for height, _, _ in page] == [4, 3])
+    page, cursor, _ = blockchain_3b.history_page('recipient', cursor, limit=2)
+    assert([height for height, _, _ in page] == [2, 1])
+    assert(cursor is None)
+    with pytest.raises(Exception, match='must be positive'):
+        blockchain_3b.history_page('recipient', limit=0)
+
+    side = Block.mine_block(blockchain_3b.chain[-2], [])
+    blockchain_3b.try_append(side)
+    blockchain_3b.try_append(Block.mine_block(side, []))
+    entries, _, _ = blockchain_3b.history_page(wallet.address)
+    assert([(height, delta) for height, _, delta in entries] == [(4, -10)])
+    assert_state_rebuilt(blockchain_3b)
@@ -0,0 +1,72 @@
+# test_miner.py
+
+import os
+import threading
+import time
+
+import pytest
+
+from backend.blockchain import miner
+from backend.blockchain.block import Block
+from backend.blockchain.miner import mine_parallel, search_nonces
+
+
+def test_search_nonces_stride():
+    '''
+        Purpose:
+            Test that a worker only tries nonces from its own slice of the
+            nonce space.
+    '''
+    timestamp, hash, nonce, difficulty = search_nonces(
+        Block.genesis(), 'test-data', start=3, stride=4)
+    assert(nonce % 4 == 3)
+
+def test_mine_parallel():
+    '''
+        Purpose:
+            Test that a block mined by several workers passes validation.
+    '''
+    last_block = Block.genesis()
+    block = Block.mine_block(last_block, 'test-data', workers=2)
+    assert(block.data == 'test-data')
+    assert(block.last_hash == last_block.hash)
+    Block.is_valid(last_block, block)
+
+def test_mine_parallel_result():
+    '''
+        Purpose:
+            Test that mine_parallel returns the fields of a mined block.
+    '''
+    timestamp, hash, nonce, difficulty = mine_parallel(
+        Block.genesis(), 'test-data', 2)
+    assert(isinstance(nonce, int))
+    assert(difficulty >= 1)
+
+def test_mine_block_cancelled():
+    '''
+        Purpose:
+            Test that a cancelled search returns no block, for one worker and
+            for several.
+    '''
+    cancel = threading.Event()
+    cancel.set()
+    last_block = Block(time.time_ns(), 'last_hash', 'hash', [], 0, 250)
+    assert(Block.mine_block(last_block, 'test-data', cancel=cancel) is None)
+    assert(Block.mine_block(
+        last_block, 'test-data', workers=2, cancel=cancel) is None)
+
+def test_mine_parallel_worker_died(monkeypatch):
+    '''
+        Purpose:
+            Test that the search fails instead of waiting forever when a
+            worker dies.
+    '''
+    def dying_worker(last_block, data, start, stride, stop, results):
+        if start == 0:
+            os._exit(1)
+        search_nonces(last_block, data, start, stride, stop)
+
+    monkeypatch.setattr(miner, '_search_worker', dying_worker)
+    last_block = Block(time.time_ns(), 'last_hash', 'hash', [], 0, 250)
+    with pytest.raises(Exception, match='exited unexpectedly with code 1'):
+        mine_parallel(last_block, 'test-data', 2)
@@ -0,0 +1,190 @@
+# test_mining_service.py
+
+import time
+
+import pytest
+
+from backend.blockchain import mining_service
+from backend.blockchain.block import Block
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.mining_service import (
+    MiningService,
+    CANCELLED,
+    DONE
+)
+from backend.wallet.transaction import Transaction
+from backend.wallet.transaction_pool import TransactionPool
+from backend.wallet.wallet import Wallet
+
+
+def unminable_block():
+    ''' A tip whose next block needs an impossible Proof of Work. '''
+    return Block(time.time_ns(), 'last_hash', 'hash', [], 0, 250)
+
+@pytest.fixture
+def service():
+    ''' Pytest Fixture for a mining service over an empty chain and pool '''
+    blockchain = Blockchain()
+    service = MiningService(blockchain, TransactionPool(), Wallet(blockchain))
+    yield service
+    service.close()
+
+def test_mining_job_done(service):
+    '''
+        Purpose:
+            Test that a job mines the pooled transactions into the chain and
+            clears them from the pool.
+    '''
+    transaction = Transaction(Wallet(), 'recipient', 1)
+    service.transaction_pool.set_transaction(transaction)
+    job = service.wait(service.submit().id, 10)
+
+    assert(job.status == DONE)
+    assert(service.blockchain.chain[-1] == job.block)
+    assert(job.block.data[0] == transaction.to_json())
+    assert(service.transaction_pool.transaction_data() == [])
+
+def test_mining_job_cancel(service):
+    '''
+        Purpose:
+            Test that queued and running jobs can be cancelled.
+    '''
+    service.blockchain.chain = [unminable_block()]
+    job = service.submit()
+    queued = service.submit()
+
+    assert(service.cancel(queued.id).status == CANCELLED)
+    service.cancel(job.id)
+    assert(service.wait(job.id, 10).status == CANCELLED)
+    assert(len(service.blockchain.chain) == 1)
+
+def test_mining_job_cancel_after_proof_of_work(service, monkeypatch):
+    '''
+        Purpose:
+            Test that a job cancelled once its proof of work is found drops
+            the block instead of reporting it as mined.
+    '''
+    mine_block = Block.mine_block
+
+    def cancelled_mine_block(last_block, data, *args, **kwargs):
+        block = mine_block(last_block, data, *args, **kwargs)
+        service.cancel(service.current.id)
+        return block
+
+    monkeypatch.setattr(Block, 'mine_block', staticmethod(cancelled_mine_block))
+    job = service.wait(service.submit().id, 10)
+
+    assert(job.status == CANCELLED)
+    assert(job.block is None)
+    assert(len(service.blockchain.chain) == 1)
+
+def test_mining_job_restart(service):
+    '''
+        Purpose:
+            Test that a restarted job abandons its stale template and mines on
+            the new tip.
+    '''
+    service.blockchain.chain = [unminable_block()]
+    job = service.submit()
+    # A peer chain replaces the tip the job is mining on.
+    service.blockchain.chain = [Block.genesis()]
+    service.restart()
+
+    assert(service.wait(job.id, 10).status == DONE)
+    assert(job.block.last_hash == Block.genesis().hash)
+
+def test_mining_job_lost_race(service, monkeypatch):
+    '''
+        Purpose:
+            Test that a block that lost the race to a peer block is not
+            reported as mined, and its transactions are mined again on the
+            peer's block.
+    '''
+    transaction = Transaction(Wallet(), 'recipient', 1)
+    service.transaction_pool.set_transaction(transaction)
+    mine_block = Block.mine_block
+    peer_blocks = []
+
+    def racing_mine_block(last_block, data, *args, **kwargs):
+        block = mine_block(last_block, data, *args, **kwargs)
+        if not peer_blocks:
+            # A peer block on the same tip arrives while the job is mining.
+            peer_blocks.append(mine_block(last_block, []))
+            service.blockchain.try_append(peer_blocks[0])
+        return block
+
+    monkeypatch.setattr(Block, 'mine_block', staticmethod(racing_mine_block))
+    job = service.wait(service.submit().id, 10)
+
+    assert(job.status == DONE)
+    assert(service.blockchain.chain[-2:] == [peer_blocks[0], job.block])
+    assert(job.block.data[0] == transaction.to_json())
+    assert(transaction.id in service.blockchain.trans_ids)
+    assert(service.transaction_pool.transaction_data() == [])
+
+def test_mining_job_evicts_invalid_transactions(service):
+    '''
+        Purpose:
+            Test that pooled transactions that are invalid on the tip are
+            evicted from the pool instead of failing the job.
+    '''
+    wallet = Wallet(service.blockchain)
+    stale = Transaction(wallet, 'recipient', 1)
+    # A peer block spends from the wallet, so its pooled transaction has a
+    # stale input amount.
+    service.blockchain.add_block(
+        [Transaction(wallet, 'recipient', 2).to_json()])
+    bad_amount = Transaction(Wallet(), 'recipient', 1)
+    bad_amount.input['amount'] = 9001
+    valid_trans = Transaction(Wallet(), 'recipient', 1)
+    for trans in (stale, bad_amount, valid_trans):
+        service.transaction_pool.set_transaction(trans)
+    job = service.wait(service.submit().id, 10)
+
+    assert(job.status == DONE)
+    assert(job.block.data[:-1] == [valid_trans.to_json()])
+    assert(service.transaction_pool.transaction_data() == [])
+
+def test_block_template_checks_the_ledger_before_the_block(service):
+    '''
+        Purpose:
+            Test that a recipient's transaction stays valid next to the
+            transaction paying it, and that a second transaction of a sender
+            is left in the pool for a later block.
+    '''
+    sender = Wallet(service.blockchain)
+    recipient = Wallet(service.blockchain)
+    payment = Transaction(sender, recipient.address, 1)
+    spend = Transaction(recipient, 'recipient', 1)
+    second = Transaction(sender, 'recipient', 2)
+    for trans in (payment, spend, second):
+        service.transaction_pool.set_transaction(trans)
+    trans_data = service.block_template()[:-1]
+
+    assert(spend.to_json() in trans_data)
+    assert(len(trans_data) == 2)
+    assert(len(service.transaction_pool.transaction_data()) == 3)
+
+def test_block_template_reserves_reward(service, monkeypatch):
+    '''
+        Purpose:
+            Test that the byte budget of the block template leaves room for
+            the mining reward.
+    '''
+    transaction = Transaction(Wallet(), 'recipient', 1)
+    service.transaction_pool.set_transaction(transaction)
+    size = service.transaction_pool.sizes[transaction.id]
+    monkeypatch.setattr(mining_service, 'BLOCK_MAX_BYTES', size)
+    assert(len(service.block_template()) == 1)
+
+    monkeypatch.setattr(mining_service, 'BLOCK_MAX_BYTES', 2 * size)
+    assert(service.block_template()[0] == transaction.to_json())
+
+def test_mining_job_unknown(service):
+    '''
+        Purpose:
+            Test that unknown job ids are reported as None.
+    '''
+    assert(service.get('unknown') is None)
+    assert(service.wait('unknown') is None)
+    assert(service.cancel('unknown') is None)
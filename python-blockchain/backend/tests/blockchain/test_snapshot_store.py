@@ -0,0 +1,153 @@
+# test_snapshot_store.py
+
+import collections
+
+import pytest
+
+from backend.blockchain.block import Block
+from backend.blockchain.block_store import BlockStore
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.snapshot_store import SnapshotStore
+from backend.wallet.wallet import Wallet
+from backend.wallet.transaction import Transaction
+from backend.tests.blockchain.test_blockchain import assert_state_rebuilt
+
+
+@pytest.fixture
+def snapshots(tmp_path):
+    '''
+        Purpose:
+            Provide an empty snapshot store keeping two snapshots.
+    '''
+    return SnapshotStore(str(tmp_path / 'snapshots'), kept=2)
+
+def build_chain(blockchain, length):
+    ''' Add blocks with a transaction each until the chain has length blocks. '''
+    wallet = Wallet(blockchain)
+    while len(blockchain.chain) < length:
+        trans = Transaction(wallet, Wallet().address, 1)
+        blockchain.add_block([trans.to_json()])
+    return wallet
+
+def test_snapshot_store_save_load(snapshots):
+    '''
+        Purpose:
+            Assert that a saved snapshot is loaded back as it was.
+    '''
+    state = {'balances': {'foo': 1000, 'bar': 12.5}, 'trans_ids': {'id': [1, 0]}}
+    snapshots.save(4, 'hash_4', state)
+    assert((4, 'hash_4') in snapshots)
+    assert(snapshots.load(4, 'hash_4') == state)
+
+def test_snapshot_store_prune(snapshots):
+    '''
+        Purpose:
+            Assert that only the most recent snapshots are kept.
+    '''
+    for height in (2, 4, 6):
+        snapshots.save(height, f'hash_{height}', {})
+    assert(snapshots.keys() == [(4, 'hash_4'), (6, 'hash_6')])
+
+def test_snapshot_store_nearest(snapshots):
+    '''
+        Purpose:
+            Assert that the nearest snapshot is the highest one at or below
+            the given height whose block is on the given chain.
+    '''
+    blockchain = Blockchain()
+    for i in range(4):
+        blockchain.add_block([i])
+    chain = blockchain.chain
+    snapshots.save(1, chain[1].hash, {})
+    snapshots.save(3, 'hash_of_another_chain', {})
+    assert(snapshots.nearest(chain, 4) == (1, chain[1].hash))
+    assert(snapshots.nearest(chain, 0) is None)
+
+def test_blockchain_takes_snapshots(snapshots):
+    '''
+        Purpose:
+            Assert that the blockchain takes a snapshot every
+            snapshot_interval blocks.
+    '''
+    blockchain = Blockchain(snapshots=snapshots, snapshot_interval=2)
+    build_chain(blockchain, 6)
+    assert(snapshots.keys() == [(2, blockchain.chain[2].hash),
+                                (4, blockchain.chain[4].hash)])
+
+def test_blockchain_restart_from_snapshot(tmp_path, snapshots, monkeypatch):
+    '''
+        Purpose:
+            Assert that a restart restores the state from the latest
+            snapshot and replays only the blocks after it, to the same state
+            as a replay from the genesis block.
+    '''
+    blockchain = Blockchain(
+        BlockStore(str(tmp_path / 'blocks')), snapshots, snapshot_interval=2)
+    build_chain(blockchain, 6)
+    blockchain.store.close()
+
+    connected = []
+    connect_block = Blockchain._connect_block
+    def recording_connect_block(self, block, height):
+        connected.append(height)
+        connect_block(self, block, height)
+    monkeypatch.setattr(Blockchain, '_connect_block', recording_connect_block)
+
+    restarted = Blockchain(
+        BlockStore(str(tmp_path / 'blocks')), snapshots, snapshot_interval=2)
+    assert(connected == [5])
+    assert_state_rebuilt(restarted)
+    restarted.store.close()
+
+def test_blockchain_deep_reorganize_from_snapshot(snapshots):
+    '''
+        Purpose:
+            Assert that a reorganization deeper than the undo history resumes
+            from the nearest snapshot below the fork, validates the
+            transactions of the branch, and keeps the other side branches.
+    '''
+    blockchain = Blockchain(snapshots=snapshots, snapshot_interval=2)
+    build_chain(blockchain, 5)
+    blockchain.undo = collections.deque(maxlen=0)
+    old_tip = blockchain.chain[-1]
+    other_fork = Block.mine_block(blockchain.chain[2], [])
+    blockchain.try_append(other_fork)
+    fork = blockchain.chain[3]
+    side = Block.mine_block(fork, [])
+    side_child = Block.mine_block(side, [])
+    blockchain.try_append(side)
+    blockchain.try_append(side_child)
+    assert(blockchain.chain[-2:] == [side, side_child])
+    assert(old_tip.hash in blockchain.side_blocks)
+    assert(other_fork.hash in blockchain.side_blocks)
+    assert_state_rebuilt(blockchain)
+
+def test_blockchain_deep_reorganize_invalid_branch(snapshots):
+    '''
+        Purpose:
+            Assert that an invalid branch deeper than the undo history leaves
+            the chain, the other side branches and the snapshots as they
+            were.
+    '''
+    blockchain = Blockchain(snapshots=snapshots, snapshot_interval=2)
+    build_chain(blockchain, 5)
+    other_fork = Block.mine_block(blockchain.chain[2], [])
+    blockchain.try_append(other_fork)
+    chain = list(blockchain.chain)
+    keys = snapshots.keys()
+
+    blockchain.undo = collections.deque(maxlen=0)
+    fork = blockchain.chain[2]
+    valid = Block.mine_block(fork, [])
+    valid_child = Block.mine_block(valid, [])
+    invalid = Block.mine_block(valid_child, [blockchain.chain[1].data[0]])
+    assert(blockchain.try_append(valid))
+    assert(blockchain.try_append(valid_child))
+    # The branch reaches a snapshot height before its invalid block.
+    with pytest.raises(Exception, match='is not unique.'):
+        blockchain.try_append(invalid)
+    assert(blockchain.chain == chain)
+    assert(other_fork.hash in blockchain.side_blocks)
+    assert(valid.hash not in blockchain.side_blocks)
+    assert(snapshots.keys() == keys)
+    assert_state_rebuilt(blockchain)
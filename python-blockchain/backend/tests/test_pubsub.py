@@ -0,0 +1,202 @@
+# test_pubsub.py
+
+import socket
+import threading
+import time
+
+import pytest
+
+from backend import pubsub
+from backend.blockchain.blockchain import Blockchain
+from backend.pubsub import (
+    CHANNELS,
+    PubSub,
+    BroadcastQueue,
+    Listener,
+    LocalBus,
+    TcpTransport,
+    Transport
+)
+from backend.sync import LocalPeer
+from backend.wallet.transaction import Transaction
+from backend.wallet.transaction_pool import TransactionPool
+from backend.wallet.wallet import Wallet
+
+
+@pytest.fixture
+def nodes():
+    ''' Pytest Fixture for two nodes connected through a LocalBus '''
+    bus = LocalBus()
+    nodes = [
+        PubSub(Blockchain(), TransactionPool(), bus.connect()) for _ in range(2)]
+    yield bus, nodes
+    for node in nodes:
+        node.close()
+
+def test_broadcast_block(nodes):
+    '''
+        Purpose:
+            Test that a broadcast block is appended by the other node and
+            reported to its block listeners.
+    '''
+    bus, (sender, receiver) = nodes
+    received = []
+    receiver.add_block_listener(received.append)
+    sender.listener.blockchain.add_block([])
+    block = sender.listener.blockchain.chain[-1]
+    sender.broadcast_block(block)
+    sender.flush()
+    bus.drain()
+
+    assert(receiver.listener.blockchain.chain[-1] == block)
+    assert(received == [block])
+
+def test_block_with_unknown_parent():
+    '''
+        Purpose:
+            Test that a block whose parent is unknown is ignored, or makes
+            the node synchronize the missing ancestors from its sync peer.
+    '''
+    remote = Blockchain()
+    for _ in range(3):
+        remote.add_block([Transaction(Wallet(), 'recipient', 1).to_json()])
+    message = remote.chain[-1].to_json()
+
+    listener = Listener(Blockchain(), TransactionPool())
+    listener.handle(CHANNELS['BLOCK'], message)
+    assert(len(listener.blockchain.chain) == 1)
+
+    listener = Listener(Blockchain(), TransactionPool(), LocalPeer(remote))
+    received = []
+    listener.block_callbacks.append(received.append)
+    listener.handle(CHANNELS['BLOCK'], message)
+    assert([block.hash for block in listener.blockchain.chain] ==
+           [block.hash for block in remote.chain])
+    assert(len(received) == 1)
+
+def test_broadcast_transaction(nodes):
+    '''
+        Purpose:
+            Test that a broadcast transaction is pooled by the other node, and
+            not by the sender.
+    '''
+    bus, (sender, receiver) = nodes
+    transaction = Transaction(Wallet(), 'recipient', 1)
+    sender.broadcast_transaction(transaction)
+    sender.flush()
+    bus.drain()
+
+    assert(receiver.listener.transaction_pool.existing_transaction(
+        transaction.input['address']).id == transaction.id)
+    assert(sender.listener.transaction_pool.transaction_data() == [])
+
+def test_tcp_transport():
+    '''
+        Purpose:
+            Test that a message published over TCP reaches a subscribed peer.
+    '''
+    received = threading.Event()
+    messages = []
+    def handler(channel, message):
+        messages.append((channel, message))
+        received.set()
+
+    receiver = TcpTransport()
+    receiver.subscribe(['TEST_CHANNEL'], handler)
+    sender = TcpTransport(peers=[f'localhost:{receiver.port}'])
+    sender.publish('OTHER_CHANNEL', {'foo': 'baz'})
+    sender.publish('TEST_CHANNEL', {'foo': 'bar'})
+
+    assert(received.wait(5))
+    assert(messages == [('TEST_CHANNEL', {'foo': 'bar'})])
+    sender.close()
+    receiver.close()
+
+def test_tcp_transport_unreachable_peer():
+    '''
+        Purpose:
+            Test that an unreachable peer is backed off instead of being
+            retried on every publish, and does not stop the other peers from
+            receiving the message.
+    '''
+    received = threading.Event()
+    receiver = TcpTransport()
+    receiver.subscribe(['TEST_CHANNEL'], lambda channel, message: received.set())
+    # A port nothing listens on.
+    with socket.socket() as unbound:
+        unbound.bind(('localhost', 0))
+        port = unbound.getsockname()[1]
+    sender = TcpTransport(
+        peers=[f'localhost:{port}', f'localhost:{receiver.port}'])
+    sender.publish('TEST_CHANNEL', {'foo': 'bar'})
+    unreachable = sender.peers[('localhost', port)]
+    retry_at = unreachable.retry_at
+    sender.publish('TEST_CHANNEL', {'foo': 'bar'})
+
+    assert(received.wait(5))
+    assert(unreachable.connection is None)
+    assert(retry_at > time.monotonic() - 1)
+    assert(unreachable.retry_at == retry_at)
+    assert(unreachable.retry_delay == 2 * pubsub.PEER_RETRY_DELAY)
+    sender.close()
+    receiver.close()
+
+class RecordingTransport(Transport):
+    ''' Transport that records its batches, and can hold up publishing '''
+    def __init__(self):
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def publish_batch(self, channel, messages):
+        self.release.wait(5)
+        self.batches.append((channel, messages))
+
+def wait_until_taken(broadcasts):
+    ''' Wait for the sender to take the queued messages and block on them. '''
+    while broadcasts.metrics()['depth']:
+        time.sleep(0.001)
+
+def test_broadcast_queue_batches():
+    '''
+        Purpose:
+            Test that messages queued while a batch is published are coalesced
+            per channel, in order.
+    '''
+    transport = RecordingTransport()
+    transport.release.clear()
+    broadcasts = BroadcastQueue(transport)
+    broadcasts.put('A', 0)
+    wait_until_taken(broadcasts)
+    for i in range(1, 4):
+        broadcasts.put('A', i)
+        broadcasts.put('B', i)
+    transport.release.set()
+
+    assert(broadcasts.flush(5))
+    assert(transport.batches[0] == ('A', [0]))
+    assert(transport.batches[1:] == [('A', [1, 2, 3]), ('B', [1, 2, 3])])
+    metrics = broadcasts.metrics()
+    assert(metrics['depth'] == 0)
+    assert(metrics['published'] == 7)
+    assert(metrics['batches'] == 3)
+    broadcasts.close()
+
+def test_broadcast_queue_full():
+    '''
+        Purpose:
+            Test that a broadcast into a full queue raises an exception once
+            the timeout expires.
+    '''
+    transport = RecordingTransport()
+    transport.release.clear()
+    broadcasts = BroadcastQueue(transport, max_size=1, timeout=0.01)
+    broadcasts.put('A', 0)
+    wait_until_taken(broadcasts)
+    broadcasts.put('A', 1)
+
+    with pytest.raises(Exception, match='The broadcast queue is full'):
+        broadcasts.put('A', 2)
+    transport.release.set()
+    broadcasts.close()
+    assert(transport.batches == [('A', [0]), ('A', [1])])
@@ -0,0 +1,123 @@
+# test_sync.py
+
+import json
+
+import flask
+import pytest
+import requests
+
+from backend import sync
+from backend.blockchain.blockchain import Blockchain
+from backend.sync import HttpPeer, LocalPeer, synchronize
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+
+
+@pytest.fixture(autouse=True)
+def small_ranges(monkeypatch):
+    ''' Fetch a few headers and blocks per request, to exercise the ranges '''
+    monkeypatch.setattr(sync, 'SYNC_HEADERS_PER_REQUEST', 3)
+    monkeypatch.setattr(sync, 'SYNC_BLOCKS_PER_REQUEST', 2)
+
+@pytest.fixture
+def remote():
+    ''' Pytest Fixture for a peer blockchain containing 5 blocks '''
+    blockchain = Blockchain()
+    for i in range(5):
+        blockchain.add_block([Transaction(Wallet(), 'recipient', i).to_json()])
+    return blockchain
+
+def test_synchronize_extends_chain(remote):
+    '''
+        Purpose:
+            Test that a chain that is a prefix of the peer chain receives only
+            the missing blocks.
+    '''
+    blockchain = Blockchain()
+    blockchain.chain = remote.chain[:3]
+    assert(synchronize(blockchain, LocalPeer(remote)) == 3)
+    assert(blockchain.chain == remote.chain)
+    assert(blockchain.ledger.balances == remote.ledger.balances)
+
+def test_synchronize_replaces_fork(remote):
+    '''
+        Purpose:
+            Test that a local fork is replaced by the longer peer chain.
+    '''
+    blockchain = Blockchain()
+    blockchain.add_block([])
+    assert(synchronize(blockchain, LocalPeer(remote)) == 5)
+    assert(blockchain.chain == remote.chain)
+
+def test_synchronize_shorter_peer(remote):
+    '''
+        Purpose:
+            Test that a peer chain that is not longer is not synchronized.
+    '''
+    with pytest.raises(Exception, match='must be longer than local'):
+        synchronize(remote, LocalPeer(Blockchain()))
+
+def test_synchronize_bad_header(remote):
+    '''
+        Purpose:
+            Test that a header that does not link to its predecessor is
+            rejected before any block is downloaded.
+    '''
+    remote.chain[2].last_hash = 'evil_hash'
+    blockchain = Blockchain()
+    with pytest.raises(Exception, match='proper last_hash reference'):
+        synchronize(blockchain, LocalPeer(remote))
+    assert(len(blockchain.chain) == 1)
+
+def test_synchronize_block_mismatch(remote):
+    '''
+        Purpose:
+            Test that a block whose data does not match its header is rejected.
+    '''
+    class TamperedPeer(LocalPeer):
+        def blocks(self, start, end):
+            blocks = super().blocks(start, end)
+            for block in blocks:
+                block.data = []
+            return blocks
+
+    with pytest.raises(Exception, match='does not match its header'):
+        synchronize(Blockchain(), TamperedPeer(remote))
+
+@pytest.fixture
+def node(monkeypatch, remote):
+    '''
+        Pytest Fixture for the node's flask app serving the remote chain,
+        reached by HttpPeer through the flask test client.
+    '''
+    monkeypatch.setenv('TRANSPORT', 'tcp')
+    monkeypatch.setattr(flask.Flask, 'run', lambda self, *args, **kwargs: None)
+    from backend import app
+    monkeypatch.setattr(app, 'blockchain', remote)
+    client = app.app.test_client()
+
+    class TestClientResponse:
+        def __init__(self, response):
+            self.response = response
+
+        def json(self):
+            return json.loads(self.response.data)
+
+    def get(url, params=None):
+        path = url[len('http://node'):]
+        return TestClientResponse(client.get(path, query_string=params))
+
+    monkeypatch.setattr(requests, 'get', get)
+    return HttpPeer('http://node')
+
+def test_synchronize_http_peer(remote, node):
+    '''
+        Purpose:
+            Test that blocks with transactions keep their hashes through the
+            http api, so a chain synchronizes from an HttpPeer.
+    '''
+    blockchain = Blockchain()
+    assert(synchronize(blockchain, node) == 5)
+    assert([block.hash for block in blockchain.chain] ==
+           [block.hash for block in remote.chain])
+    assert(blockchain.ledger.balances == remote.ledger.balances)
@@ -0,0 +1,141 @@
+# test_async_server.py
+
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from flask import Flask, Response, jsonify, request
+
+from backend.util.async_server import AsyncServer
+
+
+release = threading.Event()
+
+@pytest.fixture
+def base_url():
+    ''' Pytest Fixture for the url of an AsyncServer running a test app '''
+    app = Flask(__name__)
+    release.clear()
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return jsonify({'json': request.get_json(), 'args': request.args})
+
+    @app.route('/stream')
+    def stream():
+        return Response((str(i) for i in range(5)), mimetype='text/plain')
+
+    @app.route('/broken-stream/<int:chunks>')
+    def broken_stream(chunks):
+        def generate():
+            for i in range(chunks):
+                yield str(i)
+            raise Exception('broken stream')
+        return Response(generate(), mimetype='text/plain')
+
+    @app.route('/slow')
+    def slow():
+        release.wait(5)
+        return 'done'
+
+    server = AsyncServer(app, port=0, slow_paths=('/slow',))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.started.wait(5)
+    yield f'http://localhost:{server.port}'
+    release.set()
+    server.shutdown()
+    thread.join(5)
+
+def test_async_server_request(base_url):
+    response = requests.post(f'{base_url}/echo?foo=bar', json={'amount': 5})
+    assert(response.status_code == 200)
+    assert(response.json() == {'json': {'amount': 5}, 'args': {'foo': 'bar'}})
+    assert(requests.get(f'{base_url}/missing').status_code == 404)
+
+def test_async_server_streaming(base_url):
+    response = requests.get(f'{base_url}/stream')
+    assert(response.headers['Transfer-Encoding'] == 'chunked')
+    assert(response.text == '01234')
+
+def test_async_server_slow_path_does_not_block(base_url):
+    # Assert that requests are served while a slow path request is running.
+    slow = threading.Thread(target=requests.get, args=(f'{base_url}/slow',))
+    slow.start()
+    time.sleep(0.1)
+    start_time = time.time()
+    for _ in range(5):
+        assert(requests.post(f'{base_url}/echo', json={}).status_code == 200)
+    assert(time.time() - start_time < 2)
+    assert(slow.is_alive())
+    release.set()
+    slow.join(5)
+
+def raw_request(base_url, data):
+    ''' Send raw bytes to the server and return its response status line. '''
+    host, port = base_url[len('http://'):].split(':')
+    with socket.create_connection((host, int(port)), timeout=5) as connection:
+        connection.sendall(data)
+        return connection.makefile('rb').readline()
+
+def test_async_server_streaming_http_1_0(base_url):
+    # Assert that an HTTP/1.0 client gets the stream until the connection
+    # closes, without chunked encoding.
+    host, port = base_url[len('http://'):].split(':')
+    with socket.create_connection((host, int(port)), timeout=5) as connection:
+        connection.sendall(b'GET /stream HTTP/1.0\r\n\r\n')
+        response = connection.makefile('rb').read()
+    head, _, body = response.partition(b'\r\n\r\n')
+    assert(b'Transfer-Encoding' not in head)
+    assert(b'Connection: close' in head)
+    assert(body == b'01234')
+
+def test_async_server_app_error(base_url):
+    # Assert that an error before any body is sent is answered with a 500,
+    # and an error in the middle of a stream closes the connection.
+    assert(requests.get(f'{base_url}/broken-stream/0').status_code == 500)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        requests.get(f'{base_url}/broken-stream/2')
+    assert(requests.get(f'{base_url}/stream').text == '01234')
+
+def test_async_server_malformed_request(base_url):
+    # Assert that malformed requests are answered with a 400.
+    assert(raw_request(base_url, b'GARBAGE\r\n\r\n').startswith(
+        b'HTTP/1.1 400'))
+    assert(raw_request(
+        base_url, b'POST /echo HTTP/1.1\r\nContent-Length: x\r\n\r\n'
+    ).startswith(b'HTTP/1.1 400'))
+    assert(requests.get(f'{base_url}/stream').status_code == 200)
+
+def test_async_server_request_limits(base_url):
+    # Assert that requests above the size limits are rejected.
+    assert(raw_request(
+        base_url, b'GET /stream HTTP/1.1\r\nX: ' + b'a' * 10000 + b'\r\n\r\n'
+    ).startswith(b'HTTP/1.1 431'))
+    assert(raw_request(
+        base_url, b'GET /stream HTTP/1.1\r\n' + b'X: a\r\n' * 101 + b'\r\n'
+    ).startswith(b'HTTP/1.1 431'))
+    assert(raw_request(
+        base_url, b'POST /echo HTTP/1.1\r\nContent-Length: 100000000\r\n\r\n'
+    ).startswith(b'HTTP/1.1 413'))
+    assert(raw_request(
+        base_url, b'GET /' + b'a' * 10000 + b' HTTP/1.1\r\n\r\n'
+    ).startswith(b'HTTP/1.1 414'))
+
+def test_async_server_chunked_request(base_url):
+    # Assert that chunked request bodies are answered with a 501.
+    assert(raw_request(
+        base_url,
+        b'POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n0\r\n\r\n'
+    ).startswith(b'HTTP/1.1 501'))
+
+def test_async_server_is_slow():
+    # Assert that the paths below a slow path are slow too.
+    server = AsyncServer(Flask(__name__), slow_paths=('/blockchain/mine',))
+    assert(server.is_slow('/blockchain/mine'))
+    assert(server.is_slow('/blockchain/mine/jobs/abc/wait'))
+    assert(not server.is_slow('/blockchain/miner'))
+    assert(not server.is_slow('/blockchain'))
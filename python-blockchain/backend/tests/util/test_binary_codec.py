@@ -0,0 +1,41 @@
+# test_binary_codec.py
+
+import json
+
+import pytest
+
+from backend.util.binary_codec import encode, decode
+from backend.util.crypto_hash import crypto_hash
+from backend.wallet.wallet import Wallet
+
+
+def test_binary_codec_round_trip():
+    # Assert that values round-trip to their json form.
+    values = [
+        None, True, False, 0, -1, 2 ** 63 - 1, -2 ** 63, 2 ** 64, -2 ** 255,
+        1.5, '', 'foo', 'ünïcode', crypto_hash('foo'), 'A' * 64, '0' * 63,
+        [], [1, [2, 'three']], {}, {'a': {'b': [None]}},
+        (1, 2), {'signature': (2 ** 255, 3)},
+    ]
+    for value in values:
+        assert(decode(encode(value)) == json.loads(json.dumps(value)))
+
+def test_binary_codec_public_key():
+    # Assert that a PEM public key is stored as a 33 byte compressed point and
+    # restored to the same string.
+    public_key = Wallet().public_key
+    data = encode(public_key)
+    assert(len(data) == 34)
+    assert(decode(data) == public_key)
+
+def test_binary_codec_not_a_public_key():
+    pem = '-----BEGIN PUBLIC KEY-----\nnot-a-key\n-----END PUBLIC KEY-----\n'
+    assert(decode(encode(pem)) == pem)
+
+def test_binary_codec_invalid_data():
+    with pytest.raises(ValueError, match='trailing bytes'):
+        decode(encode(1) + b'\x00')
+    with pytest.raises(ValueError, match='Unknown tag'):
+        decode(b'\xff')
+    with pytest.raises(TypeError):
+        encode(object())
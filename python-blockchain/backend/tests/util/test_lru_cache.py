@@ -0,0 +1,35 @@
+# test_lru_cache.py
+
+from backend.util.lru_cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    # Assert that reading 'a' makes 'b' the least recently used entry.
+    assert(cache.get('a') == 1)
+    cache.put('c', 3)
+    assert('b' not in cache)
+    assert(cache.get('a') == 1)
+    assert(cache.get('c') == 3)
+    assert(len(cache) == 2)
+
+def test_lru_cache_counters():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.get('a')
+    cache.get('missing')
+    assert(cache.hits == 1)
+    assert(cache.misses == 1)
+    cache.clear()
+    assert(len(cache) == 0 and cache.hits == 0 and cache.misses == 0)
+
+def test_lru_cache_resize_and_pop():
+    cache = LRUCache(3)
+    for key in 'abc':
+        cache.put(key, key)
+    cache.resize(1)
+    assert(list(cache.entries) == ['c'])
+    assert(cache.pop('c') == 'c')
+    assert(cache.pop('c') is None)
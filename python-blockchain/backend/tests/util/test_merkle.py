@@ -0,0 +1,34 @@
+# test_merkle.py
+
+import hashlib
+
+from backend.util.crypto_hash import crypto_hash
+from backend.util.merkle import (
+    merkle_proof,
+    merkle_root,
+    node_hash,
+    verify_proof
+)
+
+
+def test_merkle_root():
+    # An odd node is promoted to the next level unchanged.
+    a, b, c = (crypto_hash(item) for item in 'abc')
+    assert(merkle_root(['a']) == a)
+    assert(merkle_root(['a', 'b', 'c']) == node_hash(node_hash(a, b), c))
+    assert(merkle_root([]) == hashlib.sha256(b'').hexdigest())
+
+def test_merkle_proof():
+    # Every item of trees of every shape up to 9 leaves has a valid proof.
+    for size in range(1, 10):
+        items = [{'id': i} for i in range(size)]
+        root = merkle_root(items)
+        for index, item in enumerate(items):
+            proof = merkle_proof(items, index)
+            assert(verify_proof(item, proof, root))
+            assert(not verify_proof({'id': -1}, proof, root))
+
+def test_merkle_proof_wrong_root():
+    items = ['a', 'b', 'c']
+    proof = merkle_proof(items, 1)
+    assert(not verify_proof('b', proof, merkle_root(['a', 'b'])))
@@ -0,0 +1,26 @@
+# test_prefix_hash.py
+
+from backend.util.crypto_hash import crypto_hash
+from backend.util.prefix_hash import PrefixHash
+
+
+def test_prefix_hash_matches_crypto_hash():
+    # Fixed arguments that sort before, after and (for numbers) amongst the
+    # integer arguments must all produce the crypto_hash output.
+    fixed_args = [
+        ('last_hash', [{'id': 'foo', 'output': {'a': 1}}]),
+        ('last_hash', 'test-data'),
+        ('last_hash', 7),
+        ('last_hash', -7),
+        ('last_hash', 1.5),
+        ('last_hash', None),
+        ('last_hash', {'foo': 'bar'}),
+    ]
+    for args in fixed_args:
+        prefix_hash = PrefixHash(*args)
+        for int_args in [(1, 2, 3), (1600000000000000000, 99, 4), (0, -1, 10)]:
+            assert(prefix_hash.hexdigest(*int_args) == crypto_hash(*args, *int_args))
+
+def test_prefix_hash_digest():
+    prefix_hash = PrefixHash('last_hash', ['data'])
+    assert(prefix_hash.digest(1, 2, 3).hex() == crypto_hash('last_hash', ['data'], 1, 2, 3))
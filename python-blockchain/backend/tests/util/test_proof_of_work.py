@@ -0,0 +1,34 @@
+# test_proof_of_work.py
+
+import hashlib
+
+from backend.util.hex_to_binary import hex_to_binary
+from backend.util.proof_of_work import (
+    difficulty_target, digest_meets_difficulty, hash_meets_difficulty)
+
+
+def test_hash_meets_difficulty_matches_hex_to_binary():
+    # Assert that the integer check agrees with the binary string check for
+    # full and truncated hashes across a range of difficulties.
+    hashes = ['0' * 64, '000fab' + 'f' * 58, '1' + '0' * 63, 'fff',
+              '0000000000000000bbbabc', '0', '']
+    for hash_hex in hashes:
+        for difficulty in range(-3, 70):
+            expected = hex_to_binary(hash_hex)[0:difficulty] == '0' * difficulty
+            assert(hash_meets_difficulty(hash_hex, difficulty) == expected)
+
+def test_digest_meets_difficulty():
+    for i in range(50):
+        digest = hashlib.sha256(str(i).encode('utf-8')).digest()
+        for difficulty in range(0, 12):
+            expected = (
+                hex_to_binary(digest.hex())[0:difficulty] == '0' * difficulty)
+            assert(digest_meets_difficulty(digest, difficulty) == expected)
+
+def test_difficulty_target_bounds():
+    assert(difficulty_target(0) == 1 << 256)
+    assert(difficulty_target(256) == 1)
+    assert(difficulty_target(257) == 0)
+
+def test_hash_meets_difficulty_not_hex():
+    assert(not hash_meets_difficulty('test-bad-hash', 1))
@@ -0,0 +1,53 @@
+from backend.blockchain.blockchain import Blockchain
+from backend.wallet.ledger import Ledger
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+from backend.config import STARTING_BALANCE
+
+
+def test_ledger_starting_balance():
+    assert(Ledger().balance('address') == STARTING_BALANCE)
+
+def test_ledger_matches_calculate_balance():
+    ''' Test that the ledger applies the same rules as calculate_balance. '''
+    blockchain = Blockchain()
+    wallet = Wallet(blockchain)
+    other_wallet = Wallet(blockchain)
+    blockchain.add_block([Transaction(wallet, other_wallet.address, 50).to_json()])
+    blockchain.add_block([
+        Transaction(other_wallet, wallet.address, 25).to_json(),
+        Transaction(Wallet(), wallet.address, 43).to_json(),
+        Transaction.reward_transaction(wallet).to_json()
+    ])
+    blockchain.add_block([Transaction(wallet, 'recipient', 10).to_json()])
+
+    ledger = Ledger()
+    for block in blockchain.chain:
+        ledger.apply_block(block)
+
+    for address in [wallet.address, other_wallet.address, 'recipient', 'unknown']:
+        assert(ledger.balance(address) ==
+               Wallet.calculate_balance(blockchain, address))
+
+def test_ledger_ignores_non_transaction_data():
+    blockchain = Blockchain()
+    blockchain.add_block('test-data')
+    ledger = Ledger()
+    ledger.apply_block(blockchain.chain[-1])
+    assert(ledger.balances == {})
+
+def test_ledger_revert():
+    ''' Test that reverting a block restores the balances before it. '''
+    blockchain = Blockchain()
+    wallet = Wallet(blockchain)
+    blockchain.add_block([Transaction(wallet, 'recipient', 50).to_json()])
+    ledger = Ledger()
+    ledger.apply_block(blockchain.chain[-1])
+    balances = dict(ledger.balances)
+
+    blockchain.add_block([Transaction(Wallet(), wallet.address, 10).to_json()])
+    undo = {}
+    ledger.apply_block(blockchain.chain[-1], undo)
+    assert(ledger.balances != balances)
+    ledger.revert(undo)
+    assert(ledger.balances == balances)
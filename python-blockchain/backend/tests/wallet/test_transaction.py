@@ -1,6 +1,8 @@
+import json
+
 import pytest
 
-from backend.wallet.transaction import Transaction
+from backend.wallet.transaction import Transaction, verified_signatures
 from backend.wallet.wallet import Wallet
 from backend.config import MINING_REWARD, MINING_REWARD_INPUT
 
@@ -132,3 +134,36 @@ def test_invalid_reward_transaction_invalid_amount():
     reward_trans.output[miner_wallet.address] = 9001
     with pytest.raises(Exception, match='Invalid mining reward'):
         Transaction.is_valid(reward_trans)
+
+def test_valid_transaction_verification_is_cached(monkeypatch):
+    trans = Transaction(Wallet(), 'recipient', 50)
+    Transaction.is_valid(trans)
+    assert(Transaction.verification_key(trans) in verified_signatures)
+
+    # Assert that a cached transaction is not verified again.
+    monkeypatch.setattr(
+        Wallet, 'verify_batch', lambda items: [False] * len(items))
+    Transaction.is_valid(trans)
+    monkeypatch.undo()
+
+    Transaction.invalidate_verification(trans)
+    assert(Transaction.verification_key(trans) not in verified_signatures)
+
+def test_changed_transaction_is_verified_again():
+    sender_wallet = Wallet()
+    trans = Transaction(sender_wallet, 'recipient', 50)
+    Transaction.is_valid(trans)
+    # Assert that changing the signed output misses the cache and fails
+    # verification.
+    trans.output['recipient'] = 40
+    trans.output[sender_wallet.address] += 10
+    with pytest.raises(Exception, match='Invalid Signature'):
+        Transaction.is_valid(trans)
+
+def test_transaction_bytes_round_trip():
+    trans = Transaction(Wallet(), 'recipient', 50)
+    restored = Transaction.from_bytes(trans.to_bytes())
+    assert(restored.to_json() == json.loads(json.dumps(trans.to_json())))
+    Transaction.is_valid(restored)
+    reward = Transaction.reward_transaction(Wallet())
+    assert(Transaction.from_bytes(reward.to_bytes()).to_json() == reward.to_json())
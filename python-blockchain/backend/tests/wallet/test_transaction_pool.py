@@ -1,5 +1,6 @@
 
 from backend.wallet.transaction_pool import TransactionPool
+from backend.wallet.ledger import Ledger
 from backend.wallet.transaction import Transaction
 from backend.wallet.wallet import Wallet
 from backend.blockchain.blockchain import Blockchain
@@ -28,3 +29,101 @@ def test_clear_blockchain_transactions():
     assert(not(trans1.id in trans_pool.transaction_map))
     # Assert that transaction 2 is NOT in the transaction map of the pool.
     assert(not(trans2.id in trans_pool.transaction_map))
+
+def test_admit_transactions():
+    trans_pool = TransactionPool()
+    valid_trans = Transaction(Wallet(), 'recipient', 1)
+    bad_signature = Transaction(Wallet(), 'recipient', 2)
+    bad_signature.input['signature'] = Wallet().sign(bad_signature.output)
+    bad_output = Transaction(Wallet(), 'recipient', 3)
+    bad_output.output['recipient'] = 9001
+    reward = Transaction.reward_transaction(Wallet())
+
+    admitted = trans_pool.admit_transactions(
+        [valid_trans, bad_signature, bad_output, reward])
+    assert(admitted == [valid_trans])
+    assert(list(trans_pool.transaction_map) == [valid_trans.id])
+
+def test_admit_transactions_malformed():
+    trans_pool = TransactionPool()
+    valid_trans = Transaction(Wallet(), 'recipient', 1)
+    bad_key = Transaction(Wallet(), 'recipient', 2)
+    bad_key.input['public_key'] = 'not a public key'
+    bad_signature = Transaction(Wallet(), 'recipient', 3)
+    bad_signature.input['signature'] = [1]
+
+    admitted = trans_pool.admit_transactions(
+        [bad_key, bad_signature, valid_trans])
+    assert(admitted == [valid_trans])
+
+def test_admit_transactions_ledger():
+    trans_pool = TransactionPool()
+    wallet = Wallet()
+    ledger = Ledger({wallet.address: 500})
+    stale = Transaction(wallet, 'recipient', 1)
+    valid_trans = Transaction(Wallet(), 'recipient', 1)
+
+    admitted = trans_pool.admit_transactions([stale, valid_trans], ledger)
+    assert(admitted == [valid_trans])
+
+def test_existing_transaction():
+    trans_pool = TransactionPool()
+    wallet = Wallet()
+    trans = Transaction(wallet, 'recipient', 1)
+    trans_pool.set_transaction(Transaction(Wallet(), 'recipient', 1))
+    trans_pool.set_transaction(trans)
+    assert(trans_pool.existing_transaction(wallet.address) == trans)
+    assert(trans_pool.existing_transaction('unknown') is None)
+
+    trans_pool.remove_transaction(trans.id)
+    assert(trans_pool.existing_transaction(wallet.address) is None)
+    assert(wallet.address not in trans_pool.address_map)
+
+def test_clear_block_transactions():
+    trans_pool = TransactionPool()
+    trans1 = Transaction(Wallet(), 'recipient', 1)
+    trans2 = Transaction(Wallet(), 'recipient', 2)
+    trans_pool.set_transaction(trans1)
+    trans_pool.set_transaction(trans2)
+
+    blockchain = Blockchain()
+    blockchain.add_block([trans1.to_json()])
+    trans_pool.clear_block_transactions(blockchain.chain[-1:])
+    # Assert that only the transaction of the given block is deleted.
+    assert(list(trans_pool.transaction_map) == [trans2.id])
+    assert(trans_pool.existing_transaction(trans1.input['address']) is None)
+
+def test_transaction_pool_evicts_lowest_priority():
+    trans_pool = TransactionPool(max_transactions=2)
+    trans1 = Transaction(Wallet(), 'recipient', 1)
+    trans2 = Transaction(Wallet(), 'recipient', 2)
+    trans3 = Transaction(Wallet(), 'recipient', 3)
+    assert(trans_pool.set_transaction(trans1))
+    assert(trans_pool.set_transaction(trans2, fee=5))
+    # Assert that with equal fees the most recent arrival is evicted.
+    assert(not trans_pool.set_transaction(trans3))
+    assert(set(trans_pool.transaction_map) == {trans1.id, trans2.id})
+    # Assert that a higher fee evicts the lowest fee transaction.
+    assert(trans_pool.set_transaction(trans3, fee=1))
+    assert(set(trans_pool.transaction_map) == {trans2.id, trans3.id})
+    assert(trans_pool.existing_transaction(trans1.input['address']) is None)
+
+def test_transaction_data_block_template():
+    trans_pool = TransactionPool()
+    trans1 = Transaction(Wallet(), 'recipient', 1)
+    trans2 = Transaction(Wallet(), 'recipient', 2)
+    trans3 = Transaction(Wallet(), 'recipient', 3)
+    trans_pool.set_transaction(trans1)
+    trans_pool.set_transaction(trans2, fee=5)
+    trans_pool.set_transaction(trans3)
+
+    # Assert that the template is ordered by fee, then by arrival.
+    template = trans_pool.transaction_data(limit=2)
+    assert([t['id'] for t in template] == [trans2.id, trans1.id])
+
+    size = trans_pool.sizes[trans2.id]
+    template = trans_pool.transaction_data(max_bytes=size)
+    assert([t['id'] for t in template] == [trans2.id])
+
+    # Assert that without limits every pooled transaction is returned.
+    assert(len(trans_pool.transaction_data()) == 3)
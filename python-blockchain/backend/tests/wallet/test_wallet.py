@@ -1,4 +1,4 @@
-from backend.wallet.wallet import Wallet
+from backend.wallet.wallet import Wallet, public_key_cache
 from backend.wallet.transaction import Transaction
 from backend.blockchain.blockchain import Blockchain
 from backend.config import STARTING_BALANCE
@@ -53,3 +53,47 @@ def test_calculate_balance():
     # Assert that the new calculated balance is equal to the expected balance.
     assert(Wallet.calculate_balance(
         blockchain, wallet.address) == EXPECTED_BALANCE)
+
+def test_calculate_balance_replace_chain():
+    '''
+        Test that the balance follows the chain after chain replacement and
+        deserialization.
+    '''
+    wallet = Wallet()
+    incoming = Blockchain()
+    amount = 50
+    incoming.add_block([Transaction(wallet, 'recipient', amount).to_json()])
+
+    blockchain = Blockchain()
+    assert(Wallet.calculate_balance(
+        blockchain, wallet.address) == STARTING_BALANCE)
+    blockchain.replace_chain(incoming.chain)
+    assert(Wallet.calculate_balance(
+        blockchain, wallet.address) == STARTING_BALANCE - amount)
+
+    restored = Blockchain.from_json(incoming.to_json())
+    assert(Wallet.calculate_balance(
+        restored, 'recipient') == STARTING_BALANCE + amount)
+
+def test_verify_batch():
+    ''' Test that a batch verification returns a result per signature. '''
+    data = {'foo': 'test_data'}
+    wallet = Wallet()
+    signature = wallet.sign(data)
+    items = [
+        (wallet.public_key, data, signature),
+        (Wallet().public_key, data, signature),
+        (wallet.public_key, {'foo': 'other_data'}, signature),
+        (wallet.public_key, data, signature)
+    ]
+    assert(Wallet.verify_batch(items) == [True, False, False, True])
+
+def test_load_public_key_cache():
+    ''' Test that a public key is deserialized once and then cached. '''
+    wallet = Wallet()
+    misses = public_key_cache.misses
+    hits = public_key_cache.hits
+    first = Wallet.load_public_key(wallet.public_key)
+    assert(Wallet.load_public_key(wallet.public_key) is first)
+    assert(public_key_cache.misses == misses + 1)
+    assert(public_key_cache.hits == hits + 1)
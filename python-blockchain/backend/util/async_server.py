@@ -0,0 +1,272 @@
+# async_server.py
+
+import asyncio
+import io
+import sys
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+# Responses with these status codes never carry a body.
+NO_BODY_STATUSES = ('1', '204', '304')
+
+# Limits on the size of a request.
+MAX_LINE_BYTES = 8192
+MAX_HEADER_COUNT = 100
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+
+class HttpError(Exception):
+    ''' A request that is answered with an error status. '''
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncServer:
+    '''
+        asyncio HTTP/1.1 server for a WSGI application such as the Flask app.
+
+        The event loop only parses requests and writes responses. The WSGI
+        application runs on thread pools: requests for slow_paths (e.g.
+        mining), and the paths below them, get their own pool, so a long
+        Proof of Work search or a blocking publish never holds up the other
+        requests.
+    '''
+    def __init__(self, app, host='localhost', port=5000, slow_paths=(),
+                 workers=8, slow_workers=2, max_body_bytes=MAX_BODY_BYTES):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.host = host
+        self.port = port
+        self.slow_paths = set(slow_paths)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.slow_executor = ThreadPoolExecutor(max_workers=slow_workers)
+        self.started = threading.Event()
+        self.loop = None
+        self.server = None
+
+    def is_slow(self, path):
+        ''' Whether a path is one of the slow_paths or below one of them. '''
+        return any(
+            path == slow_path or path.startswith(slow_path + '/')
+            for slow_path in self.slow_paths)
+
+    def serve_forever(self):
+        ''' Run the server until shutdown is called. '''
+        asyncio.run(self._serve())
+
+    def shutdown(self):
+        ''' Stop a server running in another thread. '''
+        self.loop.call_soon_threadsafe(self.server.close)
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, limit=MAX_LINE_BYTES)
+        # Resolve the port when an ephemeral port 0 was requested.
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        print(f'\n -- Async server listening on http://{self.host}:{self.port}')
+        try:
+            await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+    async def handle_connection(self, reader, writer):
+        ''' Serve the requests of a keep-alive connection. '''
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except HttpError as e:
+                    await self.respond_error(e.status, e, writer)
+                    break
+                if request is None:
+                    break
+                keep_alive = await self.respond(request, writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        '''
+            Read a request into (method, target, version, headers, body).
+            Returns None when the connection was closed.
+            Raises HttpError for a malformed request, a request above the
+            size limits, or a chunked request body, which is not supported.
+        '''
+        request_line = await self.read_line(reader, '414 URI Too Long')
+        if not request_line.strip():
+            return None
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+            raise HttpError('400 Bad Request', 'Malformed request line')
+        method, target, version = parts
+
+        headers = []
+        while True:
+            line = await self.read_line(
+                reader, '431 Request Header Fields Too Large')
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= MAX_HEADER_COUNT:
+                raise HttpError(
+                    '431 Request Header Fields Too Large', 'Too many headers')
+            name, separator, value = line.decode('latin-1').partition(':')
+            if not separator or not name.strip():
+                raise HttpError('400 Bad Request', 'Malformed header line')
+            headers.append((name.strip(), value.strip()))
+
+        fields = dict((name.lower(), value) for name, value in headers)
+        if fields.get('transfer-encoding', 'identity').lower() != 'identity':
+            raise HttpError('501 Not Implemented',
+                            'Chunked request bodies are not supported')
+        length = fields.get('content-length', '0')
+        if not length.isdigit():
+            raise HttpError('400 Bad Request', 'Invalid Content-Length')
+        length = int(length)
+        if length > self.max_body_bytes:
+            raise HttpError('413 Payload Too Large', 'Request body too large')
+        body = await reader.readexactly(length) if length else b''
+        return method, target, version, headers, body
+
+    async def read_line(self, reader, status):
+        ''' Read a line of the request head, of at most MAX_LINE_BYTES. '''
+        try:
+            return await reader.readline()
+        except ValueError:
+            raise HttpError(status, 'Line too long')
+
+    def environ(self, method, target, version, headers, body):
+        ''' Build the WSGI environ of a request. '''
+        path, _, query = target.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, 'latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': version,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers:
+            key = name.upper().replace('-', '_')
+            if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[key] = value
+            else:
+                environ[f'HTTP_{key}'] = value
+        return environ
+
+    def call_app(self, environ):
+        ''' Run the WSGI app and return (status, headers, body iterable). '''
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+
+        body = self.app(environ, start_response)
+        return response['status'], response['headers'], body
+
+    async def close_body(self, app_body, executor):
+        ''' Release the body iterable of the app, as WSGI requires. '''
+        if hasattr(app_body, 'close'):
+            await self.loop.run_in_executor(executor, app_body.close)
+
+    async def respond_error(self, status, error, writer):
+        ''' Answer a request that could not be read and close the connection. '''
+        body = f'{error}\n'.encode('latin-1')
+        lines = [
+            f'HTTP/1.1 {status}',
+            'Content-Type: text/plain',
+            f'Content-Length: {len(body)}',
+            'Connection: close'
+        ]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def respond(self, request, writer):
+        '''
+            Run the app for a request on its thread pool and write the
+            response, streaming bodies of unknown length in chunks.
+            Returns whether the connection can be kept alive.
+
+            An error of the app before the response headers are sent is
+            answered with a 500. After that, e.g. in the middle of a stream,
+            the connection is closed, leaving the response incomplete.
+        '''
+        method, target, version, headers, body = request
+        environ = self.environ(method, target, version, headers, body)
+        executor = (self.slow_executor if self.is_slow(environ['PATH_INFO'])
+                    else self.executor)
+
+        app_body = None
+        try:
+            status, response_headers, app_body = await self.loop.run_in_executor(
+                executor, self.call_app, environ)
+            iterator = iter(app_body)
+            # Generators may do work per chunk, so advance them off the
+            # event loop as well. The first chunk is read before the headers
+            # are sent.
+            chunk = await self.loop.run_in_executor(
+                executor, next, iterator, None)
+        except Exception as e:
+            print(f'\n -- Error serving {method} {target}: {e}')
+            await self.close_body(app_body, executor)
+            await self.respond_error(
+                '500 Internal Server Error', 'Internal Server Error', writer)
+            return False
+
+        header_names = {name.lower() for name, _ in response_headers}
+        has_body = (method != 'HEAD' and
+                    not status.startswith(NO_BODY_STATUSES))
+        # HTTP/1.0 clients do not support chunked bodies: closing the
+        # connection marks the end of the body instead.
+        keep_alive = (version == 'HTTP/1.1' and
+                      environ.get('HTTP_CONNECTION', '').lower() != 'close')
+        chunked = (keep_alive and has_body and
+                   'content-length' not in header_names)
+
+        lines = [f'{version} {status}']
+        lines.extend(f'{name}: {value}' for name, value in response_headers)
+        if chunked:
+            lines.append('Transfer-Encoding: chunked')
+        if not keep_alive:
+            lines.append('Connection: close')
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+        try:
+            while chunk is not None:
+                if has_body and chunk:
+                    if chunked:
+                        writer.write(f'{len(chunk):x}\r\n'.encode('latin-1'))
+                        writer.write(chunk + b'\r\n')
+                    else:
+                        writer.write(chunk)
+                    await writer.drain()
+                chunk = await self.loop.run_in_executor(
+                    executor, next, iterator, None)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            print(f'\n -- Error streaming {method} {target}: {e}')
+            return False
+        finally:
+            await self.close_body(app_body, executor)
+
+        if chunked:
+            writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        return keep_alive
@@ -0,0 +1,194 @@
+# binary_codec.py
+
+import re
+import struct
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from backend.util.lru_cache import LRUCache
+
+# Every value is written as a one byte tag followed by its payload.
+NONE = 0
+TRUE = 1
+FALSE = 2
+INT = 3         # 8 byte signed integer.
+BIG_INT = 4     # Length-prefixed signed integer, e.g. signature values.
+FLOAT = 5       # 8 byte double.
+STR = 6         # Length-prefixed utf-8 string.
+HASH = 7        # Raw 32 bytes of a 64 character lowercase hex string.
+PUBLIC_KEY = 8  # 33 byte compressed point of a PEM secp256k1 public key.
+LIST = 9        # Length-prefixed list of values.
+DICT = 10       # Length-prefixed list of (string key, value) pairs.
+
+TAG = struct.Struct('>B')
+LENGTH = struct.Struct('>I')
+INT64 = struct.Struct('>q')
+FLOAT64 = struct.Struct('>d')
+
+HEX_HASH = re.compile(r'[0-9a-f]{64}')
+PEM_PREFIX = '-----BEGIN PUBLIC KEY-----'
+
+# PEM string -> compressed point, and back. Wallets repeat across the chain,
+# so each key is converted once.
+compressed_keys = LRUCache(4096)
+pem_keys = LRUCache(4096)
+
+
+def compress_public_key(pem):
+    '''
+        Return the compressed point of a PEM secp256k1 public key, or None
+        when the key would not be restored to exactly the same string.
+    '''
+    point = compressed_keys.get(pem)
+    if point is None:
+        try:
+            public_key = serialization.load_pem_public_key(
+                pem.encode('utf-8'), default_backend())
+            if not isinstance(public_key.curve, ec.SECP256K1):
+                return None
+            point = public_key.public_bytes(
+                encoding=serialization.Encoding.X962,
+                format=serialization.PublicFormat.CompressedPoint)
+        except Exception:
+            return None
+        if decompress_public_key(point) != pem:
+            return None
+        compressed_keys.put(pem, point)
+    return point
+
+def decompress_public_key(point):
+    ''' Return the PEM string of a compressed secp256k1 public key. '''
+    pem = pem_keys.get(point)
+    if pem is None:
+        public_key = ec.EllipticCurvePublicKey.from_encoded_point(
+            ec.SECP256K1(), point)
+        pem = public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode('utf-8')
+        pem_keys.put(point, pem)
+    return pem
+
+
+def _encode_str(value, parts):
+    data = value.encode('utf-8')
+    parts.append(LENGTH.pack(len(data)))
+    parts.append(data)
+
+def _encode(value, parts):
+    if value is None:
+        parts.append(TAG.pack(NONE))
+    elif value is True:
+        parts.append(TAG.pack(TRUE))
+    elif value is False:
+        parts.append(TAG.pack(FALSE))
+    elif isinstance(value, int):
+        if -2 ** 63 <= value < 2 ** 63:
+            parts.append(TAG.pack(INT) + INT64.pack(value))
+        else:
+            data = value.to_bytes(
+                (value.bit_length() + 8) // 8, 'big', signed=True)
+            parts.append(TAG.pack(BIG_INT) + LENGTH.pack(len(data)))
+            parts.append(data)
+    elif isinstance(value, float):
+        parts.append(TAG.pack(FLOAT) + FLOAT64.pack(value))
+    elif isinstance(value, str):
+        if len(value) == 64 and HEX_HASH.fullmatch(value):
+            parts.append(TAG.pack(HASH) + bytes.fromhex(value))
+            return
+        if value.startswith(PEM_PREFIX):
+            point = compress_public_key(value)
+            if point is not None:
+                parts.append(TAG.pack(PUBLIC_KEY) + point)
+                return
+        parts.append(TAG.pack(STR))
+        _encode_str(value, parts)
+    elif isinstance(value, (list, tuple)):
+        parts.append(TAG.pack(LIST) + LENGTH.pack(len(value)))
+        for item in value:
+            _encode(item, parts)
+    elif isinstance(value, dict):
+        parts.append(TAG.pack(DICT) + LENGTH.pack(len(value)))
+        for key, item in value.items():
+            _encode_str(key, parts)
+            _encode(item, parts)
+    else:
+        raise TypeError(f'Cannot encode value of type {type(value).__name__}')
+
+def encode(value):
+    '''
+        Encode a json-serializable value into the compact binary format.
+        Tuples are encoded as lists, as in json.
+    '''
+    parts = []
+    _encode(value, parts)
+    return b''.join(parts)
+
+
+def _decode_str(data, offset):
+    (length,) = LENGTH.unpack_from(data, offset)
+    offset += LENGTH.size
+    return bytes(data[offset:offset + length]).decode('utf-8'), offset + length
+
+def _decode(data, offset):
+    (tag,) = TAG.unpack_from(data, offset)
+    offset += TAG.size
+
+    if tag == NONE:
+        return None, offset
+    if tag == TRUE:
+        return True, offset
+    if tag == FALSE:
+        return False, offset
+    if tag == INT:
+        return INT64.unpack_from(data, offset)[0], offset + INT64.size
+    if tag == BIG_INT:
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        value = int.from_bytes(data[offset:offset + length], 'big', signed=True)
+        return value, offset + length
+    if tag == FLOAT:
+        return FLOAT64.unpack_from(data, offset)[0], offset + FLOAT64.size
+    if tag == STR:
+        return _decode_str(data, offset)
+    if tag == HASH:
+        return bytes(data[offset:offset + 32]).hex(), offset + 32
+    if tag == PUBLIC_KEY:
+        return decompress_public_key(bytes(data[offset:offset + 33])), offset + 33
+    if tag == LIST:
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        items = []
+        for _ in range(length):
+            item, offset = _decode(data, offset)
+            items.append(item)
+        return items, offset
+    if tag == DICT:
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        items = {}
+        for _ in range(length):
+            key, offset = _decode_str(data, offset)
+            items[key], offset = _decode(data, offset)
+        return items, offset
+    raise ValueError(f'Unknown tag {tag} at offset {offset - TAG.size}')
+
+def decode(data):
+    ''' Decode bytes of the compact binary format back into a json value. '''
+    value, offset = _decode(memoryview(data), 0)
+    if offset != len(data):
+        raise ValueError(f'{len(data) - offset} trailing bytes after value')
+    return value
+
+
+def main():
+    value = {'hash': 'a' * 64, 'amount': 15, 'signature': (2 ** 255, 3)}
+    data = encode(value)
+    print(f'encode({value}): {data.hex()}')
+    print(f'decode(data): {decode(data)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# lru_cache.py
+
+import threading
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    '''
+        Bounded, thread-safe mapping that evicts the least recently used
+        entry once it holds maxsize entries. Counts hits and misses of get.
+    '''
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return (f'LRUCache(maxsize={self.maxsize}, size={len(self)}, '
+                f'hits={self.hits}, misses={self.misses})')
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        ''' Return the value for key and mark it as the most recently used. '''
+        with self.lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        ''' Set the value for key, evicting the least recently used entry. '''
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        ''' Remove the entry for key and return its value. '''
+        with self.lock:
+            return self.entries.pop(key, default)
+
+    def resize(self, maxsize):
+        ''' Change the bound of the cache, evicting entries as needed. '''
+        with self.lock:
+            self.maxsize = maxsize
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        ''' Remove all entries and reset the counters. '''
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def main():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    print(f"cache.get('b'): {cache.get('b')}")
+    print(f'cache: {cache}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# merkle.py
+
+import hashlib
+
+from backend.util.crypto_hash import crypto_hash
+
+LEFT = 'left'
+RIGHT = 'right'
+
+
+def leaf_hash(item):
+    ''' Hash of a leaf of the tree: the crypto_hash of the item. '''
+    return crypto_hash(item)
+
+def node_hash(left, right):
+    ''' Hash of an inner node: the sha-256 of its children's digests. '''
+    return hashlib.sha256(bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def merkle_levels(items):
+    '''
+        Return the levels of the merkle tree of the items, from the leaf
+        hashes up to the root. A node without a sibling is promoted to the
+        next level unchanged.
+    '''
+    level = [leaf_hash(item) for item in items]
+    levels = [level]
+    while len(level) > 1:
+        level = [
+            node_hash(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ]
+        levels.append(level)
+    return levels
+
+def merkle_root(items):
+    ''' Return the merkle root of a list of json-serializable items. '''
+    if not items:
+        return hashlib.sha256(b'').hexdigest()
+    return merkle_levels(items)[-1][0]
+
+
+def merkle_proof(items, index):
+    '''
+        Return the inclusion proof of items[index]: the [hash, side] pairs of
+        its siblings from the leaf up to the root, where side tells whether
+        the sibling is on the left or on the right.
+    '''
+    if not 0 <= index < len(items):
+        raise IndexError(f'No item at index {index}')
+    proof = []
+    for level in merkle_levels(items)[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append([level[sibling], LEFT if sibling < index else RIGHT])
+        index //= 2
+    return proof
+
+def verify_proof(item, proof, root):
+    ''' Check that an inclusion proof links item to the merkle root. '''
+    node = leaf_hash(item)
+    for sibling, side in proof:
+        if side == LEFT:
+            node = node_hash(sibling, node)
+        elif side == RIGHT:
+            node = node_hash(node, sibling)
+        else:
+            return False
+    return node == root
+
+
+def main():
+    items = ['a', 'b', 'c', 'd', 'e']
+    root = merkle_root(items)
+    proof = merkle_proof(items, 4)
+    print(f'merkle_root({items}): {root}')
+    print(f'merkle_proof(items, 4): {proof}')
+    print(f'verify_proof: {verify_proof(items[4], proof, root)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# prefix_hash.py
+
+import hashlib
+import json
+
+from backend.util.crypto_hash import crypto_hash, utf8
+
+# json.dumps of an integer always starts with one of these characters.
+INT_FIRST_CHARS = ('-', '9')
+
+
+class PrefixHash:
+    '''
+        Incremental version of crypto_hash for when most arguments are fixed
+        and a few integer arguments change on every call, as with a block's
+        last_hash and data versus its timestamp, nonce and difficulty while
+        mining.
+
+        crypto_hash hashes the sorted json strings of its arguments. A fixed
+        string that starts below '-' always sorts before a json integer and
+        one that starts above '9' always sorts after it, so the fixed
+        arguments are serialized once and split into a head, kept as a
+        reusable sha256 state, and a tail of pre-encoded bytes. Each call only
+        serializes the integers. Fixed arguments that could sort amongst the
+        integers fall back to the full sort, so the output is always
+        identical to crypto_hash(*fixed_args, *int_args).
+    '''
+    def __init__(self, *fixed_args):
+        low, high = INT_FIRST_CHARS
+        self.fixed_strs = sorted(map(lambda data: json.dumps(data), fixed_args))
+        self.exact = not any(low <= s[0] <= high for s in self.fixed_strs)
+
+        head = ''.join(s for s in self.fixed_strs if s[0] < low)
+        tail = ''.join(s for s in self.fixed_strs if s[0] > high)
+        self.head_state = hashlib.sha256(utf8(head))
+        self.tail = utf8(tail)
+
+    def digest(self, *int_args):
+        ''' Return the raw sha-256 digest for the given integer arguments. '''
+        int_strs = sorted(map(str, int_args))
+        if not self.exact:
+            joined_data = ''.join(sorted(self.fixed_strs + int_strs))
+            return hashlib.sha256(utf8(joined_data)).digest()
+
+        state = self.head_state.copy()
+        state.update(utf8(''.join(int_strs)))
+        state.update(self.tail)
+        return state.digest()
+
+    def hexdigest(self, *int_args):
+        ''' Return the hex sha-256 digest for the given integer arguments. '''
+        return self.digest(*int_args).hex()
+
+
+def main():
+    prefix_hash = PrefixHash('last_hash', [{'id': 'foo'}])
+    print(f'prefix_hash.hexdigest(1, 2, 3): {prefix_hash.hexdigest(1, 2, 3)}')
+    print("crypto_hash('last_hash', [{'id': 'foo'}], 1, 2, 3): "
+          f"{crypto_hash('last_hash', [{'id': 'foo'}], 1, 2, 3)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# proof_of_work.py
+
+from backend.util.crypto_hash import crypto_hash
+
+DIGEST_BITS = 256
+
+
+def difficulty_target(difficulty):
+    '''
+        Return the integer target for a 256 bit digest: a digest meets the
+        difficulty when its value is below the target, which is the same as
+        having difficulty leading zero bits.
+    '''
+    if difficulty > DIGEST_BITS:
+        return 0
+    return 1 << (DIGEST_BITS - max(difficulty, 0))
+
+
+def block_work(difficulty):
+    '''
+        Return the work of a block: the expected number of hashes needed to
+        meet its difficulty. Chains are compared by their total work.
+    '''
+    return 2 ** max(difficulty, 0)
+
+
+def digest_meets_difficulty(digest, difficulty):
+    '''
+        Check the leading zero's Proof of Work requirement on a raw sha-256
+        digest.
+    '''
+    return int.from_bytes(digest, 'big') < difficulty_target(difficulty)
+
+
+def hash_meets_difficulty(hash_hex, difficulty):
+    '''
+        Check the leading zero's Proof of Work requirement on a hex hash.
+        Equivalent to hex_to_binary(hash_hex)[0:difficulty] == '0' * difficulty
+        for hex hashes of any length, without building the binary string.
+        A hash that is not a hex string never meets the requirement.
+    '''
+    bits = 4 * len(hash_hex)
+    if difficulty <= 0:
+        # A negative slice end keeps all but the last bits, and only an empty
+        # slice can equal the empty string on the other side.
+        return difficulty == 0 or bits + difficulty <= 0
+    if difficulty > bits:
+        return False
+    try:
+        return int(hash_hex, 16) >> (bits - difficulty) == 0
+    except ValueError:
+        return False
+
+
+def main():
+    hash_hex = crypto_hash('foo')
+    print(f'hash_hex: {hash_hex}')
+    for difficulty in range(1, 5):
+        print(f'hash_meets_difficulty(hash_hex, {difficulty}): '
+              f'{hash_meets_difficulty(hash_hex, difficulty)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# ledger.py
+
+from backend.config import STARTING_BALANCE
+
+
+def block_transactions(block):
+    '''
+        Return the serialized transactions of a block. Data that is not a
+        list of transactions carries none.
+    '''
+    if not isinstance(block.data, list):
+        return []
+    return [trans for trans in block.data if isinstance(trans, dict)]
+
+
+class Ledger:
+    '''
+        Running address -> balance map over a sequence of blocks.
+
+        Applies the same rules as Wallet.calculate_balance, one transaction at
+        a time, so a balance is available without re-scanning the chain:
+            - A transaction resets its sender's balance to the sender's own
+              output (the change of the transaction).
+            - Every other output adds its amount to that address's balance.
+            - Addresses that never appeared have the STARTING_BALANCE.
+    '''
+    def __init__(self, balances=None):
+        self.balances = dict(balances or {})
+
+    def __repr__(self):
+        return f'Ledger: {self.balances}'
+
+    def balance(self, address):
+        ''' Return the balance of the given address. '''
+        return self.balances.get(address, STARTING_BALANCE)
+
+    def apply_transaction(self, trans_json, undo=None):
+        '''
+            Apply a serialized transaction to the balances.
+            undo - dict: when given, collects the balance each changed
+                   address had before, or None if it had none, for revert.
+            Returns a dict of the change of balance of each output address.
+        '''
+        sender = trans_json['input']['address']
+        deltas = {}
+        for address, amount in trans_json['output'].items():
+            if undo is not None and address not in undo:
+                undo[address] = self.balances.get(address)
+            balance = self.balance(address)
+            if address == sender:
+                self.balances[address] = amount
+            else:
+                self.balances[address] = balance + amount
+            deltas[address] = self.balances[address] - balance
+        return deltas
+
+    def apply_block(self, block, undo=None):
+        ''' Apply all transactions of a block. '''
+        for trans_json in block_transactions(block):
+            self.apply_transaction(trans_json, undo)
+
+    def revert(self, undo):
+        ''' Restore the balances collected in undo by apply_block. '''
+        for address, balance in undo.items():
+            if balance is None:
+                self.balances.pop(address, None)
+            else:
+                self.balances[address] = balance
+
+    def copy(self):
+        return Ledger(self.balances)
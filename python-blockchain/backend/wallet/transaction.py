@@ -1,8 +1,17 @@
 import time
 import uuid
 
+from backend.util import binary_codec
+from backend.util.crypto_hash import crypto_hash
+from backend.util.lru_cache import LRUCache
 from backend.wallet.wallet import Wallet
-from backend.config import MINING_REWARD, MINING_REWARD_INPUT
+from backend.config import (
+    MINING_REWARD, MINING_REWARD_INPUT, VERIFIED_SIGNATURE_CACHE_SIZE)
+
+# Verification keys of transactions whose signature passed verification, so
+# the same transaction is not verified again on every pool admission, block
+# and chain validation.
+verified_signatures = LRUCache(VERIFIED_SIGNATURE_CACHE_SIZE)
 
 
 class Transaction:
@@ -99,13 +108,26 @@ class Transaction:
         '''
         return Transaction(**trans_json)
 
+    def to_bytes(self):
+        ''' Serialize a Transaction object into the compact binary format. '''
+        return binary_codec.encode([self.id, self.output, self.input])
+
+    @staticmethod
+    def from_bytes(trans_bytes):
+        ''' De-serialize a transaction from the compact binary format. '''
+        id, output, input = binary_codec.decode(trans_bytes)
+        return Transaction(id=id, output=output, input=input)
+
     @staticmethod
-    def is_valid(transaction):
+    def is_valid(transaction, verify_signature=True):
         '''
             Validate a transaction and raise exception for invalid transaction.
             Validating transactions involves checking that the total currency
             sent to the recipient is correct, and that the signature itself is
             correct according to the public key and transaction output.
+
+            With verify_signature=False only the currency is checked, and the
+            caller verifies the signature with Transaction.verify_signatures.
         '''
         # First check if transaction is actually a mining reward transaction.
         # If so, then validate that it is in the correct MINING REWARD format.
@@ -118,11 +140,74 @@ class Transaction:
         total_output = sum(transaction.output.values())
         if transaction.input['amount'] != total_output:
             raise Exception('Invalid transaction output values')
-        if not Wallet.verify(
-            transaction.input['public_key'],
-            transaction.output,
-            transaction.input['signature']
-        ):
+        if verify_signature and not Transaction.verify_signature_batch(
+                [transaction])[0]:
+            raise Exception('Invalid Signature')
+
+    @staticmethod
+    def verification_key(transaction):
+        '''
+            Key of a transaction in verified_signatures: its id, signature
+            and a digest of the public key and output it was signed over.
+            Any change to the signed contents gives a different key.
+        '''
+        (r, s) = transaction.input['signature']
+        output_digest = crypto_hash(
+            transaction.input['public_key'], transaction.output)
+        return (transaction.id, r, s, output_digest)
+
+    @staticmethod
+    def invalidate_verification(transaction=None):
+        '''
+            Forget the verified signature of a transaction, or of all
+            transactions when none is given.
+        '''
+        if transaction is None:
+            verified_signatures.clear()
+        else:
+            verified_signatures.pop(Transaction.verification_key(transaction))
+
+    @staticmethod
+    def verify_signature_batch(transactions):
+        '''
+            Verify the signatures of many non-reward transactions as a batch.
+            Transactions found in verified_signatures are not verified again.
+            Returns a list with the result for each transaction: a malformed
+            signature only fails its own transaction.
+        '''
+        keys = []
+        for trans in transactions:
+            try:
+                keys.append(Transaction.verification_key(trans))
+            except (TypeError, ValueError):
+                keys.append(None)
+        results = [
+            key is not None and verified_signatures.get(key, False)
+            for key in keys
+        ]
+        unverified = [
+            i for i, verified in enumerate(results)
+            if not verified and keys[i] is not None
+        ]
+
+        verified = Wallet.verify_batch([
+            (transactions[i].input['public_key'], transactions[i].output,
+             transactions[i].input['signature'])
+            for i in unverified
+        ])
+        for i, valid in zip(unverified, verified):
+            results[i] = valid
+            if valid:
+                verified_signatures.put(keys[i], True)
+        return results
+
+    @staticmethod
+    def verify_signatures(transactions):
+        '''
+            Verify the signatures of many non-reward transactions as a batch
+            and raise if any of them is invalid.
+        '''
+        if not all(Transaction.verify_signature_batch(transactions)):
             raise Exception('Invalid Signature')
 
     @staticmethod
@@ -1,35 +1,185 @@
+import heapq
+import itertools
+import json
+import threading
+
+from backend.wallet.transaction import Transaction
+from backend.config import MINING_REWARD_INPUT, MEMPOOL_MAX_TRANSACTIONS
+
 
 class TransactionPool:
-    def __init__(self):
+    def __init__(self, max_transactions=MEMPOOL_MAX_TRANSACTIONS):
+        '''
+            transaction_map - dict: transaction id -> transaction.
+            address_map - dict: sender address -> ids of the transactions of
+                                that sender, in the order they were set.
+            priorities - dict: transaction id -> (fee, arrival) priority.
+                               Earlier arrivals have a higher arrival value.
+            sizes - dict: transaction id -> size of its json in bytes.
+            heap - list: (fee, arrival, id) min-heap of the priorities. Entries
+                         of removed transactions are skipped lazily.
+            lock - RLock: guards the maps against the background miner
+                          reading a block template while requests write.
+        '''
+        self.max_transactions = max_transactions
         self.transaction_map = {}
+        self.address_map = {}
+        self.priorities = {}
+        self.sizes = {}
+        self.heap = []
+        self.arrivals = itertools.count()
+        self.lock = threading.RLock()
 
-    def set_transaction(self, trans):
-        ''' Set a transaction in the transaction pool '''
-        self.transaction_map[trans.id] = trans
+    def set_transaction(self, trans, fee=0):
+        '''
+            Set a transaction in the transaction pool.
+            fee - priority of the transaction, on top of its arrival time.
+            Re-setting a pooled transaction keeps its arrival and higher fee.
+            When the pool is full, the lowest priority transaction is evicted.
+            Returns whether the transaction is in the pool afterwards.
+        '''
+        with self.lock:
+            if trans.id in self.transaction_map:
+                old_fee, arrival = self.priorities[trans.id]
+                fee = max(fee, old_fee)
+                self.remove_transaction(trans.id)
+            else:
+                arrival = -next(self.arrivals)
+
+            self.transaction_map[trans.id] = trans
+            self.address_map.setdefault(trans.input['address'], {})[trans.id] = None
+            self.priorities[trans.id] = (fee, arrival)
+            self.sizes[trans.id] = len(json.dumps(trans.to_json()))
+            heapq.heappush(self.heap, (fee, arrival, trans.id))
+
+            while len(self.transaction_map) > self.max_transactions:
+                self.evict_lowest_priority()
+            return trans.id in self.transaction_map
+
+    def evict_lowest_priority(self):
+        '''
+            Remove the transaction with the lowest fee, and among equal fees
+            the most recent arrival. Returns the evicted transaction.
+        '''
+        with self.lock:
+            while self.heap:
+                fee, arrival, trans_id = heapq.heappop(self.heap)
+                if self.priorities.get(trans_id) == (fee, arrival):
+                    trans = self.transaction_map[trans_id]
+                    self.remove_transaction(trans_id)
+                    return trans
+
+    def remove_transaction(self, trans_id):
+        ''' Remove a transaction from the transaction pool if it is present. '''
+        with self.lock:
+            trans = self.transaction_map.pop(trans_id, None)
+            if trans is None:
+                return
+            address = trans.input['address']
+            trans_ids = self.address_map[address]
+            del trans_ids[trans_id]
+            if not trans_ids:
+                del self.address_map[address]
+            del self.priorities[trans_id]
+            del self.sizes[trans_id]
+
+            # Rebuild the heap once most of its entries are stale.
+            if len(self.heap) > 2 * len(self.priorities) + 64:
+                self.heap = [
+                    (fee, arrival, trans_id)
+                    for trans_id, (fee, arrival) in self.priorities.items()
+                ]
+                heapq.heapify(self.heap)
+
+    def admit_transactions(self, transactions, ledger=None):
+        '''
+            Validate transactions and set the valid ones in the transaction
+            pool. Mining rewards are never pooled, and signatures are verified
+            as a single batch. Given the ledger of the chain, transactions
+            whose input amount is not the sender's balance are rejected.
+            Returns the list of admitted transactions.
+        '''
+        candidates = []
+        for trans in transactions:
+            try:
+                if trans.input == MINING_REWARD_INPUT:
+                    raise Exception('Mining rewards cannot be pooled')
+                if (ledger is not None and
+                        ledger.balance(trans.input['address']) !=
+                        trans.input['amount']):
+                    raise Exception('Invalid input amount')
+                Transaction.is_valid(trans, verify_signature=False)
+            except Exception as e:
+                print(f'\n -- Rejected transaction {trans.id}: {e}')
+                continue
+            candidates.append(trans)
+
+        results = Transaction.verify_signature_batch(candidates)
+        admitted = []
+        for trans, valid in zip(candidates, results):
+            if not valid:
+                print(f'\n -- Rejected transaction {trans.id}: Invalid Signature')
+                continue
+            if self.set_transaction(trans):
+                admitted.append(trans)
+        return admitted
 
     def existing_transaction(self, address):
         '''
             Find a transaction generated by the address in the transaction pool.
         '''
-        for trans in self.transaction_map.values():
-            if trans.input['address'] == address:
-                return trans
+        trans_ids = self.address_map.get(address)
+        if trans_ids:
+            return self.transaction_map[next(iter(trans_ids))]
 
-    def transaction_data(self):
+    def transaction_data(self, limit=None, max_bytes=None):
         '''
             Return the transaction of the transaction pool represented in their
             json serialized form.
+
+            With a limit on the number of transactions or on their total json
+            size in bytes, return a block template instead: the highest
+            priority transactions that fit, highest priority first.
         '''
-        return list(map(lambda t: t.to_json(), self.transaction_map.values()))
+        with self.lock:
+            if limit is None and max_bytes is None:
+                return list(map(lambda t: t.to_json(), self.transaction_map.values()))
+
+            # Max-heap of the priorities, built in linear time: only the
+            # transactions taken into the template are popped from it.
+            candidates = [
+                (-fee, -arrival, trans_id)
+                for trans_id, (fee, arrival) in self.priorities.items()
+            ]
+            heapq.heapify(candidates)
+            template = []
+            total_bytes = 0
+            while candidates:
+                if limit is not None and len(template) >= limit:
+                    break
+                if max_bytes is not None and total_bytes >= max_bytes:
+                    break
+                trans_id = heapq.heappop(candidates)[2]
+                size = self.sizes[trans_id]
+                if max_bytes is not None and total_bytes + size > max_bytes:
+                    continue
+                total_bytes += size
+                template.append(self.transaction_map[trans_id].to_json())
+            return template
 
     def clear_bc_transactions(self, blockchain):
         '''
             Delete blockchain-recorded transactions from the transaction pool.
         '''
+        self.clear_block_transactions(blockchain.chain)
 
-        for block in blockchain.chain:
-            for trans in block.data:
-                try:
-                    del self.transaction_map[trans['id']]
-                except KeyError:
-                    pass
+    def clear_block_transactions(self, blocks):
+        '''
+            Delete the transactions recorded in the given blocks from the
+            transaction pool. After a block is mined or appended, only that
+            block needs to be passed.
+        '''
+        with self.lock:
+            for block in blocks:
+                for trans in block.data:
+                    self.remove_transaction(trans['id'])
@@ -1,14 +1,25 @@
 import json
 import uuid
 
-from backend.config import STARTING_BALANCE
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.config import (
+    STARTING_BALANCE, VERIFY_WORKERS, PUBLIC_KEY_CACHE_SIZE)
 from backend.util.crypto_hash import utf8
+from backend.util.lru_cache import LRUCache
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives.asymmetric.utils import (
     encode_dss_signature, decode_dss_signature)
 from cryptography.hazmat.primitives import hashes as hs, serialization
-from cryptography.exceptions import InvalidSignature
+from cryptography.exceptions import InvalidSignature, UnsupportedAlgorithm
+
+# The cryptography backend releases the GIL while verifying, so a thread pool
+# spreads batches of signatures over the available cores.
+verify_executor = ThreadPoolExecutor(max_workers=VERIFY_WORKERS)
+
+# PEM public key -> loaded public key, shared by all verification paths.
+public_key_cache = LRUCache(PUBLIC_KEY_CACHE_SIZE)
 
 
 class Wallet:
@@ -88,17 +99,42 @@ class Wallet:
     def verify(public_key, data, signature):
         '''
             Verify a signature based on the original public key and data.
+            A malformed public key or signature does not verify.
         '''
-        deserialized_public_key = serialization.load_pem_public_key(
-            utf8(public_key), default_backend())
-        (r, s) = signature
         try:
+            deserialized_public_key = Wallet.load_public_key(public_key)
+            (r, s) = signature
             deserialized_public_key.verify(
                encode_dss_signature(r, s), utf8(json.dumps(data)), ec.ECDSA(hs.SHA256()))
             return True
-        except InvalidSignature:
+        except (InvalidSignature, UnsupportedAlgorithm, AttributeError,
+                TypeError, ValueError):
             return False
 
+    @staticmethod
+    def load_public_key(public_key):
+        '''
+            Deserialize a PEM public key, using the public_key_cache since the
+            same wallets appear over and over across the chain and the pool.
+        '''
+        deserialized_public_key = public_key_cache.get(public_key)
+        if deserialized_public_key is None:
+            deserialized_public_key = serialization.load_pem_public_key(
+                utf8(public_key), default_backend())
+            public_key_cache.put(public_key, deserialized_public_key)
+        return deserialized_public_key
+
+    @staticmethod
+    def verify_batch(items):
+        '''
+            Verify many signatures at once.
+            items - list of (public_key, data, signature) tuples.
+            Returns a list with the result of Wallet.verify for each item.
+        '''
+        if len(items) <= 1:
+            return [Wallet.verify(*item) for item in items]
+        return list(verify_executor.map(lambda item: Wallet.verify(*item), items))
+
     @staticmethod
     def calculate_balance(blockchain, address):
         '''
@@ -107,23 +143,15 @@ class Wallet:
 
             The balance is found by adding the output values that belong to
             the address since the most recent transaction by that address.
+            The blockchain keeps these balances in its ledger as blocks are
+            added, so this is a lookup rather than a scan of the chain.
         '''
-        balance = STARTING_BALANCE
         if not blockchain:
-            return balance
-
-        for block in blockchain.chain:
-            for trans in block.data:
-                if trans['input']['address'] == address:
-                    # Any time the address conducts a new transaction, it
-                    # resets its balance.
-                    balance = trans['output'][address]
-                elif address in trans['output']:
-                    # This is a check if the recipient of the transaction is the
-                    # address.
-                    balance += trans['output'][address]
-        return balance
+            return STARTING_BALANCE
 
+        # Rebuilds and reorganizations replace the ledger under the lock.
+        with blockchain.lock:
+            return blockchain.ledger.balance(address)
 
 def main():
     wallet = Wallet()